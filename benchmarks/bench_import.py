@@ -0,0 +1,94 @@
+'''
+BENCHMARK OF THE START-UP TIME OF HHSD
+
+Measures the time taken to import the modules needed at each stage of start-up (parsed from the output of
+'python -X importtime'), and the time until the splash screen of 'hhsd' is printed. The command line interface
+must not import the heavy dependencies of the analysis (pandas, scipy, Biopython, numpy), as these are only needed
+once the analysis starts. The script exits with status 1 if a heavy dependency is imported, or a time budget is
+exceeded, so it can be used to guard against regressions. Run from the root of the repository:
+
+    python benchmarks/bench_import.py [number of repeats]
+'''
+
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+REPOSITORY = Path(__file__).resolve().parents[1]
+
+# dependencies that are only needed by the analysis itself
+HEAVY_MODULES = ['pandas', 'scipy', 'Bio', 'numpy']
+
+# (label, imported module, budget in seconds, heavy dependencies allowed)
+IMPORT_STAGES = [
+    ("command line interface",  "hhsd.hhsd",            0.25,   False),
+    ("package (api on demand)", "hhsd",                 0.25,   False),
+    ("control file checks",     "hhsd.module_cf_ingest",1.0,    True),
+    ("full analysis",           "hhsd.module_api; import hhsd.module_HA, hhsd.module_bpp", 2.0, True),
+]
+
+SPLASH_BUDGET = 1.0
+
+
+def import_times(
+        statement:  str,
+        ) ->        Tuple[float, Dict[str, float]]:
+
+    '''
+    Run 'import <statement>' in a new interpreter, and get the total import time, and the cumulative import time of each module.
+    '''
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {statement}"], cwd=REPOSITORY, capture_output=True, text=True, check=True)
+
+    # lines have the format 'import time: self [us] | cumulative | imported package', with nesting shown by indentation
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            modules[match.group(4)] = int(match.group(2))/1e6
+            if len(match.group(3)) == 1:
+                total += int(match.group(2))/1e6
+
+    return total, modules
+
+def splash_time() -> float:
+
+    '''
+    Wall time until 'hhsd' without arguments prints the splash screen (including the check of the bpp executable).
+    '''
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import sys; sys.argv = ['hhsd']; from hhsd.hhsd import run; run()"], cwd=REPOSITORY, capture_output=True, text=True)
+
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failures: List[str] = []
+
+    print(f"\nbest of {repeats} runs\n")
+    print(f"{'':<28}{'import':>10}{'budget':>10}   heavy dependencies")
+    for label, statement, budget, heavy_allowed in IMPORT_STAGES:
+        runs = [import_times(statement) for _ in range(repeats)]
+        total, modules = min(runs, key=lambda run: run[0])
+        heavy = [name for name in HEAVY_MODULES if name in modules]
+        print(f"{label:<28}{total*1000:>7.0f} ms{budget*1000:>7.0f} ms   {', '.join(heavy) if heavy else '-'}")
+
+        if total > budget:
+            failures.append(f"importing '{statement}' took {total:.3f} s (budget {budget} s)")
+        if heavy and not heavy_allowed:
+            failures.append(f"importing '{statement}' imports {', '.join(heavy)}")
+
+    splash = min(splash_time() for _ in range(repeats))
+    print(f"{'splash screen (wall time)':<28}{splash*1000:>7.0f} ms{SPLASH_BUDGET*1000:>7.0f} ms")
+    if splash > SPLASH_BUDGET:
+        failures.append(f"the splash screen took {splash:.3f} s (budget {SPLASH_BUDGET} s)")
+
+    if len(failures) > 0:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
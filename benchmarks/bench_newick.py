@@ -0,0 +1,116 @@
+'''
+BENCHMARK OF READING AND WRITING NEWICK TREES
+
+Compares the fast newick parser of 'module_ete3' with the general (regex based) parser, and the direct
+extended newick writer used for 'bpp --simulate' with the previous approach of writing NHX data with ete3,
+and converting it to the bpp syntax with regular expressions. The outputs of both approaches are checked
+to be identical. Run from the root of the repository:
+
+    python benchmarks/bench_newick.py [number of leaves]
+
+With the default 1,000 leaves (mean of 20 runs, Python 3.11), parsing is about 1.7x faster, and writing about 2.2x
+faster. Both paths create the same nodes, so the parsing speedup is smaller since nodes store their features in the
+columnar store of the tree (it was about 2.3x, and writing about 2.5x, before).
+'''
+
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from hhsd.module_ete3 import Tree, TreeNode, compile_matchers, _read_newick_from_string
+from hhsd.module_gdi_simulate import tree_to_extended_newick
+
+
+def random_newick(
+        n_leaves:   int,
+        ) ->        str:
+
+    '''
+    Random topology with named leaves, internal nodes named by the name of their first leaf, and branch lengths.
+    '''
+
+    nodes = [f"S{i}:{random.random():.6f}" for i in range(n_leaves)]
+    while len(nodes) > 1:
+        i = random.randrange(len(nodes) - 1)
+        nodes[i:i+2] = [f"({nodes[i]},{nodes[i+1]})N{len(nodes)}:{random.random():.6f}"]
+
+    return nodes[0] + ";"
+
+def regex_parse(
+        newick: str,
+        format: int = 1,
+        ) ->    TreeNode:
+
+    root = TreeNode(); root._dist = 0.0
+    return _read_newick_from_string(newick, root, compile_matchers(formatcode=format), format, False)
+
+def regex_extended_newick(
+        tree:   Tree,
+        ) ->    str:
+
+    '''
+    Previous implementation of 'tree_to_extended_newick', using NHX output and regular expressions.
+    '''
+
+    root = tree.get_tree_root()
+    tree_str = tree.write(features = ['tau', 'theta'],format=1)
+    tree_str = re.sub(r':1\[&&NHX', '', tree_str)
+    tree_str = re.sub(f':theta=', ' #', tree_str)
+    tree_str = re.sub(f':tau=None', '', tree_str)
+    tree_str = re.sub(f':tau=', ' :', tree_str)
+    tree_str = re.sub(r'\]', '', tree_str)
+    tree_str = re.sub(r'\)', ') ', tree_str)
+    tree_str = re.sub(r'\(', ' (', tree_str)
+    tree_str = re.sub(';', f'{root.name} :{root.tau} #{root.theta};', tree_str)
+
+    return tree_str
+
+def simulation_tree(
+        n_leaves:   int,
+        ) ->        Tree:
+
+    '''
+    Tree with the tau and theta attributes of a simulation (leaves have no tau, and all branch lengths are 1).
+    '''
+
+    tree = Tree(random_newick(n_leaves), format=1)
+    for node in tree.traverse("postorder"):
+        node.dist = 1.0
+        node.add_features(
+            tau = None if node.is_leaf() else max([0.0] + [child.tau or 0.0 for child in node.children]) + random.random()/1000,
+            theta = random.random()/100,
+            )
+
+    return tree
+
+def report(
+        label:      str,
+        old_time:   float,
+        new_time:   float,
+        ) ->        None:
+
+    print(f"{label:<28}{old_time*1000:>10.2f} ms{new_time*1000:>10.2f} ms{old_time/new_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    n_leaves = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = 20
+    random.seed(1)
+
+    newick = random_newick(n_leaves)
+    sim_tree = simulation_tree(n_leaves)
+
+    # check that the fast paths give the same results
+    old_nodes = [(n.name, n.dist, n.support) for n in regex_parse(newick).traverse()]
+    new_nodes = [(n.name, n.dist, n.support) for n in Tree(newick, format=1).traverse()]
+    assert old_nodes == new_nodes, "parsers disagree"
+    assert regex_extended_newick(sim_tree) == tree_to_extended_newick(sim_tree), "extended newick writers disagree"
+
+    print(f"\n{n_leaves} leaves, mean of {repeats} runs\n")
+    print(f"{'':<28}{'regex':>13}{'fast':>13}{'speedup':>10}")
+    report("parse newick", timeit.timeit(lambda: regex_parse(newick), number=repeats)/repeats, timeit.timeit(lambda: Tree(newick, format=1), number=repeats)/repeats)
+    report("write extended newick", timeit.timeit(lambda: regex_extended_newick(sim_tree), number=repeats)/repeats, timeit.timeit(lambda: tree_to_extended_newick(sim_tree), number=repeats)/repeats)
@@ -0,0 +1,115 @@
+'''
+BENCHMARK OF THE STAGES OF THE ANALYSIS
+
+Runs the analyses of the bundled examples with a deterministic stand-in for bpp ('mock_bpp.py'), so the time spent
+in the Python side of the pipeline can be measured without running a real MCMC. Each analysis runs in a temporary
+copy of its example folder, with a short chain (the stand-in writes one row per sample, and the gene tree simulations
+need at least 1000 samples), and the time of each stage is read from the 'run_profile.json' of the analysis.
+The output of the stand-in only depends on the control file, so repeated runs make the same decisions, and their
+timings can be compared. Analyses of the empirical datasets estimate the gdi by gene tree simulation (1000 runs of
+'bpp --simulate' per population), and take a few minutes each. Run from the root of the repository:
+
+    python benchmarks/bench_pipeline.py [dataset ...] [--output timings.json]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+REPOSITORY = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPOSITORY))
+
+MOCK_BPP = Path(__file__).resolve().parent / "mock_bpp.py"
+
+# (name, example folder, control file)
+DATASETS = [
+    ("simulated_abcd",  "simulated_abcd",       "cf_sim_merge.txt"),
+    ("simulated_xabcd", "simulated_xabcd",      "simulated_merge_analysis.txt"),
+    ("giraffe",         "empirical_giraffe",    "cf_giraffe_merge.txt"),
+    ("milksnake",       "empirical_milksnake",  "cf_milksnake_merge.txt"),
+    ("sunfish",         "empirical_sunfish",    "cf_sunfish_merge.txt"),
+]
+
+# parameters of all analyses, overriding those of the control files
+PARAMETERS = {'seed':'1', 'burnin':'200', 'nsample':'1000', 'threads':'1'}
+
+# (label, stage in 'run_profile.json')
+STAGES = [
+    ("alignment parse",     "read control file/parse alignment"),
+    ("auto prior",          "bpp parameters/auto prior"),
+    ("write bpp files",     "iteration/write bpp files"),
+    ("bpp (stand-in)",      "iteration/bpp"),
+    ("mcmc parse",          "iteration/read bpp results"),
+    ("numerical gdi",       "iteration/gdi/numerical"),
+    ("simulated gdi",       "iteration/gdi/simulation"),
+]
+
+
+def run_dataset(
+        folder:         str,
+        control_file:   str,
+        work_dir:       Path,
+        ) ->            Dict[str, float]:
+
+    '''
+    Run the analysis of an example with the stand-in bpp, and get the total wall time of each stage (and of the analysis).
+    '''
+
+    from hhsd import AnalysisConfig, run_analysis
+
+    example_dir = work_dir / folder
+    shutil.copytree(REPOSITORY / "examples" / folder, example_dir)
+
+    start = time.perf_counter()
+    result = run_analysis(AnalysisConfig(
+        control_file=example_dir / control_file,
+        parameters=dict(PARAMETERS, output_directory="benchmark_output"),
+        log_file=work_dir / f"{folder}.log",
+        ))
+    wall = time.perf_counter() - start
+
+    with open(result.output_directory / "run_profile.json") as f:
+        summary = {total['stage']:total for total in json.load(f)['summary']}
+
+    timings = {label:summary[path]['wall'] if path in summary else 0.0 for label, path in STAGES}
+    timings['iterations'] = max(search.iterations for search in result.searches.values())
+    timings['total'] = wall
+
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time the stages of the analyses of the bundled examples, with a stand-in for bpp")
+    parser.add_argument("datasets", nargs="*", help=f"datasets to analyse (all by default): {', '.join(name for name, _, _ in DATASETS)}")
+    parser.add_argument("--output", help="write the timings to this json file")
+    args = parser.parse_args()
+    unknown = set(args.datasets) - set(name for name, _, _ in DATASETS)
+    if len(unknown) > 0:
+        parser.error(f"unknown datasets: {', '.join(sorted(unknown))}")
+
+    # the stand-in is used by all analyses started by this process
+    os.environ["HHSD_BPP"] = str(MOCK_BPP)
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, folder, control_file in DATASETS:
+            if len(args.datasets) > 0 and name not in args.datasets:
+                continue
+            print(f"running {name}...", flush=True)
+            results[name] = run_dataset(folder, control_file, Path(work_dir))
+
+    labels: List[str] = [label for label, _ in STAGES]
+    print("\nwall time of each stage [s], summed over all iterations\n")
+    print(f"{'':<18}{'iterations':>11}" + "".join(f"{label:>17}" for label in labels) + f"{'total':>10}")
+    for name, timings in results.items():
+        print(f"{name:<18}{timings['iterations']:>11}" + "".join(f"{timings[label]:>17.3f}" for label in labels) + f"{timings['total']:>10.2f}")
+
+    if args.output != None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
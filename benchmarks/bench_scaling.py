@@ -0,0 +1,146 @@
+'''
+BENCHMARK OF THE GROWTH OF THE STAGES OF THE ANALYSIS WITH THE SIZE OF THE DATA
+
+Generates synthetic datasets ('synthetic_data.py') of increasing size along one dimension at a time (populations,
+individuals per population, loci, and sites per locus), and times the Python stages of reading the data and of the
+first iteration of a merge analysis on each of them. The growth exponent of each stage along each dimension is the
+slope of the log-log fit of its time against the size of the data. The stages are expected to grow linearly with the
+size of the data, except for the automatic priors, which compare all pairs of sequences within each population, and
+across the first split of the guide tree. The script exits with status 1 if a stage grows faster than expected, so it
+can be used to catch super-linear behaviour in the tree and alignment code. Run from the root of the repository:
+
+    python benchmarks/bench_scaling.py [dimension ...] [--repeats 3]
+'''
+
+import argparse
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import astuple, replace
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from synthetic_data import DatasetScale, SyntheticDataset, generate_dataset
+
+# sizes along each dimension, and the size of the datasets along the other dimensions. The alignment is kept small
+# when varying the number of populations, so the tree code is timed on large trees
+DIMENSIONS = {
+    'populations':  ([32, 64, 128, 256],    DatasetScale(individuals=2, loci=2, sites=50, migration=2)),
+    'individuals':  ([2, 4, 8, 16],         DatasetScale(populations=8, loci=20, sites=200, migration=2)),
+    'loci':         ([10, 20, 40, 80],      DatasetScale(populations=8, individuals=4, sites=200, migration=2)),
+    'sites':        ([100, 200, 400, 800],  DatasetScale(populations=8, individuals=4, loci=20, migration=2)),
+}
+
+STAGES = ["parse alignment", "check control file", "auto prior", "initialise tree", "proposal", "write bpp files", "read bpp results"]
+
+# expected growth exponents different from linear
+EXPECTED_EXPONENT = {
+    ('populations', 'auto prior'):  2,  # all pairs of sequences across the first split of the guide tree
+    ('individuals', 'auto prior'):  2,  # all pairs of sequences within populations, and across the first split
+}
+
+# exponents are only checked for stages that take long enough to be timed reliably
+MIN_TIME = 0.05
+TOLERANCE = 0.4
+
+
+def copy_dataset(
+        dataset:    SyntheticDataset,
+        directory:  Path,
+        ) ->        SyntheticDataset:
+
+    '''
+    Copy of the dataset in a new folder. The alignment is cached by its path during an analysis, so each copy is read again.
+    '''
+
+    shutil.copytree(dataset.control_file.parent, directory)
+
+    return SyntheticDataset(*[directory / path.relative_to(dataset.control_file.parent) if isinstance(path, Path) else path for path in astuple(dataset)])
+
+def time_stages(
+        dataset:    SyntheticDataset,
+        ) ->        Dict[str, float]:
+
+    '''
+    Time the stages of reading the dataset, and of the first iteration of a merge analysis (in the folder 'Iteration_1'
+    of the dataset), with the bpp outputs of the dataset.
+    '''
+
+    from hhsd.module_cf_ingest import ingest_cf
+    from hhsd.module_bpp import bppctl_init
+    from hhsd.module_msa_imap import alignfile_to_MSA, imapfile_read
+    from hhsd.module_tree import init_tree
+    from hhsd.module_HA import set_starting_state, set_tree_proposal_attributes, proposal_setup_files
+    from hhsd.module_bpp_readres import MSCNumericParamEstimates
+
+    work_dir = dataset.control_file.parent / "Iteration_1"
+    work_dir.mkdir()
+
+    timings = {}
+    def timed(name: str, function: Callable, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        timings[name] = time.perf_counter() - start
+        return result
+
+    # the screen output of the stages is discarded
+    with contextlib.redirect_stdout(io.StringIO()):
+        timed("parse alignment", alignfile_to_MSA, str(dataset.seqfile))
+        cf = timed("check control file", ingest_cf, dataset.control_file, None, dataset.control_file.parent)
+        bpp_ctl = timed("auto prior", bppctl_init, cf)
+        tree = timed("initialise tree", lambda: set_starting_state(init_tree(cf['guide_tree'], imapfile_read(cf['Imapfile'], "popind")), "merge"))
+        timed("proposal", set_tree_proposal_attributes, tree, "merge")
+        timed("write bpp files", proposal_setup_files, tree, bpp_ctl, "merge", cf['migration'], str(work_dir))
+        timed("read bpp results", MSCNumericParamEstimates, str(dataset.bpp_dir / "hhsd_job.txt"), str(dataset.bpp_dir / "hhsd_job.mcmc.txt"), str(work_dir))
+
+    return timings
+
+def growth_exponent(
+        sizes:  List[int],
+        times:  List[float],
+        ) ->    float:
+
+    return float(np.polyfit(np.log(sizes), np.log(np.maximum(times, 1e-6)), 1)[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time the growth of the stages of the analysis with the size of synthetic datasets")
+    parser.add_argument("dimensions", nargs="*", help=f"dimensions to vary (all by default): {', '.join(DIMENSIONS)}")
+    parser.add_argument("--repeats", type=int, default=3, help="the best of this many runs is used for each dataset (default 3)")
+    args = parser.parse_args()
+    dimensions = args.dimensions if len(args.dimensions) > 0 else list(DIMENSIONS)
+    repeats = args.repeats
+    failures: List[str] = []
+
+    for dimension in dimensions:
+        sizes, base_scale = DIMENSIONS[dimension]
+        results: List[Dict[str, float]] = []
+        with tempfile.TemporaryDirectory() as work_dir:
+            # the first dataset is also analysed once before the others, as the first analysis imports the modules
+            for label, size in [("warmup", sizes[0])] + [(str(size), size) for size in sizes]:
+                dataset = generate_dataset(Path(work_dir) / label, replace(base_scale, **{dimension:size}))
+                runs = [time_stages(copy_dataset(dataset, Path(work_dir) / f"{label}_{repeat}")) for repeat in range(1 if label == "warmup" else repeats)]
+                if label != "warmup":
+                    results.append({stage:min(run[stage] for run in runs) for stage in STAGES})
+
+        print(f"\n< {dimension} >\n")
+        print(f"{'stage':<22}" + "".join(f"{size:>10}" for size in sizes) + f"{'exponent':>11}{'expected':>10}")
+        for stage in STAGES:
+            times = [timings[stage] for timings in results]
+            exponent = growth_exponent(sizes, times)
+            expected = EXPECTED_EXPONENT.get((dimension, stage), 1)
+            print(f"{stage:<22}" + "".join(f"{t:>10.3f}" for t in times) + f"{exponent:>11.2f}{expected:>10}")
+
+            if max(times) >= MIN_TIME and exponent > expected + TOLERANCE:
+                failures.append(f"'{stage}' grows with the number of {dimension} with exponent {exponent:.2f} (expected {expected})")
+
+    if len(failures) > 0:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
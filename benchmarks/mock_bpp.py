@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+'''
+DETERMINISTIC STAND-IN FOR THE BPP EXECUTABLE
+
+Implements the parts of the command line interface of bpp used by hhsd, so the Python side of the pipeline can be
+run (and timed) without running a real MCMC. Select it by setting the 'HHSD_BPP' environment variable to the path
+of this file.
+
+    bpp --cfile ctl.ctl     prints progress lines, and writes the output file ('jobname.txt') with the table of
+                            node indices, and the mcmc file ('jobname.mcmc.txt') with 'nsample' samples of the theta,
+                            tau and migration rate parameters. Theta and W values are drawn around the means of their
+                            priors, and tau values increase from the tips to the root, so every sample is a valid tree.
+    bpp --simulate ctl.ctl  simulates 'loci&length' gene trees under the multispecies coalescent, with the tau and theta
+                            values of the extended newick tree, and writes them to 'treefile' (and the map of the
+                            simulated sequences to 'Imapfile'). Migration events are accepted, but not simulated.
+    bpp --help              prints the version.
+
+The output only depends on the control file (ignoring the number of threads), so repeated runs are identical.
+'''
+
+import math
+import random
+import re
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+VERSION = "mock bpp 1.0 (stand-in for the benchmarks of hhsd)"
+
+# theta and tau values used if the control file does not specify a prior, or the value of a node is missing
+DEFAULT_THETA = 0.01
+DEFAULT_TAU = 0.005
+
+Node = Tuple[str, List[int], Optional[float], Optional[float]] # name, indices of children, tau, theta
+
+
+## READING THE CONTROL FILE
+
+def read_control_file(
+        path:   str,
+        ) ->    Dict:
+
+    '''
+    Read the 'parameter = value' rows of a bpp control file. The two rows following 'species&tree' are stored as
+    'popsizes' and 'newick', and the rows following 'migration' as a list of [source, destination, (rate)].
+    '''
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    ctl = {'migration':[]}
+    i = 0
+    while i < len(lines):
+        line = lines[i].split("*")[0]
+        if "=" in line:
+            param, value = [part.strip() for part in line.split("=", 1)]
+            ctl[param] = value
+            if param == "species&tree":
+                ctl['popsizes'] = lines[i+1].strip()
+                ctl['newick'] = lines[i+2].strip()
+                i += 2
+            elif param == "migration":
+                ctl['migration'] = [lines[i+1+j].split() for j in range(int(value))]
+                i += int(value)
+        i += 1
+
+    return ctl
+
+def parse_value(
+        text:   str,
+        ) ->    Optional[float]:
+
+    try:
+        return float(text)
+    except ValueError: # e.g. 'None'
+        return None
+
+def parse_newick(
+        newick: str,
+        ) ->    List[Node]:
+
+    '''
+    Parse a newick tree with named inner nodes, optionally with the tau (':0.005') and theta ('#0.01') values of each
+    node in the extended syntax of bpp. The nodes are returned in postorder, so the root is the last node.
+    '''
+
+    newick = newick.strip().rstrip(";")
+    nodes: List[Node] = []
+    label = re.compile(r"\s*([^\s,():;#]*)\s*((?:[:#]\s*[^\s,():;#]+\s*)*)")
+    position = 0
+
+    def skip_whitespace() -> None:
+        nonlocal position
+        while newick[position].isspace():
+            position += 1
+
+    def parse_node() -> int:
+        nonlocal position
+        children = []
+        skip_whitespace()
+        if newick[position] == "(":
+            while newick[position] in "(,":
+                position += 1
+                children.append(parse_node())
+                skip_whitespace()
+            position += 1 # closing bracket
+        match = label.match(newick, position)
+        position = match.end()
+        values = dict(re.findall(r"([:#])\s*([^\s,():;#]+)", match.group(2)))
+        nodes.append((match.group(1), children, parse_value(values.get(":", "")), parse_value(values.get("#", ""))))
+        return len(nodes) - 1
+
+    parse_node()
+
+    return nodes
+
+def prior_mean(
+        prior:      Optional[str],
+        default:    float,
+        ) ->        float:
+
+    '''
+    Mean of a prior given as 'invgamma a b' (b/(a-1)), or 'gamma a b' (a/b).
+    '''
+
+    if prior == None:
+        return default
+    parts = prior.split()
+    if parts[0] == "invgamma":
+        return float(parts[2])/(float(parts[1]) - 1)
+    if parts[0] == "gamma":
+        return float(parts[1])/float(parts[2])
+
+    return float(parts[0])/float(parts[1]) # 'wprior = a b' is a gamma prior without the name
+
+
+def job_random(
+        ctl:    Dict,
+        ) ->    random.Random:
+
+    '''
+    Random number generator seeded by the parameters that determine the output of the job.
+    '''
+
+    migration = ";".join(" ".join(row) for row in ctl['migration'])
+
+    return random.Random(f"{ctl.get('seed', '1')}|{ctl['newick']}|{migration}|{ctl.get('nsample', '')}")
+
+
+## bpp --cfile
+
+def node_order(
+        species:    List[str],
+        nodes:      List[Node],
+        ) ->        List[int]:
+
+    '''
+    bpp numbers the tips in the order of 'species&tree', followed by the root and the other inner nodes in preorder.
+    '''
+
+    by_name = {node[0]:i for i, node in enumerate(nodes)}
+    preorder = []
+    stack = [len(nodes) - 1]
+    while stack:
+        i = stack.pop()
+        if len(nodes[i][1]) > 0:
+            preorder.append(i)
+            stack.extend(reversed(nodes[i][1]))
+
+    return [by_name[name] for name in species] + preorder
+
+def sample_taus(
+        nodes:      List[Node],
+        tau_mean:   float,
+        rnd:        random.Random,
+        ) ->        List[float]:
+
+    '''
+    Tau of each inner node (0 for the tips), with each node older than its descendants, and the root around 'tau_mean'.
+    '''
+
+    heights = []
+    for name, children, _, _ in nodes:
+        heights.append(0 if len(children) == 0 else 1 + max(heights[child] for child in children))
+    step = tau_mean/max(heights[-1], 1)
+
+    taus = []
+    for name, children, _, _ in nodes:
+        taus.append(0.0 if len(children) == 0 else max(taus[child] for child in children) + step*rnd.uniform(0.7, 1.3))
+
+    return taus
+
+def run_cfile(
+        path:   str,
+        ) ->    None: # writes the output and mcmc files
+
+    ctl = read_control_file(path)
+    rnd = job_random(ctl)
+    species = ctl['species&tree'].split()[1:]
+    nodes = parse_newick(ctl['newick'])
+    order = node_order(species, nodes)
+    index = {i:n+1 for n, i in enumerate(order)}
+    inner = [i for i in order if len(nodes[i][1]) > 0]
+    theta_mean = prior_mean(ctl.get('thetaprior'), DEFAULT_THETA)
+    tau_mean = prior_mean(ctl.get('tauprior'), DEFAULT_TAU)
+    w_mean = prior_mean(ctl.get('wprior'), 1.0) if len(ctl['migration']) > 0 else None
+    nsample = int(ctl['nsample'])
+
+    # bpp drops the population names from the column names if there are 10 or more species
+    def column(param: str, i: int) -> str:
+        return f"{param}:{index[i]}:{nodes[i][0]}" if len(species) < 10 else f"{param}:{index[i]}"
+
+    columns = ["Gen"] + [column("theta", i) for i in order] + [column("tau", i) for i in inner]
+    columns += [f"W:{k+1}:{row[0]}->{row[1]}" for k, row in enumerate(ctl['migration'])] + ["lnL"]
+
+    # progress is printed as bpp does, with negative percentages during the burnin
+    start = time.time()
+    for percent in range(-100, 101, 5):
+        elapsed = int(time.time() - start)
+        print(f" {percent:3d}%  0.30 0.33 0.25  {theta_mean:.4f} {tau_mean:.4f}  -{12000 + rnd.random():.5f}  {elapsed//60}:{elapsed%60:02d}", flush=True)
+
+    with open(f"{ctl['jobname']}.mcmc.txt", "w") as f:
+        f.write("\t".join(columns) + "\n")
+        sums = [0.0]*(len(columns) - 2)
+        for generation in range(nsample):
+            taus = sample_taus(nodes, tau_mean, rnd)
+            values = [theta_mean*rnd.lognormvariate(0, 0.2) for _ in order] + [taus[i] for i in inner]
+            values += [w_mean*rnd.lognormvariate(0, 0.3) for _ in ctl['migration']]
+            sums = [total + value for total, value in zip(sums, values)]
+            f.write("\t".join([str((generation + 1)*int(ctl.get('sampfreq', 1)))] + [f"{value:.6f}" for value in values] + [f"{-12000 - rnd.random():.3f}"]) + "\n")
+
+    with open(f"{ctl['jobname']}.txt", "w") as f:
+        f.write(f"{VERSION}\n\nMap of populations to nodes of the species tree:\n\n")
+        f.write("Node-Index  Node-Type  Node-Label\n---------------------------------\n")
+        for i in order:
+            f.write(f"{index[i]:<12}{'Tip' if len(nodes[i][1]) == 0 else 'Inner':<11}{nodes[i][0]}\n")
+        f.write(f"\n{'param':>16}{'mean':>12}\n")
+        for name, total in zip(columns[1:-1], sums):
+            f.write(f"{name:>16}{total/nsample:>12.6f}\n")
+
+
+## bpp --simulate
+
+def coalesce(
+        lineages:   List[Tuple[str, float]],
+        theta:      float,
+        start:      float,
+        end:        float,
+        rnd:        random.Random,
+        ) ->        List[Tuple[str, float]]:
+
+    '''
+    Coalesce the lineages (subtrees as newick strings, with the time of their root) entering a population at time
+    'start', until the population ends at time 'end'. Each pair of lineages coalesces at rate 2/theta.
+    '''
+
+    now = start
+    while len(lineages) > 1:
+        k = len(lineages)
+        now += rnd.expovariate(k*(k - 1)/theta)
+        if now >= end:
+            break
+        first, second = sorted(rnd.sample(range(k), 2))
+        (left, left_time), (right, right_time) = lineages[first], lineages[second]
+        del lineages[second], lineages[first]
+        lineages.append((f"({left}:{now - left_time:.10f},{right}:{now - right_time:.10f})", now))
+
+    return lineages
+
+def simulate_genetree(
+        nodes:      List[Node],
+        samples:    Dict[str, List[str]],
+        rnd:        random.Random,
+        ) ->        str:
+
+    # each population starts at its own tau (0 for the tips), and ends at the tau of its parent
+    parents = {child:i for i, node in enumerate(nodes) for child in node[1]}
+    lineages: List[List[Tuple[str, float]]] = []
+    for i, (name, children, tau, theta) in enumerate(nodes):
+        start = 0.0 if len(children) == 0 else (tau if tau != None else DEFAULT_TAU)
+        end = math.inf if i not in parents else (nodes[parents[i]][2] if nodes[parents[i]][2] != None else DEFAULT_TAU)
+        entering = [(sequence, 0.0) for sequence in samples.get(name, [])]
+        for child in children:
+            entering += lineages[child]
+        lineages.append(coalesce(entering, theta or DEFAULT_THETA, start, end, rnd))
+
+    return lineages[-1][0][0] + ";"
+
+def run_simulate(
+        path:   str,
+        ) ->    None: # writes the gene trees and the map of sequences to populations
+
+    ctl = read_control_file(path)
+    rnd = job_random(ctl)
+    species = ctl['species&tree'].split()[1:]
+    popsizes = [int(size) for size in ctl['popsizes'].split()]
+    nodes = parse_newick(ctl['newick'])
+    n_loci = int(ctl['loci&length'].split()[0])
+
+    samples = {name:[f"{name}^{name.lower()}{j+1}" for j in range(size)] for name, size in zip(species, popsizes)}
+
+    print(f"{VERSION}\nsimulating {n_loci} gene trees", flush=True)
+    with open(ctl['treefile'], "w") as f:
+        f.write("".join(simulate_genetree(nodes, samples, rnd) + "\n" for _ in range(n_loci)))
+    with open(ctl['Imapfile'], "w") as f:
+        f.write("".join(f"{name.lower()}{j+1}\t{name}\n" for name, size in zip(species, popsizes) for j in range(size)))
+
+
+if __name__ == "__main__":
+    # errors are reported as bpp does, so hhsd stops the analysis
+    try:
+        if len(sys.argv) < 2 or sys.argv[1] == "--help":
+            print(VERSION)
+        elif sys.argv[1] == "--cfile":
+            run_cfile(sys.argv[2])
+        elif sys.argv[1] == "--simulate":
+            run_simulate(sys.argv[2])
+        else:
+            raise ValueError(f"unknown option {sys.argv[1]}")
+    except Exception as e:
+        print(f"[ERROR] {type(e).__name__}: {e}", flush=True)
+        sys.exit(1)
@@ -0,0 +1,297 @@
+'''
+SYNTHETIC DATASETS OF CONFIGURABLE SIZE
+
+Generates the input files of an analysis (alignment, Imap file, and control file with a guide tree and migration
+events), and the outputs of bpp for the starting proposal of a merge analysis of the guide tree, at any number of
+populations, individuals, loci, sites and migration events. The bundled examples only cover a handful of populations
+and a few MB of alignment, so these datasets are used to measure how the time of each stage grows with the size of
+the data (see 'bench_scaling.py').
+
+The sequences evolve along the guide tree: each branch changes a fraction of the sites of its parent, and each
+individual a smaller fraction of the sites of its population, with a few gaps. The bpp outputs are written by the
+stand-in for bpp ('mock_bpp.py'), so they have the same format as the outputs read during an analysis.
+Generate a dataset from the command line with:
+
+    python benchmarks/synthetic_data.py output_folder [--populations 8] [--individuals 4] [--loci 50] [--sites 500] [--migration 2]
+'''
+
+import argparse
+import random
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from hhsd.module_tree import add_inner_node_names_to_newick
+
+MOCK_BPP = Path(__file__).resolve().parent / "mock_bpp.py"
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+GAP = ord("-")
+
+# fraction of sites changed along each branch of the guide tree, in each individual, and replaced by gaps
+BRANCH_DIVERGENCE = 0.01
+INDIVIDUAL_DIVERGENCE = 0.004
+GAP_FRACTION = 0.002
+
+# a guide tree is a population name, or a pair of subtrees
+GuideTree = Union[str, Tuple["GuideTree", "GuideTree"]]
+
+
+@dataclass
+class DatasetScale:
+    '''
+    Size of a synthetic dataset.
+    '''
+
+    populations:    int = 8
+    individuals:    int = 4     # per population, each with one sequence at each locus
+    loci:           int = 50
+    sites:          int = 500   # per locus
+    migration:      int = 0     # migration events between pairs of populations
+    nsample:        int = 1000  # samples of the bpp mcmc file
+    seed:           int = 1
+
+@dataclass
+class SyntheticDataset:
+    '''
+    Paths of the files of a synthetic dataset.
+    '''
+
+    control_file:   Path
+    seqfile:        Path
+    Imapfile:       Path
+    guide_tree:     str
+    bpp_dir:        Path    # folder with the bpp control file, output file and mcmc file of the starting proposal
+
+
+## GUIDE TREE AND MIGRATION EVENTS
+
+def join_random_pairs(
+        subtrees:   List[GuideTree],
+        rnd:        random.Random,
+        ) ->        GuideTree:
+
+    '''
+    Random binary topology, built by joining random pairs of subtrees.
+    '''
+
+    subtrees = list(subtrees)
+    while len(subtrees) > 1:
+        first, second = sorted(rnd.sample(range(len(subtrees)), 2))
+        pair = (subtrees[first], subtrees[second])
+        del subtrees[second], subtrees[first]
+        subtrees.append(pair)
+
+    return subtrees[0]
+
+def random_guide_tree(
+        populations:    List[str],
+        rnd:            random.Random,
+        ) ->            GuideTree:
+
+    '''
+    Random topology in which the root splits the populations into two halves, so the work of comparing the sequences
+    on either side of the first split (for the tau prior) is the same fraction of the dataset at every size.
+    '''
+
+    if len(populations) < 4:
+        return join_random_pairs(populations, rnd)
+
+    half = len(populations)//2
+
+    return (join_random_pairs(populations[:half], rnd), join_random_pairs(populations[half:], rnd))
+
+def to_newick(
+        tree:   GuideTree,
+        ) ->    str:
+
+    if isinstance(tree, str):
+        return tree
+
+    return f"({to_newick(tree[0])},{to_newick(tree[1])})"
+
+def random_migration_events(
+        populations:    List[str],
+        n_events:       int,
+        rnd:            random.Random,
+        ) ->            List[Tuple[str, str]]:
+
+    '''
+    Migration events between distinct pairs of populations of the guide tree (which all exist at the same time).
+    '''
+
+    pairs = [(source, destination) for source in populations for destination in populations if source != destination]
+
+    return rnd.sample(pairs, min(n_events, len(pairs)))
+
+
+## ALIGNMENT
+
+def mutate(
+        sequence:   np.ndarray,
+        fraction:   float,
+        rng:        np.random.Generator,
+        ) ->        np.ndarray:
+
+    '''
+    Copy of the sequence (as ascii codes), with the given fraction of the sites replaced by a random base.
+    '''
+
+    mutated = sequence.copy()
+    sites = rng.random(len(sequence)) < fraction
+    mutated[sites] = BASES[rng.integers(0, 4, int(sites.sum()))]
+
+    return mutated
+
+def population_sequences(
+        tree:       GuideTree,
+        sequence:   np.ndarray,
+        rng:        np.random.Generator,
+        ) ->        Dict[str, np.ndarray]:
+
+    '''
+    Evolve the sequence of the root of 'tree' along its branches, and get the sequence of each population.
+    '''
+
+    sequence = mutate(sequence, BRANCH_DIVERGENCE, rng)
+    if isinstance(tree, str):
+        return {tree:sequence}
+
+    return {**population_sequences(tree[0], sequence, rng), **population_sequences(tree[1], sequence, rng)}
+
+def write_alignment(
+        path:           Path,
+        tree:           GuideTree,
+        individuals:    Dict[str, List[str]],
+        scale:          DatasetScale,
+        rng:            np.random.Generator,
+        ) ->            None: # writes the alignment in the phylip format used by bpp
+
+    n_sequences = sum(len(names) for names in individuals.values())
+    name_width = max(len(name) for names in individuals.values() for name in names) + 3
+
+    with open(path, "wb") as f:
+        for _ in range(scale.loci):
+            root = BASES[rng.integers(0, 4, scale.sites)]
+            block = [f"{n_sequences} {scale.sites}\n\n".encode()]
+            for population, sequence in population_sequences(tree, root, rng).items():
+                for name in individuals[population]:
+                    row = mutate(sequence, INDIVIDUAL_DIVERGENCE, rng)
+                    row[rng.random(scale.sites) < GAP_FRACTION] = GAP
+                    block.append(f"^{name}".ljust(name_width).encode() + row.tobytes() + b"\n")
+            block.append(b"\n")
+            f.write(b"".join(block))
+
+
+## BPP OUTPUTS
+
+def write_bpp_outputs(
+        bpp_dir:        Path,
+        newick:         str,
+        populations:    List[str],
+        individuals:    int,
+        migration:      List[Tuple[str, str]],
+        scale:          DatasetScale,
+        ) ->            None: # writes the bpp control file, and the outputs of the stand-in for bpp
+
+    '''
+    Write the bpp control file of the starting proposal of a merge analysis (all populations of the guide tree are
+    species), and run the stand-in for bpp on it.
+    '''
+
+    bpp_dir.mkdir(parents=True, exist_ok=True)
+    rows = [
+        f"seed={scale.seed}",
+        "jobname=hhsd_job",
+        f"species&tree={len(populations)} {' '.join(populations)}",
+        f"               {' '.join([str(individuals)]*len(populations))}",
+        f"               {add_inner_node_names_to_newick(newick)}",
+        "thetaprior=invgamma 3 0.02",
+        "tauprior=invgamma 3 0.04",
+        f"nsample={scale.nsample}",
+        ]
+    if len(migration) > 0:
+        rows += ["wprior=10 1", f"migration = {len(migration)}"] + [f"\t{source} {destination}" for source, destination in migration]
+    with open(bpp_dir / "proposed_ctl.ctl", "w") as f:
+        f.write("\n".join(rows) + "\n")
+
+    # bpp writes its outputs to the working directory
+    subprocess.run([sys.executable, str(MOCK_BPP), "--cfile", "proposed_ctl.ctl"], cwd=bpp_dir, stdout=subprocess.DEVNULL, check=True)
+
+
+## FINAL WRAPPER FUNCTION
+
+def generate_dataset(
+        directory:  Union[str, Path],
+        scale:      DatasetScale,
+        ) ->        SyntheticDataset:
+
+    '''
+    Write the alignment, Imap file, control file and bpp outputs of a synthetic dataset of the given size to 'directory'.
+    The dataset only depends on 'scale' (including the seed).
+    '''
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rnd = random.Random(scale.seed)
+    rng = np.random.default_rng(scale.seed)
+
+    populations = [f"P{i+1}" for i in range(scale.populations)]
+    individuals = {population:[f"{population}_{j+1}" for j in range(scale.individuals)] for population in populations}
+    tree = random_guide_tree(populations, rnd)
+    newick = to_newick(tree) + ";"
+    migration = random_migration_events(populations, scale.migration, rnd)
+
+    write_alignment(directory / "alignment.txt", tree, individuals, scale, rng)
+
+    with open(directory / "imap.txt", "w") as f:
+        f.write("".join(f"{name}\t{population}\n" for population, names in individuals.items() for name in names))
+
+    rows = [
+        f"# synthetic dataset of {scale.populations} populations, {scale.individuals} individuals per population, "
+        f"{scale.loci} loci of {scale.sites} sites, and {len(migration)} migration events",
+        "output_directory = results",
+        "Imapfile = imap.txt",
+        "seqfile = alignment.txt",
+        f"guide_tree = {newick}",
+        "mode = merge",
+        "gdi_threshold = <=0.3, <=1.0",
+        f"seed = {scale.seed}",
+        "threads = 1",
+        "burnin = 200",
+        f"nsample = {scale.nsample}",
+        ]
+    if len(migration) > 0:
+        rows += ["migration = {" + ", ".join(f"{source} -> {destination}" for source, destination in migration) + "}", "wprior = 10 1"]
+    with open(directory / "ctl.txt", "w") as f:
+        f.write("\n".join(rows) + "\n")
+
+    write_bpp_outputs(directory / "bpp", newick, populations, scale.individuals, migration, scale)
+
+    return SyntheticDataset(directory / "ctl.txt", directory / "alignment.txt", directory / "imap.txt", newick, directory / "bpp")
+
+
+if __name__ == "__main__":
+    defaults = DatasetScale()
+    parser = argparse.ArgumentParser(description="generate a synthetic dataset for hhsd, with the outputs of bpp for its starting proposal")
+    parser.add_argument("directory", help="folder where the files are written")
+    for parameter, help in [
+            ("populations", "populations in the guide tree"),
+            ("individuals", "individuals per population"),
+            ("loci",        "loci in the alignment"),
+            ("sites",       "sites per locus"),
+            ("migration",   "migration events"),
+            ("nsample",     "samples in the bpp mcmc file"),
+            ("seed",        "seed of the random number generators"),
+            ]:
+        parser.add_argument(f"--{parameter}", type=int, default=getattr(defaults, parameter), help=f"{help} (default {getattr(defaults, parameter)})")
+    args = parser.parse_args()
+
+    dataset = generate_dataset(args.directory, DatasetScale(**{parameter:value for parameter, value in vars(args).items() if parameter != "directory"}))
+    print(f"control file written to {dataset.control_file}")
@@ -0,0 +1,16 @@
+from .module_exceptions import HhsdError
+
+# the analysis api is imported on first use, so that the command line interface (which imports the package)
+# can print its splash screen and report argument errors without loading the modules of the analysis
+_API_NAMES = ['AnalysisConfig', 'AnalysisResult', 'SearchResult', 'run_analysis']
+
+def __getattr__(name):
+    if name not in _API_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from . import module_api
+
+    return getattr(module_api, name)
+
+def __dir__():
+    return sorted(list(globals()) + _API_NAMES)
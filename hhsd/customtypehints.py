@@ -2,7 +2,6 @@
 CUSTOM CLASSES FOR TYPE HINTS
 '''
 
-import pandas as pd
 from typing import NewType, TypeVar, Literal, List
 
 
@@ -42,25 +41,23 @@ class BppMCMCfile(str):
     '''
     pass
 
-class MCMCResults(pd.DataFrame):
-    '''
-    Dataframe containing the MCMC chain for the tau, theta, and possibly M parameters for each node in the MSC model
-    '''
-    pass
+# alias classes of pandas dataframes. These are created when they are first imported, 
+# so that modules which do not work with dataframes can use the type hints without importing pandas
+_DATAFRAME_ALIASES = {
+    'MCMCResults':      "Dataframe containing the MCMC chain for the tau, theta, and possibly M parameters for each node in the MSC model",
+    'MigrationPattern': "Dataframe containing 'source' and 'destination' columns for migration events.",
+    'MigrationRates':   "Dataframe containing 'source', 'destination', and 'M' (migration rate) columns for migration events.",
+}
 
+def __getattr__(name):
+    if name not in _DATAFRAME_ALIASES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
+    import pandas as pd
+    alias = type(name, (pd.DataFrame,), {'__doc__':_DATAFRAME_ALIASES[name], '__module__':__name__})
+    globals()[name] = alias
 
-class MigrationPattern(pd.DataFrame):
-    '''
-    Dataframe containing 'source' and 'destination' columns for migration events.
-    '''
-    pass
-
-class MigrationRates(pd.DataFrame):
-    '''
-    Dataframe containing 'source', 'destination', and 'M' (migration rate) columns for migration events.
-    '''
-    pass
+    return alias
 
 class NodeName(str):
     '''
@@ -5,55 +5,62 @@ MAIN HHSD SCRIPT
 from sys import argv
 import sys
 
-from .customtypehints import CfileParam, BppCfileParam, Cfile
-from .module_HA import HA_iteration, check_contintue, set_starting_state
-from .module_bpp import bppctl_init
-from .module_tree import init_tree
-from .module_cmdline import cmdline_init
-from .module_msa_imap import imapfile_read
-from .module_cf_ingest import ingest_cf
-from .module_helper import output_directory
+from .customtypehints import Cfile
+from .module_cmdline import cmdline_init, batch_cmdline_init
+from .module_exceptions import HhsdError
+
+# the modules of the analysis (and their dependencies, e.g. pandas and scipy) are imported only when they are needed,
+# so the splash screen and errors in the command line arguments are shown without delay
 
 
-# main wrapper function implementing pipeline functions
 def hhsd(
         cf_path: Cfile,
         cf_override
         ):
 
-    # read control file
-    cf:CfileParam = ingest_cf(cf_path, cf_override)
+    from .module_api import AnalysisConfig, run_analysis
 
-    # set up the output directory
-    output_directory(cf['output_directory'])
+    try:
+        run_analysis(AnalysisConfig(control_file=cf_path, parameters=cf_override))
+    except HhsdError as e:
+        sys.exit(str(e))
 
-    # intialise bpp control file 
-    bpp_ctl:BppCfileParam = bppctl_init(cf)
+    sys.exit("Quitting hhsd")
 
-    # read in essential data
-    imap = imapfile_read(imap_filename=cf['Imapfile'], output_type="popind")
-    newick = cf['guide_tree']
 
-    # initailise tree
-    tree = init_tree(newick, imap)
+def validate(
+        jobs,
+        ):
 
-    # set up the starting proposal
-    tree = set_starting_state(tree, cf['mode'])
+    from .module_validate import validate_analyses
 
-    # run iterative algorithm
-    while True:
-        
-        tree = HA_iteration(tree, bpp_ctl, cf)
-        
-        if check_contintue(tree, cf):
-            continue
-        else:
-            sys.exit("Quitting hhsd")
+    reports = validate_analyses(jobs)
+    if not all(report.valid for report in reports):
+        sys.exit("Validation failed")
 
 
 """
 MAIN ENTRY POINT FOR RUNNING HHSD FROM THE TERMINAL
 """
 def run():
-    cf_path, cf_override = cmdline_init(argv)
-    hhsd(cf_path, cf_override)
\ No newline at end of file
+    try:
+        batch_arguments = batch_cmdline_init(argv)
+        if batch_arguments != None and "--validate" in argv:
+            from .module_batch import read_manifest
+            validate(read_manifest(batch_arguments['manifest']))
+            return
+        if batch_arguments != None:
+            from .module_batch import run_batch
+            run_batch(**batch_arguments)
+            sys.exit("Quitting hhsd")
+
+        cf_path, cf_override = cmdline_init(argv)
+    except HhsdError as e:
+        sys.exit(str(e))
+
+    # check the analysis without running it
+    if "--validate" in argv:
+        validate([{'cf_path':cf_path, 'cf_override':cf_override}])
+        return
+
+    hhsd(cf_path, cf_override)
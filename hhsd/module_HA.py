@@ -2,18 +2,20 @@
 EXECUTE A GIVEN ITERATION OF THE ITERATIVE DELIMITATION ALGORITHM
 '''
 
-import copy
 import os
 
 from .customtypehints import AlgoMode, CfileParam, BppCfileParam, MigrationPattern
 from .module_ete3 import Tree
 from .module_msa_imap import auto_pop_param, imapfile_write
 from .module_helper import dict_merge
-from .module_tree import get_attribute_filtered_imap, get_attribute_filtered_tree, get_current_leaf_species
+from .module_tree import get_attribute_filtered_imap, get_attribute_filtered_tree, get_attribute_mask, get_current_leaf_species, get_flat_tree, get_species_tree_display
+from .module_flattree import Proposal
 from .module_bpp import bppcfile_write, run_BPP_A00
 from .module_bpp_readres import MSCNumericParamEstimates
 from .module_gdi_decision import tree_modify_delimitation, get_gdi_values
-from .module_migration import append_migrate_rows
+from .module_migration import get_migrate_rows
+from .module_results import save_iteration_results
+from .module_profile import profiled, stage
 
 
 ## MODIFICATION PROPOSAL RELATED FUNCTIONS
@@ -48,7 +50,7 @@ def set_starting_state(
     print(f"> Starting state of {mode} analysis\n")
     print(f"Number of species in starting delimitation:  {len(get_current_leaf_species(tree))}")
     print(str(get_current_leaf_species(tree))[1:-1])
-    print(get_attribute_filtered_tree(tree, "species", newick=False))
+    print(get_species_tree_display(tree))
 
     return tree
 
@@ -56,65 +58,25 @@ def set_starting_state(
 def set_tree_proposal_attributes(
         tree: Tree,
         mode: AlgoMode
-        ) ->  Tree:
+        ) ->  Proposal:
     
     '''
     Propose modifications to the topology by identifying the nodes whose species status will be assesed.
     - in merge mode, it indentifies leaf species node pairs that can be merged
     - in split mode, it identifies the descendant pairs of currently accepted leaf species nodes.
 
-    The requirement for the species status of a node to be assesed is marked with the "proposal" attribute.
+    The proposal is computed from the mask of accepted species, and marked on the nodes of the tree in place:
+    the requirement for the species status of a node to be assesed is marked with the "proposal" attribute.
     '''
 
-    tree = copy.deepcopy(tree)
-
-    # start by marking all population nodes as non-leaf, and reset the status of current and accepted proposals
-    for node in tree.search_nodes(node_type="population"): 
-        node.add_features(leaf = False, proposal = None, modified = None)
-    
-    # mark leaf nodes in current delimitation
-    for node in tree.search_nodes(species=True):
-        # start my assuming a species node is a leaf
-        leaf = True
-        # check if it has descendants that are species, in which case it is not a leaf node
-        descendants = node.iter_descendants()
-        for descendant in descendants:
-            if hasattr(descendant, "species"):
-                if descendant.species == True:
-                    leaf = False
-        
-        if leaf: node.leaf = True
-    
-
-    if   mode == 'merge':
-    # mark merge candidates
-        leaf_nodes = tree.search_nodes(leaf=True)
-        for node in leaf_nodes:
-            # check that the current node is not the root, as the root does not have ancestors
-            if node != tree.get_tree_root():
-                # get the current node and sister node as a list
-                ancestor = node.up
-                descendants = list(ancestor.iter_descendants("levelorder"))[0:2]
-                # if both the current node and its sister are leaves, they are merge candidates
-                if len(list(set(descendants) & set(leaf_nodes))) == 2:
-                    for descendant in descendants:
-                        descendant.proposal = "merge"
-    
-
-    elif mode == 'split':
-    # mark split candidates
-        leaf_nodes = tree.search_nodes(leaf=True)
-        population_nodes = tree.search_nodes(node_type="population")
-        for node in leaf_nodes:
-            # get the two first degree children of the leaf node
-            descendants = list(node.iter_descendants("levelorder"))[0:2]
-            # if both children are populations (= not individuals), the children are split candidates
-            if len(list(set(descendants) & set(population_nodes))) == 2:
-                for descendant in descendants:
-                    descendant.proposal = "split"
+    proposal = get_flat_tree(tree).propose(get_attribute_mask(tree, "species"), mode)
 
+    # mark leaf species and proposed nodes, and reset the status of accepted proposals
+    proposed_nodes = {node_name:mode for pair in proposal.pairs for node_name in pair}
+    for node, leaf in zip(tree.traverse("preorder"), proposal.leaf_species.tolist()):
+        node.add_features(leaf = leaf, proposal = proposed_nodes.get(node.name), modified = None)
 
-    return tree
+    return proposal
 
 
 
@@ -123,6 +85,7 @@ def proposal_setup_files(
         bpp_cdict:  BppCfileParam,
         mode:       AlgoMode,
         migration:  MigrationPattern,
+        iter_dir:   str = ".",
         ) ->        None: # writes files to disk
     
     '''
@@ -132,7 +95,7 @@ def proposal_setup_files(
 
     # set up and write imap needed to evaluate proposal
     proposed_imap = get_attribute_filtered_imap(tree, mode)
-    imapfile_write(proposed_imap, "proposed_imap.txt")
+    imapfile_write(proposed_imap, os.path.join(iter_dir, "proposed_imap.txt"))
     
     # write control file needed to evaluate proposal
         # get proposed population parameters and topology
@@ -141,50 +104,60 @@ def proposal_setup_files(
     prop_param['Imapfile']  = "proposed_imap.txt"
     
     bpp_cdict = dict_merge(bpp_cdict, prop_param)
-    bppcfile_write(bpp_cdict, "proposed_ctl.ctl")
-    
+
     # if migration patterns are specified, append migration parameters to the control file
-    if str(type(migration)) != "<class 'NoneType'>":
-        append_migrate_rows(tree, migration, "proposed_ctl.ctl")
+    migration_rows = get_migrate_rows(tree, migration) if migration is not None else None
+    bppcfile_write(bpp_cdict, os.path.join(iter_dir, "proposed_ctl.ctl"), migration=migration_rows)
 
 
 def HA_iteration(
         tree:       Tree, 
         bpp_cdict:  BppCfileParam, 
-        cf_dict:    CfileParam
+        cf_dict:    CfileParam,
+        output_dir: str = ".",
         ) ->        Tree:
     
     '''
-    Core function implementing each iteration of the Hierarchical merge/split algorithm
+    Core function implementing each iteration of the Hierarchical merge/split algorithm.
+    The files of the iteration are written to a new folder in 'output_dir'.
     '''
 
     # increment iteration count
     root = tree.get_tree_root(); root.iteration = (root.iteration + 1)
     print(f"\n<<< Iteration {root.iteration} >>>\n")
 
-    # create folder for iteration, and move in
-    iter_dir_name = f"Iteration_{root.iteration}"
-    os.mkdir(iter_dir_name)
-    os.chdir(iter_dir_name)
+    # create folder for iteration
+    iter_dir = os.path.join(output_dir, f"Iteration_{root.iteration}")
+    os.mkdir(iter_dir)
 
-    # inititate proposal by setting node attributes
-    tree = set_tree_proposal_attributes(tree, cf_dict["mode"])
+    # the phases of the iteration are timed separately, and profiled if requested (see 'module_profile')
+    with stage("iteration", iteration=root.iteration, mode=cf_dict["mode"]), profiled("HA_iteration", iter_dir):
 
-    # create bpp control file and imap file corresponding to proposal
-    proposal_setup_files(tree, bpp_cdict, cf_dict["mode"], cf_dict["migration"])
-    
-    # run BPP and get the distributions of the estimated numeric parameters
-    run_BPP_A00("proposed_ctl.ctl")
-    estimated_param = MSCNumericParamEstimates(BPP_outfile="hhsd_job.txt", BPP_mcmcfile="hhsd_job.mcmc.txt")
+        # inititate proposal by setting node attributes
+        with stage("proposal"):
+            set_tree_proposal_attributes(tree, cf_dict["mode"])
+
+        # create bpp control file and imap file corresponding to proposal
+        with stage("write bpp files"):
+            proposal_setup_files(tree, bpp_cdict, cf_dict["mode"], cf_dict["migration"], iter_dir)
+        
+        # run BPP and get the distributions of the estimated numeric parameters
+        with stage("bpp"):
+            run_BPP_A00("proposed_ctl.ctl", event_log=os.path.join(iter_dir, "bpp_events.jsonl"), cwd=iter_dir)
+        with stage("read bpp results"), profiled("MSCNumericParamEstimates", iter_dir):
+            estimated_param = MSCNumericParamEstimates(BPP_outfile=os.path.join(iter_dir, "hhsd_job.txt"), BPP_mcmcfile=os.path.join(iter_dir, "hhsd_job.mcmc.txt"), output_dir=iter_dir)
 
-    # get gdi via calculations or simulations, and append results to the tree
-    gdi_values = get_gdi_values(tree, estimated_param, cf_dict['mode'])
+        # get gdi via calculations or simulations, and append results to the tree
+        with stage("gdi"), profiled("get_gdi_values", iter_dir):
+            gdi_values = get_gdi_values(tree, estimated_param, cf_dict['mode'], iter_dir)
 
-    # make decision based on results
-    tree = tree_modify_delimitation(tree, gdi_values, cf_dict)
+        # make decision based on results
+        with stage("decision"):
+            tree = tree_modify_delimitation(tree, gdi_values, cf_dict, iter_dir)
 
-    # move back into working directory
-    os.chdir("..")
+        # save the traces and gdi replicates in binary files, and add the iteration to the index of the analysis
+        with stage("save results"):
+            save_iteration_results(tree, estimated_param, gdi_values, cf_dict, iter_dir)
 
     return tree    
 
@@ -204,13 +177,13 @@ def check_contintue(
 
     # check if topology has been reduced to root node (end state in merge mode)
     if   cf_dict['mode'] == 'merge':
-        if len(get_attribute_filtered_tree(tree, "species", newick=False)) == 1:
+        if len(get_current_leaf_species(tree)) == 1:
             print("\nAll populations merged into single species. Final delimitation reached")
             next_iteration = False
 
     # check if topology has been expanded to the guide tree (end state in split mode)
     elif cf_dict['mode'] == 'split':
-        if len(get_attribute_filtered_tree(tree, "population", newick=False)) == len(get_attribute_filtered_tree(tree, "species", newick=False)):
+        if get_flat_tree(tree).is_leaf.sum() == len(get_current_leaf_species(tree)):
             print("\nAll populations in guide tree are species. Final delimitation reached")
             next_iteration = False
     
@@ -0,0 +1,190 @@
+'''
+RUNNING HHSD FROM PYTHON
+
+The pipeline can be embedded in other programs through 'run_analysis'. Unlike the command line interface, it does not
+quit the interpreter or change the working directory: errors are raised as subclasses of 'HhsdError', and all file
+paths are resolved explicitly. Several analyses can therefore run concurrently in the same interpreter, e.g.:
+
+    from hhsd import AnalysisConfig, run_analysis
+
+    result = run_analysis(AnalysisConfig(control_file="dataset_1/ctl.txt", parameters={'mode':'split'}))
+    print(result.species)
+
+The parameters can also be given without a control file, in which case relative file paths are interpreted
+relative to 'base_dir' (the current working directory by default).
+'''
+
+import contextlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from .customtypehints import AlgoMode, BppCfileParam, CfileParam
+from .module_ete3 import Tree
+from .module_cmdline import resolve_cf_file
+from .module_helper import output_directory, thread_output
+from .module_scheduler import configure_core_scheduler, get_core_scheduler
+from .module_profile import RunProfile, profiling, stage
+from .module_exceptions import ArgumentError
+
+
+@dataclass
+class AnalysisConfig:
+    '''
+    Specification of an analysis, as a control file, and/or a dict of parameters overriding those of the control file.
+    '''
+
+    control_file:   Optional[Union[str, Path]] = None
+    parameters:     Optional[CfileParam] = None
+    base_dir:       Optional[Union[str, Path]] = None # relative paths are interpreted relative to this folder
+    log_file:       Optional[Union[str, Path]] = None # screen output of the analysis is written here if specified
+
+@dataclass
+class SearchResult:
+    '''
+    Final state of a merge or split search.
+    '''
+
+    mode:           AlgoMode
+    tree:           Tree
+    species:        List[str]
+    newick:         str
+    iterations:     int
+
+@dataclass
+class AnalysisResult:
+    '''
+    Results of an analysis, with one search for 'mode = merge' or 'mode = split', and two for 'mode = both'.
+    '''
+
+    output_directory:   Path
+    searches:           Dict[AlgoMode, SearchResult] = field(default_factory=dict)
+
+    @property
+    def species(self) -> List[str]:
+        if len(self.searches) != 1:
+            raise ArgumentError(f"the analysis ran {len(self.searches)} searches, select one of them from 'searches'.")
+
+        return list(self.searches.values())[0].species
+
+
+def search_result(
+        tree:   Tree,
+        mode:   AlgoMode,
+        ) ->    SearchResult:
+
+    from .module_tree import get_attribute_filtered_tree, get_current_leaf_species, get_iteration
+
+    return SearchResult(
+        mode=mode,
+        tree=tree,
+        species=get_current_leaf_species(tree),
+        newick=get_attribute_filtered_tree(tree, "species"),
+        iterations=get_iteration(tree),
+        )
+
+def run_pipeline(
+        cf_file:        Optional[Path],
+        cf_override:    Optional[CfileParam],
+        base_dir:       Path,
+        ) ->            AnalysisResult:
+
+    '''
+    Run the full analysis, with all output written to the output directory specified by the parameters.
+    The time and resources used by each stage of the analysis are written to 'run_profile.json' in the output directory.
+    '''
+
+    with profiling(RunProfile()) as profile:
+        # read control file
+        from .module_cf_ingest import ingest_cf
+        with stage("read control file"):
+            cf:CfileParam = ingest_cf(cf_file, cf_override, base_dir)
+        profile.profiled_replicates = cf['profile']
+
+        # share cores with other hhsd processes if requested (keeping any limit on the number of cores usable by this process)
+        if cf['core_lockfile'] != None and get_core_scheduler().lock_file != str(cf['core_lockfile']):
+            configure_core_scheduler(n_cores=get_core_scheduler().n_cores, lock_file=cf['core_lockfile'])
+
+        # set up the output directory
+        out = output_directory(cf['output_directory'])
+
+        try:
+            return run_searches(cf, out)
+        finally:
+            profile.write(out)
+            profile.print_summary()
+
+def run_searches(
+        cf:     CfileParam,
+        out:    Path,
+        ) ->    AnalysisResult:
+
+    '''
+    Run the merge and/or split searches of the analysis, writing their files to the output directory.
+    '''
+
+    # the modules of the analysis itself are only imported once the control file is known to be valid
+    from .module_HA import HA_iteration, check_contintue, set_starting_state
+    from .module_bpp import bppctl_init
+    from .module_tree import init_tree
+    from .module_msa_imap import imapfile_read
+    from .module_concurrent_modes import run_both_modes
+
+    # intialise bpp control file
+    with stage("bpp parameters"):
+        bpp_ctl:BppCfileParam = bppctl_init(cf)
+
+    # read in essential data, and initailise tree
+    with stage("initialise tree"):
+        imap = imapfile_read(imap_filename=cf['Imapfile'], output_type="popind")
+        newick = cf['guide_tree']
+        tree = init_tree(newick, imap)
+
+    # run the merge and split analyses concurrently if requested
+    if cf['mode'] == 'both':
+        trees = run_both_modes(tree, bpp_ctl, cf, str(out))
+        return AnalysisResult(out, {mode:search_result(tree, mode) for mode, tree in trees.items()})
+
+    # set up the starting proposal
+    tree = set_starting_state(tree, cf['mode'])
+
+    # run iterative algorithm
+    while True:
+
+        tree = HA_iteration(tree, bpp_ctl, cf, output_dir=str(out))
+
+        if not check_contintue(tree, cf):
+            return AnalysisResult(out, {cf['mode']:search_result(tree, cf['mode'])})
+
+
+## FINAL WRAPPER FUNCTION
+def run_analysis(
+        config: Union[AnalysisConfig, str, Path],
+        ) ->    AnalysisResult:
+
+    '''
+    Run the analysis specified by 'config' (or by the path of a control file), and return the final delimitation.
+    Raises a subclass of 'HhsdError' if the analysis cannot be completed.
+    '''
+
+    if not isinstance(config, AnalysisConfig):
+        config = AnalysisConfig(control_file=config)
+
+    # check that the analysis is specified
+    if config.control_file == None and config.parameters == None:
+        raise ArgumentError("specify the analysis as a control file, and/or as a dict of parameters.")
+
+    # paths in the cf are relative to the directory where the cf is located, unless specified otherwise
+    cf_file = resolve_cf_file(config.control_file) if config.control_file != None else None
+    if config.base_dir != None:
+        base_dir = Path(config.base_dir).resolve()
+    elif cf_file != None:
+        base_dir = cf_file.parent
+    else:
+        base_dir = Path.cwd()
+
+    with contextlib.ExitStack() as stack:
+        if config.log_file != None:
+            stack.enter_context(thread_output(stack.enter_context(open(config.log_file, 'w'))))
+
+        return run_pipeline(cf_file, config.parameters, base_dir)
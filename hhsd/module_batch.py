@@ -0,0 +1,192 @@
+'''
+RUNNING MANY ANALYSES FROM A MANIFEST OF CONTROL FILES
+
+Each line of the manifest specifies one analysis, as the path of a control file (relative to the manifest),
+optionally followed by parameter overrides, e.g.:
+
+    dataset_1/ctl.txt
+    dataset_1/ctl.txt --cfpor mode=split
+    dataset_2/ctl.txt --cfpor gdi_threshold=<0.3, seed=5
+
+The analyses are run from a queue by a pool of worker processes. All bpp processes of the batch draw on a
+shared budget of cores, and the analyses share the alignment, bpp result, and P(G1A) caches.
+'''
+
+import contextlib
+import csv
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .customtypehints import CfileParam
+from .module_helper import readlines
+from .module_cmdline import categorise_arguments, interpret_parameter_override
+from .module_cache import set_cache_directory
+from .module_scheduler import configure_core_scheduler
+from .module_exceptions import HhsdError, ManifestFormattingError, MissingManifestError
+
+
+## READING THE MANIFEST
+
+def read_manifest(
+        manifest:   Path,
+        ) ->        List[Dict]:
+
+    '''
+    Read the manifest into a list of jobs. Each job holds the path of the control file, and the parameter overrides.
+    '''
+
+    jobs = []
+    for line in readlines(manifest):
+        line = line.split("#")[0].strip()
+        if len(line) == 0:
+            continue
+
+        arguments_dict = categorise_arguments(['--cfile'] + line.split())
+        if '--cfile' not in arguments_dict:
+            raise ManifestFormattingError(f"could not interpret line '{line}' of batch manifest '{manifest}'.")
+
+        cf_path = Path(arguments_dict['--cfile'])
+        if not cf_path.is_absolute():
+            cf_path = manifest.parent / cf_path
+
+        cf_override = None
+        if '--cfpor' in arguments_dict:
+            cf_override = interpret_parameter_override(arguments_dict['--cfpor'])
+
+        jobs.append({'job':len(jobs)+1, 'cf_path':str(cf_path), 'cf_override':cf_override})
+
+    if len(jobs) == 0:
+        raise MissingManifestError(f"no control files listed in batch manifest '{manifest}'.")
+
+    return jobs
+
+
+## WORKER PROCESSES
+
+def init_batch_worker(
+        n_cores:            int,
+        cache_directory:    Path,
+        ) ->                None:
+
+    '''
+    Runs once in every worker process. All workers reserve cores from the same budget, recorded in a lock file in the cache.
+    '''
+
+    set_cache_directory(cache_directory)
+    configure_core_scheduler(n_cores=n_cores, lock_file=cache_directory / "cores.lock")
+
+def run_batch_job(
+        job:                int,
+        cf_path:            str,
+        cf_override:        Optional[CfileParam],
+        log_dir:            Path,
+        cache_directory:    Path,
+        ) ->                Dict:
+
+    '''
+    Run a single analysis of the batch, with the output of the pipeline written to the log file of the job.
+    Errors that stop an analysis are recorded in the summary, and do not affect other jobs.
+    '''
+
+    from .module_api import AnalysisConfig, run_analysis
+
+    # all analyses of the batch use the same shared core budget
+    cf_override = dict(cf_override) if cf_override != None else {}
+    cf_override.setdefault('core_lockfile', str(cache_directory / "cores.lock"))
+
+    summary = {'job':job, 'cf':cf_path, 'status':'failed', 'n_species':'', 'species':'', 'iterations':'', 'time':0, 'message':''}
+    log_file = Path(log_dir) / f"job_{job}.log"
+    start = time.monotonic()
+
+    with open(log_file, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            result = run_analysis(AnalysisConfig(control_file=cf_path, parameters=cf_override))
+            searches = result.searches
+
+            # with 'mode = both', the results of the merge and the split analysis are reported side by side
+            if len(searches) > 1:
+                summary.update({
+                    'n_species':"/".join(str(len(search.species)) for search in searches.values()),
+                    'species':" | ".join(f"{mode}: {' '.join(search.species)}" for mode, search in searches.items()),
+                    'iterations':"/".join(str(search.iterations) for search in searches.values()),
+                    })
+            else:
+                search = list(searches.values())[0]
+                summary.update({'n_species':len(search.species), 'species':" ".join(search.species), 'iterations':search.iterations})
+            summary['status'] = 'completed'
+
+        except HhsdError as e:
+            summary['message'] = str(e)
+            print(e)
+
+        except Exception as e:
+            summary['message'] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+
+    summary['time'] = round(time.monotonic() - start, 1)
+
+    return summary
+
+
+## FINAL WRAPPER FUNCTION
+
+def print_batch_summary(
+        summaries:  List[Dict],
+        ) ->        None:
+
+    print("\n< Batch summary >\n")
+    print(f"{'job':<5}{'status':<11}{'species':<9}{'iter':<6}{'time (s)':<10}control file")
+    for s in summaries:
+        print(f"{s['job']:<5}{s['status']:<11}{str(s['n_species']):<9}{str(s['iterations']):<6}{str(s['time']):<10}{s['cf']}")
+        if s['status'] == 'completed':
+            print(f"{'':<5}final delimitation: {s['species']}")
+        else:
+            print(f"{'':<5}{s['message'].splitlines()[0] if len(s['message']) > 0 else ''}")
+
+def write_batch_summary(
+        summaries:  List[Dict],
+        filename:   Path,
+        ) ->        None:
+
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['job', 'cf', 'status', 'n_species', 'species', 'iterations', 'time', 'message'])
+        writer.writeheader()
+        writer.writerows(summaries)
+
+def run_batch(
+        manifest:           Path,
+        n_cores:            int,
+        cache_directory:    Path,
+        ) ->                List[Dict]:
+
+    '''
+    Run all analyses listed in the manifest, using at most 'n_cores' cores for bpp at any given time.
+    The log of each analysis is written to 'batch_logs', and the summary to 'batch_summary.csv' next to the manifest.
+    '''
+
+    jobs = read_manifest(manifest)
+
+    cache_directory = Path(cache_directory)
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    log_dir = manifest.parent / "batch_logs"
+    log_dir.mkdir(exist_ok=True)
+
+    n_workers = min(len(jobs), n_cores)
+    print(f"\n< Running {len(jobs)} analyses from '{manifest.name}' with {n_workers} workers and {n_cores} cores >\n")
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_batch_worker, initargs=(n_cores, cache_directory)) as executor:
+        futures = [executor.submit(run_batch_job, log_dir=log_dir, cache_directory=cache_directory, **job) for job in jobs]
+        for future in as_completed(futures):
+            summary = future.result()
+            print(f"job {summary['job']} {summary['status']} after {summary['time']} s ({summary['cf']})")
+            summaries.append(summary)
+
+    summaries.sort(key=lambda s: s['job'])
+    print_batch_summary(summaries)
+    write_batch_summary(summaries, manifest.parent / "batch_summary.csv")
+
+    return summaries
@@ -2,16 +2,21 @@
 FUNCTIONS REQUIRED TO INTERACT WITH BPP
 '''
 
-import subprocess
-import re
+import asyncio
+import os
 import random
-import sys
-import pandas as pd
+from pathlib import Path
+from typing import Optional
 
 from .customtypehints import CfileParam, BppCfileParam, BppCfile
-from .module_helper import dict_merge, get_bundled_bpp_path
+from .module_helper import compression_of, decompress_file, dict_merge
 from .module_msa_imap import auto_prior, auto_nloci
 from .module_tree import add_inner_node_names_to_newick
+from .module_bpp_supervisor import BppSupervisor, print_bpp_progress
+from .module_scheduler import get_core_scheduler
+from .module_profile import profiled, stage
+from .module_cache import bpp_result_key, bpp_result_lock, restore_bpp_result, store_bpp_result
+from .module_exceptions import BppError
 
 # contains the list of parameters that need to be present in a BPP control file
 default_BPP_cfile_dict:BppCfileParam = {
@@ -67,114 +72,121 @@ def bppctl_init(
         
         # tau and theta priors
     if bpp_cdict['tauprior'] == None or bpp_cdict['thetaprior'] == None:
-        priors = auto_prior(
-            imapfile=bpp_cdict['Imapfile'], 
-            seqfile=bpp_cdict['seqfile'], 
-            tree_newick=cf_param['guide_tree'],
-            tau_prior=bpp_cdict['tauprior'], 
-            theta_prior=bpp_cdict['thetaprior']
-            )
+        with stage("auto prior"), profiled("auto_prior", cf_param['output_directory']):
+            priors = auto_prior(
+                imapfile=bpp_cdict['Imapfile'], 
+                seqfile=bpp_cdict['seqfile'], 
+                tree_newick=cf_param['guide_tree'],
+                tau_prior=bpp_cdict['tauprior'], 
+                theta_prior=bpp_cdict['thetaprior']
+                )
         if bpp_cdict['tauprior']   == None:
             bpp_cdict['tauprior']   = priors['tauprior']
         if bpp_cdict['thetaprior'] == None:
             bpp_cdict['thetaprior'] = priors['thetaprior']
 
+    # bpp cannot read compressed alignments, so it is given a decompressed copy in the output directory
+    if compression_of(bpp_cdict['seqfile']) != None:
+        seqfile = Path(cf_param['output_directory']) / Path(bpp_cdict['seqfile']).stem
+        decompress_file(bpp_cdict['seqfile'], seqfile)
+        bpp_cdict['seqfile'] = seqfile
+        print(f"decompressed alignment for bpp written to:\n\t{seqfile}")
+
     return bpp_cdict
 
 
 
+def bppcfile_text(
+        bpp_param:      BppCfileParam, 
+        simulate:       bool = False, # whether the control file is for simulating data
+        migration:      Optional[str] = None, # rows of the migration events, appended after the parameters
+        ) ->            str:
+    
+    '''
+    Render the dict representing the BPP ".ctl" file as the text of the file, with one 'parameter=value' row per parameter.
+    '''
+
+    rows = []
+    for param, value in bpp_param.items():
+        # remove parameters without values
+        if value == None:
+            continue
+
+        # If not simulating, add in internal node names to the newick string
+        if param == 'newick' and simulate == False:
+            value = add_inner_node_names_to_newick(value)
+
+        # 'popsizes' and 'newick' do not actually exist in bpp, they are the rows following 'species&tree'
+        if param in ['popsizes', 'newick']:
+            rows.append(f"               {value}\n")
+        else:
+            rows.append(f"{param}={value}\n")
+
+    if migration != None:
+        rows.append(migration)
+
+    return "".join(rows)
+
 def bppcfile_write(
         bpp_param:      BppCfileParam, 
         ctl_file_name:  str,
-        simulate:       bool = False # whether the control file is for simulating data
+        simulate:       bool = False, # whether the control file is for simulating data
+        migration:      Optional[str] = None, # rows of the migration events, appended after the parameters
         ) ->            None: # writes bpp control file to disk
     
     '''
-    Write dict representing the BPP ".ctl" file to a text file.
+    Write dict representing the BPP ".ctl" file to a text file. The file is rendered in memory, and written with one call.
     '''
-    # remove parameters without values
-    bpp_param = {item:bpp_param[item] for item in bpp_param if bpp_param[item] != None}
 
-    # If not simulating, add in internal node names to the newick string
-    if simulate == False:
-        bpp_param['newick'] = add_inner_node_names_to_newick(bpp_param['newick'])
-
-    # convert to pandas dataframe
-    df = pd.DataFrame(list(bpp_param.items()))
-    
-    # write dataframe to disk
-    df.to_csv(ctl_file_name, sep = "=", header = False, index = False)
-    with open(ctl_file_name, 'r+') as f:
-        text = f.read()
-        # substitute out these parameters, as they do not actually exist in bpp
-        text = re.sub('popsizes=', '               ', text)
-        text = re.sub('newick=', '               ', text)
-        f.seek(0)
-        f.truncate()
+    text = bppcfile_text(bpp_param, simulate, migration)
+    with open(ctl_file_name, 'w') as f:
         f.write(text)
 
 
+# the events of bpp are logged next to its output files
+EVENT_LOG = "bpp_events.jsonl"
+
 # run BPP with a given control file, and capture the stdout results
 def run_BPP_A00(
-        control_file:   BppCfile,  
+        control_file:   BppCfile,
+        event_log:      Optional[str] = EVENT_LOG,
+        timeout:        Optional[float] = None,
+        cwd:            Optional[str] = None,
         ) ->            None: # handles the bpp subprocess, which outputs a file
 
     '''
     Handles the starting and stopping of the C program BPP, which is used to infer MSC parameters. 
+    The process is monitored by a 'BppSupervisor', which prints progress to the screen, and writes structured events to 'event_log'.
+    Cores are reserved from the shared core scheduler, so concurrent bpp processes do not oversubscribe the machine.
+    If an identical run was already completed (e.g. by another analysis of a batch), its results are reused from the cache.
+    bpp is run in the folder 'cwd' (the current working directory by default), where its output files and the default event log are written.
     '''
 
-    bpp_completed = False
-    while not bpp_completed:
-        # flag activated when numeric scaling is turned on
-        restart = False
-
-        # runs BPP in a dedicated subprocess
-        process = subprocess.Popen(
-            f"{get_bundled_bpp_path()} --cfile {control_file}", 
-            shell = True, 
-            bufsize = 1,
-            stdout = subprocess.PIPE, 
-            stderr = subprocess.STDOUT,
-            encoding = 'utf-8', 
-            errors = 'replace' 
-            ) 
-    
-        # monitors the output of the process
-        while True:
-            output_line = process.stdout.readline()            
-            
-            # if the output is non-empty
-            if output_line:
-                # check that numeric scaling is needed, and activate if it is. This will restart bpp with the new control file
-                # numeric scaling is not active by default because it slows bpp considerably.
-                if "[ERROR] log-L for locus" in output_line:
-                    print('Restarting BPP with numerical scaling')
-                    file1 = open(control_file, "a")  # append mode
-                    file1.write("scaling=1")
-                    file1.close()
-                    restart = True
-                    break
-
-                # check if bpp errored with a given error message
-                elif "[ERROR]" in output_line:
-                    print("#", output_line)
-                    sys.exit(f"BppError: BPP failed. Check control file independently using the 'bpp' command")
-                
-                # check if bpp gave a segfault
-                elif "core dumped" in output_line:
-                    print("#", output_line)
-                    sys.exit("BppError: BPP failed with segfault. Check control file independently using the 'bpp' command, and contact BPP developers if issue persists")
-
-                # print the current progress indicator
-                progress = re.findall("-*\d\d*%", output_line)
-                if len(progress) == 1:
-                    print(f'BPP progress: {progress[0]}        ', end='\r')
-
-            # exit if process has stopped
-            if (output_line == '') and (process.poll() != None):
-                break
-        
-        if restart == False:
-            process.wait() # check again that process has stopped
-            print("> Finished BPP run                             ")
-            bpp_completed = True
\ No newline at end of file
+    if event_log == EVENT_LOG and cwd != None:
+        event_log = os.path.join(cwd, EVENT_LOG)
+
+    control_dir = cwd if cwd != None else os.path.dirname(control_file)
+    control_path = os.path.join(control_dir, control_file) if cwd != None else control_file
+    output_files = [os.path.join(control_dir, f"{default_BPP_cfile_dict['jobname']}{suffix}") for suffix in ['.txt', '.mcmc.txt']]
+
+    # identical runs started concurrently (e.g. by the merge and split searches of mode 'both') wait for each other
+    cache_key = bpp_result_key(control_path)
+    with bpp_result_lock(cache_key):
+        # check if the results of an identical bpp run are available
+        if restore_bpp_result(cache_key, output_files):
+            print("> Reusing results of identical BPP run from cache")
+            return
+
+        supervisor = BppSupervisor(event_log=event_log, callbacks=[print_bpp_progress], timeout=timeout, scheduler=get_core_scheduler())
+        result = asyncio.run(supervisor.run(control_file, mode='cfile', cwd=cwd))
+
+        if result.status == 'timeout':
+            raise BppError(f"BPP did not finish within the allowed {timeout} seconds.")
+        elif result.status == 'failed' and "core dumped" in str(result.message):
+            raise BppError("BPP failed with segfault. Check control file independently using the 'bpp' command, and contact BPP developers if issue persists")
+        elif result.status == 'failed':
+            raise BppError(f"BPP failed. Check control file independently using the 'bpp' command")
+
+        store_bpp_result(cache_key, output_files)
+
+    print("> Finished BPP run                             ")
\ No newline at end of file
@@ -1,12 +1,13 @@
 
 from copy import deepcopy
-import sys
+import os
 from typing import Tuple, Dict, Optional
 import pandas as pd
 import numpy as np
 
 from .customtypehints import BppMCMCfile, BppOutfile, NodeName, MigrationRates, MCMCResults
 from .module_helper import readlines
+from .module_exceptions import BppOutputError
 
 
 
@@ -124,7 +125,7 @@ def read_bpp_mcmc_out(
     """
     lines = readlines(BPP_mcmcfile)
     if len(lines) < 2:
-        sys.exit("Error: BPP mcmc output file is empty")
+        raise BppOutputError("BPP mcmc output file is empty")
     # read the raw MCMC data file
     mcmc_chain = pd.read_csv(BPP_mcmcfile, delimiter='\t')
     # drop first and last columns corresponding to the Gen and lNL values, which are irrelevant
@@ -161,7 +162,7 @@ def get_number_to_node_map(
     # Find starting line of node index section
     relevant_index = next((i for i, s in enumerate(lines) if s.startswith("Node-Index")), -1)
     if relevant_index == -1:
-        sys.exit("Error: could not find node index section in BPP output file")
+        raise BppOutputError("could not find node index section in BPP output file")
 
     # Find ending line of node index section
     lines = lines[relevant_index+2:]
@@ -209,7 +210,7 @@ def column_name_extractor(
         param_type, node_index = elements
         popname = map_number_to_node.get(node_index, None)
         if popname is None:
-            sys.exit(f"Error: could not find popname for node index {node_index} in map dict")
+            raise BppOutputError(f"could not find popname for node index {node_index} in map dict")
 
     return param_type, popname
 
@@ -259,7 +260,8 @@ def extract_param_summaries(
     return numeric_param_summary
 
 def meanhpd_tau_theta(
-        numeric_param:  MSCNumericParamSummary                    
+        numeric_param:  MSCNumericParamSummary,
+        output_dir:     str = ".",
         ):
 
     '''
@@ -281,14 +283,15 @@ def meanhpd_tau_theta(
     df = df.rename({0: 'theta', 1: '2.5% HPD', 2: '97.5% HPD', 3: 'tau', 4: '2.5% HPD', 5: '97.5% HPD'}, axis=1)
     
     # write results to disk
-    df.to_csv("estimated_tau_theta.csv")
+    df.to_csv(os.path.join(output_dir, "estimated_tau_theta.csv"))
 
     # format for printing, and print to screen
     print("\n> Estimated tau and theta parameters:\n")
     print(df.to_string(index=True, max_colwidth=36, justify="start", na_rep=' ',))
 
 def meanhpd_mig(
-        numeric_param:  MSCNumericParamSummary,    
+        numeric_param:  MSCNumericParamSummary,
+        output_dir:     str = ".",
         ):
     
     '''
@@ -314,7 +317,7 @@ def meanhpd_mig(
         df.rename(columns={'mean': 'W', 'hpd_025': '2.5% HPD', 'hpd_975': '97.5% HPD'}, inplace=True)
 
         # write to disk
-        df.to_csv("estimated_W.csv", index=False)
+        df.to_csv(os.path.join(output_dir, "estimated_W.csv"), index=False)
 
         # format for printing, and print to screen
         print_df = deepcopy(df)
@@ -379,9 +382,37 @@ def extract_param_traces(
     return numeric_param_df
 
 
+def write_param_traces(
+        param_traces:   MSCNumericParamDf,
+        filename:       str,
+        ) ->            None: # writes the traces to a binary numpy (.npz) file
+
+    '''
+    Save the thinned traces of the numeric parameters, with the type and node of each parameter,
+    and its samples as a row of the 'values' array.
+    '''
+
+    np.savez(
+        filename,
+        type=np.array(param_traces['type'].tolist(), dtype=str),
+        node=np.array(param_traces['node'].tolist(), dtype=str),
+        values=np.array([np.asarray(values, dtype=float) for values in param_traces['val']]),
+        )
+
+def read_param_traces(
+        filename:       str,
+        ) ->            MSCNumericParamDf:
+
+    '''
+    Read the thinned traces saved by 'write_param_traces'.
+    '''
+
+    with np.load(filename) as traces:
+        return MSCNumericParamDf({'type':traces['type'].tolist(), 'node':traces['node'].tolist(), 'val':list(traces['values'])})
+
 
 class MSCNumericParamEstimates():
-    def __init__(self, BPP_outfile: BppOutfile, BPP_mcmcfile: BppMCMCfile):
+    def __init__(self, BPP_outfile: BppOutfile, BPP_mcmcfile: BppMCMCfile, output_dir: str = "."):
         # Read in the actual mcmc results
         self.mcmc_df : MCMCResults = read_bpp_mcmc_out(BPP_mcmcfile)
 
@@ -392,8 +423,8 @@ class MSCNumericParamEstimates():
         self.param_summaries = extract_param_summaries(self.mcmc_df, self.number_to_node_map)
         
         # Print and save summary stats to disk
-        meanhpd_tau_theta(self.param_summaries)
-        meanhpd_mig(self.param_summaries)
+        meanhpd_tau_theta(self.param_summaries, output_dir)
+        meanhpd_mig(self.param_summaries, output_dir)
 
         # Extract the traces (1000 evenly spaced samples from the MCMC chain) into numericParam objects
         self.param_traces = extract_param_traces(self.mcmc_df, self.number_to_node_map)
@@ -408,6 +439,12 @@ class MSCNumericParamEstimates():
 
         return tau_dict
 
+    def tau_traces(self) -> Dict[NodeName, np.ndarray]:
+        """
+        Get the tau values of all samples from the mcmc chain, for each node
+        """
+        return {node_name:np.asarray(row["val"], dtype=float) for node_name, row in self.param_traces.query("`type` == 'tau'").set_index('node').iterrows()}
+
     def sample_theta(self, index:int) -> Dict[NodeName, float]:
         """
         Sample a theta value dictionary from the mcmc chain at the given index
@@ -418,6 +455,28 @@ class MSCNumericParamEstimates():
 
         return theta_dict
 
+    def theta_traces(self) -> Dict[NodeName, np.ndarray]:
+        """
+        Get the theta values of all samples from the mcmc chain, for each node
+        """
+        return {node_name:np.asarray(row["val"], dtype=float) for node_name, row in self.param_traces.query("`type` == 'theta'").set_index('node').iterrows()}
+
+    def migparam_traces(self) -> Optional[Tuple[MigrationRates, np.ndarray]]:
+        """
+        Get the migration events (as 'sample_migparam' without the 'W' column), and the W values of all samples 
+        from the mcmc chain as a matrix with one row for each event
+        """
+        df = self.param_traces[self.param_traces['type'] == 'W']
+
+        # if no migration patterns were inferred, return None
+        if len(df) == 0:
+            return None
+
+        events = pd.DataFrame({'source':[node.split('->')[0] for node in df['node']], 'destination':[node.split('->')[1] for node in df['node']]}, index=df.index)
+        w_traces = np.array([np.asarray(values) for values in df['val']])
+
+        return events, w_traces
+
     def sample_migparam(self, index:int) -> Optional[MigrationRates]:
         """
         Sample a set of migration rate parameters from the mcmc chain
@@ -0,0 +1,413 @@
+'''
+ASYNCHRONOUS SUPERVISION OF BPP PROCESSES
+
+BPP is started directly (without a shell) as an asyncio subprocess, and its output is monitored line by line.
+The output is translated into structured events (progress, ETA, log-L, errors, restarts...), which are passed to
+any number of callbacks, and optionally appended to a JSON-lines log file. As every BPP process is monitored by
+a coroutine, many BPP processes can be supervised concurrently from a single event loop.
+'''
+
+import asyncio
+import codecs
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Literal, Optional, Tuple
+
+from .customtypehints import BppCfile
+from .module_helper import get_bpp_path
+from .module_scheduler import CoreScheduler, read_threads_param, write_threads_param
+
+
+BppRunMode = Literal['cfile', 'simulate']
+
+@dataclass
+class BppEvent():
+    '''
+    A single event emitted while supervising a BPP process.\\
+    'kind' is one of: 'schedule', 'start', 'progress', 'restart', 'error', 'finish', 'timeout', 'cancel'
+    '''
+    kind:       str
+    job:        str
+    elapsed:    float                   # seconds since the job was first started
+    percent:    Optional[int]   = None  # progress percentage as printed by bpp (negative during burnin)
+    eta:        Optional[float] = None  # estimated seconds until the MCMC completes
+    logl:       Optional[float] = None  # current log-likelihood reported by bpp
+    returncode: Optional[int]   = None
+    message:    Optional[str]   = None
+
+    def to_json(self) -> str:
+        return json.dumps({key:value for key, value in asdict(self).items() if value is not None})
+
+@dataclass
+class BppResult():
+    '''
+    Final outcome of a supervised BPP process.\\
+    'status' is one of: 'completed', 'failed', 'timeout', 'cancelled'
+    '''
+    job:        str
+    status:     str
+    returncode: Optional[int]
+    restarts:   int
+    elapsed:    float
+    message:    Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 'completed'
+
+BppCallback = Callable[[BppEvent], None]
+
+
+## HELPER FUNCTIONS FOR INTERPRETING THE OUTPUT OF BPP
+
+def read_mcmc_length(
+        control_file:   BppCfile,
+        ) ->            Optional[Tuple[int, int]]:
+
+    '''
+    Get the number of burnin and sampling iterations (nsample * sampfreq) from a bpp control file.
+    These are needed to translate the progress indicator of bpp to the fraction of the total run that has completed.
+    '''
+
+    param = {}
+    try:
+        with open(control_file, 'r') as f:
+            for line in f:
+                if '=' in line:
+                    key, value = line.split('=', 1)
+                    param[key.strip()] = value.strip()
+
+        return int(param['burnin']), int(param['nsample'])*int(param.get('sampfreq', 1))
+    except:
+        return None
+
+def scaling_active(
+        control_file:   BppCfile,
+        ) ->            bool:
+
+    '''
+    Check if numerical scaling is already enabled in a bpp control file (e.g. after an earlier restart).
+    '''
+
+    with open(control_file, 'r') as f:
+        return any(line.split('=')[0].strip() == 'scaling' and line.split('=', 1)[1].strip() != '0' for line in f if '=' in line)
+
+def parse_progress_line(
+        output_line:    str,
+        ) ->            Optional[Tuple[int, Optional[float]]]:
+
+    '''
+    Extract the progress percentage and the current log-L from a bpp progress line, such as:
+
+     90%  0.61 0.28 0.32 0.33 1.00 0.29 0.29   0.0102 0.0091 0.0073  0.0099 0.0002 0.0001   13600.59302   -97867.97666  0:20
+
+    The log-L is the last number before the elapsed time.
+    '''
+
+    progress = re.findall(r"-*\d\d*%", output_line)
+    if len(progress) != 1:
+        return None
+    percent = int(progress[0][:-1])
+
+    logl = None
+    fields = output_line.split()
+    if len(fields) >= 3 and re.fullmatch(r"\d+(:\d\d)+", fields[-1]):
+        try:
+            logl = float(fields[-2])
+        except ValueError:
+            pass
+
+    return percent, logl
+
+def completed_fraction(
+        percent:        int,
+        mcmc_length:    Optional[Tuple[int, int]],
+        ) ->            Optional[float]:
+
+    '''
+    bpp reports progress relative to the sampling phase, so the burnin is reported as a negative percentage
+    (e.g. with burnin = nsample, progress goes from -100% to 0% during the burnin, and 0% to 100% afterwards).
+    '''
+
+    if mcmc_length == None:
+        return percent/100 if percent > 0 else None
+
+    burnin, sampling = mcmc_length
+    burnin_pct = 100*burnin/sampling
+
+    return (percent + burnin_pct)/(100 + burnin_pct)
+
+async def iter_output_lines(
+        stream:     asyncio.StreamReader,
+        ):
+
+    '''
+    Yield the output of bpp line by line. bpp updates its progress indicator with carriage returns,
+    so both '\\r' and '\\n' are treated as line endings.
+    '''
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        buffer += decoder.decode(chunk)
+        *lines, buffer = re.split(r'[\r\n]', buffer)
+        for line in lines:
+            if line.strip():
+                yield line
+
+    buffer += decoder.decode(b'', final=True)
+    if buffer.strip():
+        yield buffer
+
+
+## SUPERVISOR
+
+class BppSupervisor():
+    '''
+    Start and monitor bpp processes, emitting 'BppEvent' objects to the callbacks and the JSON-lines event log.
+
+    - 'event_log' is the path of the JSON-lines file events are appended to (None to disable).
+    - 'callbacks' are called with every event.
+    - 'timeout' is the maximum number of seconds a single job may run for (including restarts).
+    - 'scheduler' reserves cores for each bpp process before it starts (None to launch bpp unconditionally).
+    '''
+
+    def __init__(
+            self,
+            event_log:  Optional[str] = None,
+            callbacks:  Optional[List[BppCallback]] = None,
+            timeout:    Optional[float] = None,
+            scheduler:  Optional[CoreScheduler] = None,
+            ):
+
+        self.event_log = event_log
+        self.callbacks = list(callbacks) if callbacks != None else []
+        self.timeout = timeout
+        self.scheduler = scheduler
+
+    def emit(
+            self,
+            event:  BppEvent,
+            ) ->    None:
+
+        if self.event_log != None:
+            with open(self.event_log, 'a') as f:
+                f.write(event.to_json() + '\n')
+
+        for callback in self.callbacks:
+            callback(event)
+
+    async def run(
+            self,
+            control_file:   BppCfile,
+            mode:           BppRunMode = 'cfile',
+            cwd:            Optional[str] = None,
+            job:            Optional[str] = None,
+            ) ->            BppResult:
+
+        '''
+        Run bpp with the given control file until it completes, fails, times out, or is cancelled.
+        If bpp requires numerical scaling, 'scaling=1' is appended to the control file, and bpp is restarted.
+        '''
+
+        job = job if job != None else str(control_file)
+        control_path = os.path.join(cwd, control_file) if cwd != None else str(control_file)
+        start = time.monotonic()
+        restarts = 0
+
+        while True:
+            slot = await self._reserve_cores(control_path, mode, job, start)
+            try:
+                result = await self._run_attempt(control_file, control_path, mode, cwd, job, start, restarts)
+            finally:
+                if slot != None:
+                    self.scheduler.release(slot)
+
+            if result == 'restart':
+                restarts += 1
+                continue
+
+            return result
+
+    async def _reserve_cores(
+            self,
+            control_path:   str,
+            mode:           BppRunMode,
+            job:            str,
+            start:          float,
+            ):
+
+        '''
+        Wait for the scheduler to hand out cores, and pin the threads of bpp to them. 'bpp --simulate' uses a single core.
+        '''
+
+        if self.scheduler == None:
+            return None
+
+        threads = read_threads_param(control_path) if mode == 'cfile' else None
+        slot = await self.scheduler.acquire_async(threads if threads != None else "1")
+        if threads != None and slot.threads != threads:
+            write_threads_param(control_path, slot.threads)
+            self.emit(BppEvent('schedule', job, time.monotonic()-start, message=f"threads = {slot.threads}"))
+
+        return slot
+
+    async def _run_attempt(
+            self,
+            control_file:   BppCfile,
+            control_path:   str,
+            mode:           BppRunMode,
+            cwd:            Optional[str],
+            job:            str,
+            start:          float,
+            restarts:       int,
+            ):
+
+        '''
+        Run bpp once. Returns the final 'BppResult', or 'restart' if bpp needs to be restarted with numerical scaling.
+        '''
+
+        process = await asyncio.create_subprocess_exec(
+            get_bpp_path(), f"--{mode}", str(control_file),
+            cwd = cwd,
+            stdin = asyncio.subprocess.DEVNULL,
+            stdout = asyncio.subprocess.PIPE,
+            stderr = asyncio.subprocess.STDOUT,
+            )
+        self.emit(BppEvent('start', job, time.monotonic()-start, message=f"pid {process.pid}"))
+
+        remaining = None if self.timeout == None else max(self.timeout - (time.monotonic()-start), 0)
+        try:
+            outcome, message = await asyncio.wait_for(self._monitor(process, job, control_path, start), timeout=remaining)
+
+        except asyncio.TimeoutError:
+            await terminate_process(process)
+            message = f"bpp did not finish within {self.timeout} seconds"
+            self.emit(BppEvent('timeout', job, time.monotonic()-start, returncode=process.returncode, message=message))
+            return BppResult(job, 'timeout', process.returncode, restarts, time.monotonic()-start, message)
+
+        except asyncio.CancelledError:
+            await terminate_process(process)
+            self.emit(BppEvent('cancel', job, time.monotonic()-start, returncode=process.returncode))
+            raise
+
+        if outcome == 'restart' and not scaling_active(control_path):
+            # numeric scaling is not active by default because it slows bpp considerably.
+            await terminate_process(process)
+            with open(control_path, 'a') as f:
+                f.write("\nscaling=1\n")
+            self.emit(BppEvent('restart', job, time.monotonic()-start, message='Restarting BPP with numerical scaling'))
+            return 'restart'
+
+        # the log-L could not be computed even with numerical scaling
+        if outcome == 'restart':
+            outcome = 'error'
+
+        if outcome == 'error':
+            await terminate_process(process)
+            self.emit(BppEvent('error', job, time.monotonic()-start, returncode=process.returncode, message=message))
+            return BppResult(job, 'failed', process.returncode, restarts, time.monotonic()-start, message)
+
+        # check again that process has stopped, and that it was not killed by a signal (e.g. a segfault)
+        returncode = await process.wait()
+        if returncode < 0:
+            message = f"bpp was terminated by signal {-returncode} (core dumped)"
+            self.emit(BppEvent('error', job, time.monotonic()-start, returncode=returncode, message=message))
+            return BppResult(job, 'failed', returncode, restarts, time.monotonic()-start, message)
+
+        self.emit(BppEvent('finish', job, time.monotonic()-start, returncode=returncode))
+        return BppResult(job, 'completed', returncode, restarts, time.monotonic()-start)
+
+    async def _monitor(
+            self,
+            process:        asyncio.subprocess.Process,
+            job:            str,
+            control_path:   str,
+            start:          float,
+            ) ->            Tuple[str, Optional[str]]:
+
+        '''
+        Read the output of a running bpp process, and return 'restart', 'error', or 'eof' along with the triggering line.
+        '''
+
+        mcmc_length = read_mcmc_length(control_path)
+        attempt_start = time.monotonic()
+
+        async for output_line in iter_output_lines(process.stdout):
+            # check that numeric scaling is needed. This will restart bpp with the new control file
+            if "[ERROR] log-L for locus" in output_line:
+                return 'restart', output_line
+
+            # check if bpp errored with a given error message, or gave a segfault
+            elif "[ERROR]" in output_line or "core dumped" in output_line:
+                return 'error', output_line
+
+            # report the current progress
+            progress = parse_progress_line(output_line)
+            if progress != None:
+                percent, logl = progress
+                fraction = completed_fraction(percent, mcmc_length)
+                eta = None
+                if fraction != None and 0 < fraction < 1:
+                    eta = (time.monotonic() - attempt_start)*(1 - fraction)/fraction
+
+                self.emit(BppEvent('progress', job, time.monotonic()-start, percent=percent, eta=eta, logl=logl))
+
+        return 'eof', None
+
+    async def run_many(
+            self,
+            jobs:   List[Dict],
+            ) ->    List[BppResult]:
+
+        '''
+        Supervise several bpp processes concurrently. Each job is a dict of keyword arguments to 'run'.
+        '''
+
+        return list(await asyncio.gather(*[self.run(**job) for job in jobs]))
+
+
+async def terminate_process(
+        process:        asyncio.subprocess.Process,
+        grace_period:   float = 5,
+        ) ->            None:
+
+    '''
+    Stop a bpp process, first politely, then forcefully if it does not exit within the grace period.
+    '''
+
+    if process.returncode != None:
+        return
+
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), timeout=grace_period)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+## CALLBACKS
+
+def print_bpp_progress(
+        event:  BppEvent
+        ) ->    None:
+
+    '''
+    Default callback, which prints the progress of bpp to the screen
+    '''
+
+    if   event.kind == 'progress':
+        print(f'BPP progress: {event.percent}%        ', end='\r')
+    elif event.kind == 'restart':
+        print(event.message)
+    elif event.kind in ['error', 'timeout']:
+        print("#", event.message)
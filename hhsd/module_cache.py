@@ -0,0 +1,346 @@
+'''
+CACHES SHARED BETWEEN THE ANALYSES OF A BATCH
+
+Three kinds of results can be reused across analyses of the same data:
+1) parsed sequence alignments, which are used by all checks, and at every iteration
+2) bpp results (outfile and mcmc file) for identical control files (same delimitation, data, priors, and seed)
+3) P(G1A) distributions for a node, given identical MCMC traces
+
+The most recently parsed alignments are always cached in memory (a bounded number of them, so long-running processes
+such as batch workers do not accumulate them). If a cache directory is set, all three are also stored on disk, where
+they can be shared by all processes of a batch run.
+'''
+
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .customtypehints import BppCfile, Filename
+
+
+class BoundedMemory():
+    '''
+    Thread-safe memory of at most 'max_entries' values, from which the least recently used value is evicted.
+    '''
+
+    def __init__(
+            self,
+            max_entries:    int,
+            ):
+
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+            self,
+            key:    Hashable,
+            ) ->    Optional[Any]:
+
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(
+            self,
+            key:    Hashable,
+            value:  Any,
+            ) ->    None:
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# the cache directory of the process (e.g. of a batch worker), which can be overridden within a context (e.g. of an analysis)
+_cache_directory: Optional[Path] = None
+_scoped_cache_directory: ContextVar[Optional[Path]] = ContextVar('cache_directory', default=None)
+_cache_lock = threading.Lock()
+# an analysis reads a single alignment, so only the last few are kept (files are identified by path, size and mtime)
+_alignment_memory = BoundedMemory(2)
+_digest_memory = BoundedMemory(256)
+
+def set_cache_directory(
+        cache_directory:    Optional[Path],
+        ) ->                None:
+
+    '''
+    Set the folder where cached results are stored on disk (None to disable the disk cache)
+    '''
+
+    global _cache_directory
+    if cache_directory == None:
+        _cache_directory = None
+    else:
+        _cache_directory = Path(cache_directory).resolve()
+        _cache_directory.mkdir(parents=True, exist_ok=True)
+
+def get_cache_directory(
+        ) ->    Optional[Path]:
+
+    scoped = _scoped_cache_directory.get()
+
+    return scoped if scoped != None else _cache_directory
+
+@contextmanager
+def scoped_cache_directory(
+        cache_directory:    Path,
+        remove:             bool = False,
+        ):
+
+    '''
+    Store cached results in 'cache_directory' within the current context only, so other analyses of the process are
+    not affected. Threads started within the context must be given a copy of it ('contextvars.copy_context').
+    With 'remove', the folder is deleted when the context exits.
+    '''
+
+    cache_directory = Path(cache_directory).resolve()
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    token = _scoped_cache_directory.set(cache_directory)
+    try:
+        yield cache_directory
+    finally:
+        _scoped_cache_directory.reset(token)
+        if remove:
+            shutil.rmtree(cache_directory, ignore_errors=True)
+
+
+## HELPER FUNCTIONS
+
+def file_identity(
+        filename:   Filename,
+        ) ->        Tuple[str, int, int]:
+
+    stat = os.stat(filename)
+    return (str(Path(filename).resolve()), stat.st_size, stat.st_mtime_ns)
+
+def file_digest(
+        filename:   Filename,
+        ) ->        str:
+
+    '''
+    sha256 of the contents of a file. Digests are remembered until the file is modified.
+    '''
+
+    identity = file_identity(filename)
+    digest = _digest_memory.get(identity)
+    if digest != None:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    digest = sha.hexdigest()
+    _digest_memory.put(identity, digest)
+
+    return digest
+
+def atomic_write_bytes(
+        path:   Path,
+        data:   bytes,
+        ) ->    None:
+
+    '''
+    Write a cache entry such that concurrent readers never observe a partially written file
+    '''
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+## ALIGNMENT CACHE
+
+def get_cached_alignment(
+        align_file: Filename,
+        reader:     Callable,
+        ):
+
+    '''
+    Return the parsed alignment, only calling 'reader' if the alignment has not been parsed yet.
+    '''
+
+    identity = file_identity(align_file)
+    alignment = _alignment_memory.get(identity)
+    if alignment != None:
+        return alignment
+
+    cache_path = None
+    cache_directory = get_cache_directory()
+    if cache_directory != None:
+        # the version in the name keeps alignments parsed into biopython objects by older versions from being loaded
+        cache_path = cache_directory / 'alignments' / f'{file_digest(align_file)}.v2.pkl'
+        if cache_path.is_file():
+            with open(cache_path, 'rb') as f:
+                alignment = pickle.load(f)
+
+    if alignment == None:
+        alignment = reader(align_file)
+        if cache_path != None:
+            atomic_write_bytes(cache_path, pickle.dumps(alignment))
+
+    _alignment_memory.put(identity, alignment)
+
+    return alignment
+
+
+## BPP RESULT CACHE
+
+def bpp_result_key(
+        control_file:   BppCfile,
+        ) ->            str:
+
+    '''
+    Key identifying a bpp run: the control file (except 'threads', which only affects the speed of bpp),
+    and the contents of the Imap and sequence files it refers to.
+    '''
+
+    control_dir = Path(control_file).resolve().parent
+    sha = hashlib.sha256()
+    with open(control_file, 'r') as f:
+        for line in f:
+            key = line.split('=')[0].strip()
+            if key == 'threads':
+                continue
+            if key in ['seqfile', 'Imapfile']:
+                sha.update(file_digest(control_dir / line.split('=', 1)[1].strip()).encode())
+            else:
+                sha.update(line.encode())
+
+    return sha.hexdigest()
+
+# locks of the bpp runs in progress, with the number of threads holding or waiting for each
+_bpp_result_locks: Dict[str, List] = {}
+
+@contextmanager
+def bpp_result_lock(
+        key:    str,
+        ):
+
+    '''
+    Lock held while a bpp run is in progress, such that an identical run started from another thread waits for,
+    and then reuses, the results of the first. The lock is forgotten once no thread holds or waits for it.
+    '''
+
+    with _cache_lock:
+        entry = _bpp_result_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _cache_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _bpp_result_locks[key]
+
+def restore_bpp_result(
+        key:            str,
+        output_files:   List[Filename],
+        ) ->            bool:
+
+    '''
+    Copy the cached outputs of an identical bpp run into place. Returns False if there is no cached result.
+    '''
+
+    cache_directory = get_cache_directory()
+    if cache_directory == None:
+        return False
+
+    entry = cache_directory / 'bpp' / key
+    if not all((entry / Path(filename).name).is_file() for filename in output_files):
+        return False
+
+    for filename in output_files:
+        shutil.copyfile(entry / Path(filename).name, filename)
+
+    return True
+
+def store_bpp_result(
+        key:            str,
+        output_files:   List[Filename],
+        ) ->            None:
+
+    cache_directory = get_cache_directory()
+    if cache_directory == None:
+        return
+
+    entry = cache_directory / 'bpp' / key
+    for filename in output_files:
+        with open(filename, 'rb') as f:
+            atomic_write_bytes(entry / Path(filename).name, f.read())
+
+
+## P(G1A) CACHE
+
+def pg1a_key(
+        *components,
+        ) ->    str:
+
+    '''
+    Key identifying a P(G1A) calculation from its inputs (method, node, topology, MCMC traces...).
+    numpy arrays are hashed by their contents.
+    '''
+
+    sha = hashlib.sha256()
+    for component in components:
+        if isinstance(component, np.ndarray):
+            sha.update(np.ascontiguousarray(component).tobytes())
+        else:
+            sha.update(repr(component).encode())
+
+    return sha.hexdigest()
+
+def load_pg1a(
+        key:    str,
+        ) ->    Optional[np.ndarray]:
+
+    cache_directory = get_cache_directory()
+    if cache_directory == None:
+        return None
+
+    cache_path = cache_directory / 'pg1a' / f'{key}.npy'
+    if not cache_path.is_file():
+        return None
+
+    return np.load(cache_path)
+
+def store_pg1a(
+        key:        str,
+        values:     np.ndarray,
+        ) ->        None:
+
+    cache_directory = get_cache_directory()
+    if cache_directory == None:
+        return
+
+    cache_path = cache_directory / 'pg1a' / f'{key}.npy'
+    temp_path = cache_path.with_name(f".{key}.{uuid.uuid4().hex}.npy")
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(temp_path, np.asarray(values))
+    os.replace(temp_path, cache_path)
@@ -3,16 +3,17 @@ FUNCTIONS REQUIRED TO INGEST AND CHECK THE PARAMETERS OF THE CONTROL FILE PROVID
 '''
 
 import io
-import sys
 import re
 from collections import Counter
-from typing import Optional
+from pathlib import Path
+from typing import List, Optional
 import pandas as pd
 
 from .customtypehints import CfileParam, Cfile
 from .module_helper import readlines, stripall, dict_merge, closest_param_match, remove_empty_rows
-from .module_check_helper_cf import check_output_dir, check_msa_file, check_imap_file, check_newick, check_imap_msa_compat, check_imap_tree_compat, check_can_infer_theta, check_mode, check_gdi_threshold, check_migration
-from .module_check_helper_bpp import check_seed, check_tauprior, check_thetaprior, check_sampfreq, check_nsample, check_burnin, check_locusrate, check_cleandata, check_threads, check_threads_msa_compat, check_nloci, check_nloci_msa_compat, check_threads_nloci_compat, check_wprior, check_phase
+from .module_check_helper_cf import check_output_dir, check_msa_file, check_imap_file, check_newick, check_imap_msa_compat, check_imap_tree_compat, check_can_infer_theta, check_mode, check_gdi_threshold, check_migration, check_profile, check_compress_mcmc
+from .module_check_helper_bpp import check_seed, check_tauprior, check_thetaprior, check_sampfreq, check_nsample, check_burnin, check_locusrate, check_cleandata, check_threads, check_threads_msa_compat, check_nloci, check_nloci_msa_compat, check_threads_nloci_compat, check_wprior, check_phase, check_core_lockfile
+from .module_exceptions import ControlFileError, HhsdError, ParameterOverrideError
 
 # dictionary of CF parameters that are currently supported
 cf_param_dict:CfileParam = {
@@ -40,6 +41,11 @@ cf_param_dict:CfileParam = {
     "nloci"                 :None,
     "locusrate"             :None,
     "cleandata"             :None,
+    "core_lockfile"         :None, # shares cores with other hhsd processes using the same file
+
+    # output files and diagnostics
+    "compress_mcmc"         :None, # compresses the mcmc file of each iteration once its thinned traces are saved ('gz' or 'zst')
+    "profile"               :None, # profiles the stages with cProfile, sampling this many replicates of each gdi estimate
 
     # migration related parameters
     "wprior"                :None,
@@ -94,13 +100,13 @@ def read_cf_to_df(
         lines = read_filter_comments(cf_name)
         lines_text = "\n".join(lines)
     except:
-        sys.exit("ControlFileError: could not remove comments from control file.\nCheck formatting and refer to section 4 of the manual.")
+        raise ControlFileError("could not remove comments from control file.\nCheck formatting and refer to section 4 of the manual.")
     
     # format parameters bounded by '{}'
     try:
         lines_text = read_format_curlybrackets(lines_text)
     except:
-        sys.exit("ControlFileError: could not parse control file parameters delimited by '{' and '}'.\nCheck formatting and refer to section 4 of the manual.")
+        raise ControlFileError("could not parse control file parameters delimited by '{' and '}'.\nCheck formatting and refer to section 4 of the manual.")
 
     # read into dataframe
     try:
@@ -111,7 +117,7 @@ def read_cf_to_df(
         for col in df.columns:
             df[col] = df[col].map(stripall)
     except:
-        sys.exit("ControlFileError: could not parse control file\nCheck formatting and refer to section 4 of the manual.")
+        raise ControlFileError("could not parse control file\nCheck formatting and refer to section 4 of the manual.")
 
     return df
 
@@ -139,38 +145,41 @@ def cf_df_to_dict(
 
 ## FUNCTION FOR CHECKING PARAMETER NAMES
 def verify_cf_parameter_names(
-        cf_file:        Cfile,
+        cf_file:        Optional[Cfile],
         cf_override:    Optional[CfileParam]
         ) ->            CfileParam:
 
     '''
     This function aims to ensure that the control file only contains calls
     to valid parameters of the pipeline, and does not have duplicate values. 
+    If no control file is given, all parameters are taken from the override.
     '''
 
     correct_param = list(cf_param_dict.keys())
 
-    
-    cf_df:pd.DataFrame = read_cf_to_df(cf_file)
+    if cf_file == None:
+        cf_df = pd.DataFrame({'par':[], 'value':[]})
+    else:
+        cf_df:pd.DataFrame = read_cf_to_df(cf_file)
     supplied_param = cf_df['par'].tolist()
 
     # check if all parameters are from the known correct list
     unmatched = set(supplied_param).difference(set(correct_param))
     if len(unmatched) > 0:
-        error_msg = "ControlFileError: unknown parameters:"
+        error_msg = "unknown parameters:"
         for param in unmatched: error_msg += f"\n\t{param} {closest_param_match(param, correct_param)}"
-        sys.exit(error_msg)
+        raise ControlFileError(error_msg)
     
     # check for duplicate parameter names
     counts = dict(Counter(supplied_param))
     if any(value > 1 for value in counts.values()):
-        error_msg = "ControlFileError: duplicate parameters:\n\t"
+        error_msg = "duplicate parameters:\n\t"
         error_msg += str([parameter for parameter in counts if counts[parameter] > 1])[1:-1]
         error_msg += "\ndelete or comment out lines with duplicate parameters"
-        sys.exit(error_msg)
+        raise ControlFileError(error_msg)
 
     # return cf dict if all the tests were passed
-    cf:CfileParam = cf_df_to_dict(cf_df)
+    cf:CfileParam = cf_df_to_dict(cf_df) if cf_file != None else dict(cf_param_dict)
 
     # read in and check parameters from the override
     if cf_override != None:
@@ -180,9 +189,9 @@ def verify_cf_parameter_names(
     
         unmatched = set(supplied_param).difference(set(correct_param))
         if len(unmatched) > 0:
-            error_msg = "ParameterOverrideError: unknown parameters:"
+            error_msg = "unknown parameters:"
             for param in unmatched: error_msg += f"\n\t{param} {closest_param_match(param, correct_param)}"
-            sys.exit(error_msg)
+            raise ParameterOverrideError(error_msg)
 
         cf = dict_merge(cf, cf_override)
 
@@ -191,53 +200,80 @@ def verify_cf_parameter_names(
 
 
 def cf_parameter_check(
-        cf:     CfileParam
-        ) ->    CfileParam:
+        cf:         CfileParam,
+        base_dir:   Optional[Path] = None,
+        errors:     Optional[List[HhsdError]] = None,
+        ) ->        CfileParam:
     
     '''
     Checks all values provided in a control file to ensure that the program will not crash.\\
-    If any of these checks do fail, the program will quit with an informative error message. 
+    If any of these checks do fail, an 'HhsdError' with an informative error message is raised. 
+    Relative file paths are interpreted relative to 'base_dir' (the current working directory by default).
+
+    If a list 'errors' is given, all checks are run, and their errors are appended to the list instead of being raised.
+    Checks that depend on a parameter that already failed are skipped, and the failed parameters are set to None.
+    In this case, the alignment is read without keeping it in memory, as the analysis is not run.
     '''
 
+    # names of the parameters (and compatibilities between them) that failed their checks
+    failed = set()
+
+    def check(function, *args, checked=(), requires=()):
+        if len(failed.intersection(requires)) > 0:
+            failed.update(checked)
+            return None
+        try:
+            return function(*args)
+        except HhsdError as e:
+            if errors == None:
+                raise
+            errors.append(e)
+            failed.update(checked)
+            return None
+
     #  Checking parameters of the control file (functions explained and implemented in 'module_check_helper_cf')
-    cf['output_directory'] = check_output_dir(cf['output_directory'])
+    cf['output_directory'] = check(check_output_dir, cf['output_directory'], base_dir, checked=['output_directory'])
 
     # check data is of correct type
-    cf['seqfile']  = check_msa_file(cf['seqfile'])
-    cf['Imapfile'] = check_imap_file(cf['Imapfile'])
-    check_newick(cf['guide_tree'])
+    cf['seqfile']  = check(check_msa_file, cf['seqfile'], base_dir, errors == None, checked=['seqfile'])
+    cf['Imapfile'] = check(check_imap_file, cf['Imapfile'], base_dir, checked=['Imapfile'])
+    check(check_newick, cf['guide_tree'], checked=['guide_tree'])
     
     # compatibility checking of data
-    check_imap_msa_compat(cf['Imapfile'], cf['seqfile'])
-    check_imap_tree_compat(cf['Imapfile'], cf['guide_tree'])
-    check_phase(cf['phase'])
-    check_can_infer_theta(cf['Imapfile'], cf['seqfile'], cf['phase'],)
+    check(check_imap_msa_compat, cf['Imapfile'], cf['seqfile'], checked=['imap_msa'], requires=['Imapfile', 'seqfile'])
+    check(check_imap_tree_compat, cf['Imapfile'], cf['guide_tree'], checked=['imap_tree'], requires=['Imapfile', 'guide_tree'])
+    check(check_phase, cf['phase'], checked=['phase'])
+    check(check_can_infer_theta, cf['Imapfile'], cf['seqfile'], cf['phase'], requires=['Imapfile', 'seqfile', 'imap_msa', 'phase'])
     
     # check parameters of the hierarchical method
-    check_mode(cf['mode'])
-    cf['gdi_threshold'] = check_gdi_threshold(cf['gdi_threshold'], cf['mode'])
+    check(check_mode, cf['mode'], checked=['mode'])
+    cf['gdi_threshold'] = check(check_gdi_threshold, cf['gdi_threshold'], cf['mode'], requires=['mode'])
 
     # Checking parameters passed to BPP(functions explained and implemented in 'module_check_helper_bpp')
-    check_seed(cf['seed'])
-    check_tauprior(cf['tauprior'])
-    check_thetaprior(cf['thetaprior'])
-    check_sampfreq(cf['sampfreq'])
-    check_nsample(cf['nsample'])
-    check_burnin(cf['burnin'])
-    check_locusrate(cf['locusrate'])
-    check_cleandata(cf['cleandata'])
+    check(check_seed, cf['seed'])
+    check(check_tauprior, cf['tauprior'])
+    check(check_thetaprior, cf['thetaprior'])
+    check(check_sampfreq, cf['sampfreq'])
+    check(check_nsample, cf['nsample'])
+    check(check_burnin, cf['burnin'])
+    check(check_locusrate, cf['locusrate'])
+    check(check_cleandata, cf['cleandata'])
     
-    check_threads(cf['threads'])
-    check_threads_msa_compat(cf['threads'], cf['seqfile'])
+    check(check_threads, cf['threads'], checked=['threads'])
+    check(check_threads_msa_compat, cf['threads'], cf['seqfile'], requires=['threads', 'seqfile'])
     
-    check_nloci(cf['nloci'])
-    check_nloci_msa_compat(cf['nloci'], cf['seqfile'])
-    check_threads_nloci_compat(cf['threads'], cf['nloci'])
+    check(check_nloci, cf['nloci'], checked=['nloci'])
+    check(check_nloci_msa_compat, cf['nloci'], cf['seqfile'], requires=['nloci', 'seqfile'])
+    check(check_threads_nloci_compat, cf['threads'], cf['nloci'], requires=['threads', 'nloci'])
+    cf['core_lockfile'] = check(check_core_lockfile, cf['core_lockfile'], base_dir)
 
-    check_wprior(cf['wprior'])
+    check(check_wprior, cf['wprior'], checked=['wprior'])
 
     # Checking parameters related to migration,
-    cf['migration'] = check_migration(cf["migration"], cf['wprior'], cf['guide_tree'])
+    cf['migration'] = check(check_migration, cf["migration"], cf['wprior'], cf['guide_tree'], requires=['wprior', 'guide_tree'])
+
+    check(check_compress_mcmc, cf['compress_mcmc'])
+    cf['profile'] = check(check_profile, cf['profile'])
 
 
     return cf
@@ -245,18 +281,20 @@ def cf_parameter_check(
 
 ## FINAL WRAPPER FUNCTION IMPLEMENTING READING AND CHECKING
 def ingest_cf(
-        cf_file:        Cfile,
-        cf_override:    Optional[CfileParam]
+        cf_file:        Optional[Cfile],
+        cf_override:    Optional[CfileParam],
+        base_dir:       Optional[Path] = None,
         ) ->            CfileParam:
     
     '''
     Ingest the control file (and the optional parameter overrides), and check the integrity of supplied parameters and values.
+    File paths in the control file are interpreted relative to 'base_dir'.
     '''
 
     # verify that the cf only contains known parameters, and no duplicates
     cf = verify_cf_parameter_names(cf_file, cf_override)
     
     # verify the specific values provided for the parameters will allow the program to run
-    cf = cf_parameter_check(cf)
+    cf = cf_parameter_check(cf, base_dir)
 
     return cf
\ No newline at end of file
@@ -3,26 +3,26 @@ FUNCTIONS THAT AIM TO CHECK FOR  MISSPECIFICATIONS OF DATA PROVIDED IN THE
 CONTROL FILE, AND PARAMETERS RELEVANT TO THE HM ALGORITHM
 '''
 
-import sys
 import re
-from pathlib import Path
 
 from .module_ete3 import Tree
-from .module_helper import check_file_exists, check_folder, check_numeric
-from .module_msa_imap import alignfile_to_MSA, imapfile_read, count_seq_per_pop
+from .module_helper import check_compression_available, check_file_exists, check_folder, check_numeric, compression_of, resolve_path
+from .module_msa_imap import imapfile_read, summarise_alignment
 from .module_tree import name_internal_nodes, get_all_populations
 from .module_migration import read_specified_mig_pattern
+from .module_exceptions import GdiParameterError, GuideTreeError, InputDataError, MigrationParameterError, MissingParameterError, ParameterFormattingError
 
 # check if the output directory is available
 def check_output_dir(
-        output_directory
+        output_directory,
+        base_dir = None,
         ):
 
     if output_directory == None:
-        sys.exit("MissingParameterError: no 'output_directory' provided. specify a folder where the results of the analysis should be deposited")
-    check_folder(output_directory)
+        raise MissingParameterError("no 'output_directory' provided. specify a folder where the results of the analysis should be deposited")
+    check_folder(output_directory, base_dir)
     
-    final_output_directory = Path(output_directory).resolve(strict=False)
+    final_output_directory = resolve_path(output_directory, base_dir)
     if str(final_output_directory) != output_directory:
         print(f"filepath for output direcectory inferred to be:\n\t{final_output_directory}")
 
@@ -31,28 +31,27 @@ def check_output_dir(
 ## FILE TYPE CHECKS
 # check if an alignment file can be loaded in as a valid MSA object
 def check_msa_file(
-        seqfile
+        seqfile,
+        base_dir = None,
+        keep_alignment = True,
         ):
 
     if seqfile == None:
-        sys.exit("MissingParameterError: 'seqfile' not specified")
+        raise MissingParameterError("'seqfile' not specified")
     
-    check_file_exists(seqfile, 'seqfile')
+    check_file_exists(seqfile, 'seqfile', base_dir)
+    final_seqfile = resolve_path(seqfile, base_dir, strict=True)
+    check_compression_available(compression_of(final_seqfile))
     
-    # try to load the alignment file to the internal MSA object
+    # try to read the alignment file (into the internal MSA object, unless 'keep_alignment' is False)
     try:
-        align = alignfile_to_MSA(seqfile)
+        summary = summarise_alignment(final_seqfile, keep_alignment)
     except:
-        sys.exit(f"InputDataError: The seqfile '{seqfile}' is not a valid phylip MSA")
+        raise InputDataError(f"The seqfile '{seqfile}' is not a valid phylip MSA")
 
     # check that all sequence ids are formatted correctly
-    for curr_locus in align:
-        curr_id_list = [seq.id for seq in curr_locus]
-        for id in curr_id_list:
-            if not bool(re.fullmatch(r"^\S+\^\S+$|^\^\S+$", id)):
-                sys.exit(f"InputDataError: sequence names in 'seqfile' '{seqfile}' do not follow requred naming conventions. \nSequence names should be in the format seq_id^individual_id or ^individual_id.")
-
-    final_seqfile = Path(seqfile).resolve(strict=True)
+    if len(summary.invalid_names) > 0:
+        raise InputDataError(f"sequence names in 'seqfile' '{seqfile}' do not follow requred naming conventions. \nSequence names should be in the format seq_id^individual_id or ^individual_id.")
 
     if str(final_seqfile) != seqfile:
         print(f"filepath for seqfile inferred to be:\n\t{final_seqfile}")
@@ -63,22 +62,22 @@ def check_msa_file(
 # check if the file supposted to be an imap is actually an Imap
 #### FIX FIX NEEDS EXTRA WORK
 def check_imap_file(
-        imapfile
+        imapfile,
+        base_dir = None,
         ):
 
     if imapfile == None:
-        sys.exit("MissingParameterError: 'Imapfile' not specified")
+        raise MissingParameterError("'Imapfile' not specified")
     
-    check_file_exists(imapfile, 'imapfile')
+    check_file_exists(imapfile, 'imapfile', base_dir)
+    final_imapfile = resolve_path(imapfile, base_dir, strict=True)
 
     # try to load the imap in both modes
     try:
-        imap = imapfile_read(imapfile, "popind")
-        imap = imapfile_read(imapfile, "indpop")
+        imap = imapfile_read(final_imapfile, "popind")
+        imap = imapfile_read(final_imapfile, "indpop")
     except:
-        sys.exit(f"InputDataError: 'Imapfile' {imapfile} formatted incorrectly. Refer to section 4.3 in the manual.")
-
-    final_imapfile = Path(imapfile).resolve(strict=True)
+        raise InputDataError(f"'Imapfile' {imapfile} formatted incorrectly. Refer to section 4.3 in the manual.")
 
     if str(final_imapfile) != imapfile:
         print(f"filepath for Imapfile inferred to be:\n\t{final_imapfile}\n")
@@ -92,43 +91,43 @@ def check_newick(
 
     # check if tree is supplied    
     if tree == None:
-        sys.exit("MissingParameterError: 'guide_tree' not supplied")
+        raise MissingParameterError("'guide_tree' not supplied")
     
     # check if tree can be ingested as a newick tree
     else:
         try:
             t = Tree(tree)
         except:
-            sys.exit("GuideTreeError: guide tree could not be processed. Check formatting adheres to Newick standard.")
+            raise GuideTreeError("guide tree could not be processed. Check formatting adheres to Newick standard.")
     
     
     node_names = [node.name for node in t.traverse("postorder") if node.name != ""] # internal node names are not assesed
 
     # check for less than 2 nodes
     if len(node_names) < 2:
-        sys.exit("GuideTreeError: guide tree must have at least two nodes")
+        raise GuideTreeError("guide tree must have at least two nodes")
 
     # check for node names starting with numbers or with special characters
     for name in node_names:
         if re.match(r'^\d', name):
-            sys.exit(f"GuideTreeError: guide tree has species names starting with numbers.\nRename '{name}'")
+            raise GuideTreeError(f"guide tree has species names starting with numbers.\nRename '{name}'")
         if not re.match(r'^[a-zA-Z0-9_-]+$', name):
-            sys.exit(f"GuideTreeError: guide tree has species names with non standard characters.\nRename '{name}'\nAllowed charcters are a-z, A-Z, 0-9, '_', and '-'")
+            raise GuideTreeError(f"guide tree has species names with non standard characters.\nRename '{name}'\nAllowed charcters are a-z, A-Z, 0-9, '_', and '-'")
 
     # check for repeated node names
     if len(node_names) > len(set(node_names)):
-        sys.exit("GuideTreeError: guide tree has repeated node names")
+        raise GuideTreeError("guide tree has repeated node names")
 
     # check for conflicts arising from overlaps between leaf and node names
     t = name_internal_nodes(t)
     node_names = [node.name for node in t.traverse("postorder")]
     if len(node_names) > len(set(node_names)):
-        sys.exit("GuideTreeError: guide tree internal node names overlap with leaf node names. Refer to section 4.3 of the manual.")
+        raise GuideTreeError("guide tree internal node names overlap with leaf node names. Refer to section 4.3 of the manual.")
 
     # check if the tree is binary, and return a special error if not
     for node in t.traverse():
         if len(node.get_children()) not in [0, 2]:
-            sys.exit("GuideTreeError: guide tree is not binary. Each non-leaf node should only have two descendants.")
+            raise GuideTreeError("guide tree is not binary. Each non-leaf node should only have two descendants.")
 
     return True
 
@@ -148,18 +147,12 @@ def check_imap_msa_compat(
     names_imap = set(list(imapfile_read(imapfile, "indpop").keys()))
     
     # get the list of individual IDs in the alignment
-    alignment = alignfile_to_MSA(seqfile)
-    names_align = set()
-    for locus in alignment:
-        for seq in locus:
-            name = seq.id
-            name = name.split("^")[-1]
-            names_align.add(name)
+    names_align = summarise_alignment(seqfile).all_individuals()
 
     # check if the two sets of names are not identical
     if names_imap != names_align:
         
-        error_msg = "InputDataError: Imap and seqfile are incompatible\n"
+        error_msg = "Imap and seqfile are incompatible\n"
         
         not_found_in_alignment = names_imap.difference(names_align)
         if len(not_found_in_alignment) > 0:
@@ -171,7 +164,7 @@ def check_imap_msa_compat(
             error_msg += "\n\tthe following IDs are in the seqfile, but not the Imap:\n"
             error_msg += f"\t{str(not_found_in_imap)[1:-1]}\n"
         
-        sys.exit(error_msg)
+        raise InputDataError(error_msg)
 
 # check if a Newick tree and an Imap file are mutually compatible
 '''
@@ -195,7 +188,7 @@ def check_imap_tree_compat(
     # if not, provide detailed feedback about the missing populations
     if pops_imap != pops_tree:
         
-        error_msg = "InputDataError: Imap and guide tree are incompatible\n"
+        error_msg = "Imap and guide tree are incompatible\n"
         
         not_found_in_alignment = pops_imap.difference(pops_tree)
         if len(not_found_in_alignment) > 0:
@@ -207,7 +200,7 @@ def check_imap_tree_compat(
             error_msg += "\n\tthe following populations are in the guide tree, but not the Imap:\n"
             error_msg += f"\t{str(not_found_in_imap)[1:-1]}\n"
         
-        sys.exit(error_msg)
+        raise InputDataError(error_msg)
 
 # check if a guide tree and Imap and alignment together are suitable for GDI calculations
 '''
@@ -221,20 +214,19 @@ def check_can_infer_theta(
         ):
     
     indpop_dict = imapfile_read(imapfile, "indpop")
-    alignment = alignfile_to_MSA(seqfile)
 
     # count the max number of sequences per population
-    seq_per_pop = count_seq_per_pop(indpop_dict, alignment)
+    seq_per_pop = summarise_alignment(seqfile).seq_per_pop(indpop_dict)
     
     if phase == None or phase == "0":
         # if all sequences are unphased, then two sequences per population are required to estimate theta
         insufficient = [pop for pop in seq_per_pop if seq_per_pop[pop] < 2]
 
         if len(insufficient) > 0:
-            error_msg = "InputDataError: insufficient number of sequences in:\n"
+            error_msg = "insufficient number of sequences in:\n"
             for pop in insufficient: error_msg += f"\t'{pop}' {seq_per_pop[pop]}\n"
             error_msg += "\nTheta cannot be estimated for unphased populations with 1 sequence.\nadd more sequences, remove species from the analysis, or specify phasing"
-            sys.exit(error_msg)
+            raise InputDataError(error_msg)
 
 
 ## FUNCTIONS FOR SPECIFIC MCF PARAMETERS RELATED TO THE HM ALGORITHM
@@ -244,36 +236,54 @@ def check_mode(
         mode
         ):
 
-    if mode not in ['merge', 'split']:
-        sys.exit("MissingParameterError: please specify 'mode' as 'merge' or 'split'. Refer to section 4.5 of the manual.")
+    if mode not in ['merge', 'split', 'both']:
+        raise MissingParameterError("please specify 'mode' as 'merge', 'split', or 'both'. Refer to section 4.5 of the manual.")
 
 # check if the gdi threshold is correctly specified
 def check_gdi_threshold(
-        gdi_thresh, # user input, either of the form '<0.7, <=0.5', or 'None'
-        mode        # merge or split, used to check if the direction of comparison matches the analysis type
-        ):          # -> function returns a list of two strings representing the thresholds, e.g. ['<0.7', '<=0.5'] or ['>0.2', '>0.3']
+        gdi_thresh,     # user input, either of the form '<0.7, <=0.5', or 'None'
+        mode,           # merge or split, used to check if the direction of comparison matches the analysis type
+        announce=True,  # print a message if gdi estimation mode is activated
+        ):              # -> function returns a list of two strings representing the thresholds, e.g. ['<0.7', '<=0.5'] or ['>0.2', '>0.3']
     
     # user must specify a gdi threshold   
     if gdi_thresh == None:
-        sys.exit("MissingParameterError: 'gdi_threshold' not specified. Refer to section 4.5 of the manual.")
+        raise MissingParameterError("'gdi_threshold' not specified. Refer to section 4.5 of the manual.")
+    
+    # when running both modes, the merge and split thresholds are separated by ';' (e.g. '<=0.2, <=0.2; >=0.7, >=0.7'), 
+    # and a dict of the two lists of thresholds is returned
+    elif mode == "both":
+        thresh = ["None", "None"] if gdi_thresh == "None" else [t.strip() for t in gdi_thresh.split(";")]
+        if len(thresh) != 2:
+            raise GdiParameterError(f"in 'both' mode, the 'gdi_threshold' is specified as the merge thresholds and the split thresholds separated by ';', e.g. '<=0.2, <=0.2; >=0.7, >=0.7', not '{gdi_thresh}'")
+        
+        thresholds = {'merge':check_gdi_threshold(thresh[0], "merge", False), 'split':check_gdi_threshold(thresh[1], "split", False)}
+
+        # the message is printed once for both searches
+        estimation_modes = [search_mode for search_mode, t in zip(['merge', 'split'], thresh) if t == "None"]
+        if len(estimation_modes) > 0 and announce:
+            print(f"Activating gdi estimation mode. All {' and '.join(estimation_modes)} proposals will be automatically accepted!\n")
+
+        return thresholds
     
     elif gdi_thresh == "None":
-        print(f"Activating gdi estimation mode. All {mode} proposals will be automatically accepted!\n")
+        if announce:
+            print(f"Activating gdi estimation mode. All {mode} proposals will be automatically accepted!\n")
         return ["<=1.0", "<=1.0"] # this return means that all proposals will be accepted, as gdi values by definition lie between 0 and 1. 
     
     else:
         # check correct syntax
         if not bool(re.fullmatch("(<={1}|>={1}|>{1}|<{1})[01]{1}[.\d]+[,]{1}[\s]*(<={1}|>={1}|>{1}|<{1})[01]{1}[.\d]+", gdi_thresh)):
             if bool(re.fullmatch("(<={1}|>={1}|>{1}|<{1})\s*[01]{1}[.\d]+[,]{1}[\s]*(<={1}|>={1}|>{1}|<{1})\s*[01]{1}[.\d]+", gdi_thresh)):
-                sys.exit(f"GdiParameterError: 'gdi_threshold' incorrectly specified as '{gdi_thresh}'. \nRemove whitespace between threshold value and direction. For example, change '<= 0.7' to '<=0.7' or change '> 0.2' to '>0.2'")
+                raise GdiParameterError(f"'gdi_threshold' incorrectly specified as '{gdi_thresh}'. \nRemove whitespace between threshold value and direction. For example, change '<= 0.7' to '<=0.7' or change '> 0.2' to '>0.2'")
             else:
-                sys.exit(f"GdiParameterError: 'gdi_threshold' incorrectly specified as '{gdi_thresh}'. \nRefer to section 4.5 of the manual for further detail on how to specify thresholds.")
+                raise GdiParameterError(f"'gdi_threshold' incorrectly specified as '{gdi_thresh}'. \nRefer to section 4.5 of the manual for further detail on how to specify thresholds.")
 
         elif mode == "merge" and not bool(re.fullmatch("(<={1}|<{1})[01]{1}[.\d]+[,]{1}[\s]*(<={1}|<{1})[01]{1}[.\d]+", gdi_thresh)):
-            sys.exit(f"GdiParameterError: in merge mode, the 'gdi_threshold' is an upper bound. Specify relations as '<=' or '<' {gdi_thresh}'")
+            raise GdiParameterError(f"in merge mode, the 'gdi_threshold' is an upper bound. Specify relations as '<=' or '<' {gdi_thresh}'")
         
         elif mode == "split" and not bool(re.fullmatch("(>={1}|>{1})[01]{1}[.\d]+[,]{1}[\s]*(>={1}|>{1})[01]{1}[.\d]+", gdi_thresh)):
-            sys.exit(f"GdiParameterError: in merge mode, the 'gdi_threshold' is a lower bound. Specify relations as '>=' or '>' instead of '{gdi_thresh}'")
+            raise GdiParameterError(f"in merge mode, the 'gdi_threshold' is a lower bound. Specify relations as '>=' or '>' instead of '{gdi_thresh}'")
 
         # attempt to parse
         thresh = str(gdi_thresh).split(",")
@@ -283,7 +293,7 @@ def check_gdi_threshold(
         thresh_values = [re.sub('(<={1}|>={1}|>{1}|<{1})\s*', "", t) for t in thresh]
         for val in thresh_values:
             if not check_numeric(val, "0.0<=x<=1.0", "f"):
-                sys.exit(f"GdiParameterError: the threshold '{val}' is outside the allowed range of [0,1]")
+                raise GdiParameterError(f"the threshold '{val}' is outside the allowed range of [0,1]")
         
         return thresh
 
@@ -300,22 +310,22 @@ def check_migration_newick_compatibility(
 
     # check that there are no duplicates
     if any(mig_df.duplicated()):
-        sys.exit("MigrationParameterError: same migration event specified more than once")
+        raise MigrationParameterError("same migration event specified more than once")
                 
     # check if any of the migration events lack a source or destination
     missing_values_df = source_dest_df[source_dest_df.isnull().any(axis=1)]
     if len(missing_values_df["source"]) > 0:
-        sys.exit(f"MigrationParameterError: the following migration events lack a source and/or destination:\n{missing_values_df.to_string()}")
+        raise MigrationParameterError(f"the following migration events lack a source and/or destination:\n{missing_values_df.to_string()}")
 
     # check that the source and destination nodes are never identical
     if not (source_dest_df['source'] != source_dest_df['destination']).all():
-        sys.exit("MigrationParameterError: source and destination cannot be identical for a migration event")
+        raise MigrationParameterError("source and destination cannot be identical for a migration event")
                 
     # check if all of the values correspond to known populations
     all_known_populations = get_all_populations(tree_newick)
     unknown_names_df = source_dest_df[source_dest_df[source_dest_df.isin(all_known_populations)].isnull().any(axis=1)]
     if len(unknown_names_df["source"]) > 0:
-        sys.exit(f"MigrationParameterError: the following migration events have a source and/or destination population that is not found in the guide tree:\n{unknown_names_df.to_string()}")
+        raise MigrationParameterError(f"the following migration events have a source and/or destination population that is not found in the guide tree:\n{unknown_names_df.to_string()}")
 
     
     # check that no migration events occur between descendants 
@@ -328,7 +338,7 @@ def check_migration_newick_compatibility(
         source_node = tree.search_nodes(name = source_name)[0]; dest_node = tree.search_nodes(name = dest_name)[0]
         source_ancestors = source_node.iter_ancestors(); dest_ancestors = dest_node.iter_ancestors();
         if (source_node in dest_ancestors) or (dest_node in source_ancestors):
-            sys.exit(f"MigrationParameterError: migration from '{source_name}' to '{dest_name}' not possible, as one is a descendant of the other.")
+            raise MigrationParameterError(f"migration from '{source_name}' to '{dest_name}' not possible, as one is a descendant of the other.")
 
 
 # check that the migration parameter has a valud value
@@ -341,19 +351,19 @@ def check_migration(
     # no migration
     if   migration == None:
         if wprior != None:
-            sys.exit("MigrationParameterError: 'wprior' specified, but migration pattern was not.\nRemove wprior to analyse without migration, or specify migration patterns.")
+            raise MigrationParameterError("'wprior' specified, but migration pattern was not.\nRemove wprior to analyse without migration, or specify migration patterns.")
         mig = None
     
     # specified migration
     elif migration[0] == "{" and migration[-1] == "}":
         if wprior == None:
-            sys.exit("MigrationParameterError: migration pattern was specified, but 'wprior' was not. Please specify a prior value for migration rates.")
+            raise MigrationParameterError("migration pattern was specified, but 'wprior' was not. Please specify a prior value for migration rates.")
 
         mig = read_specified_mig_pattern(migration)
         check_migration_newick_compatibility(mig, guide_tree)
 
     else:
-        sys.exit("MigrationParameterError: migration parameter incorrectly formatted. Refer to section 4.4 of the manual.")
+        raise MigrationParameterError("migration parameter incorrectly formatted. Refer to section 4.4 of the manual.")
 
     return mig
 
@@ -412,3 +422,26 @@ def check_migration(
 #     # 'age_&_one_gdi' can only be used as a criteria, if both a mutation rate, and a generation threshold are specified
 #     elif criteria == 'gdi_and_generations' and (mrate_status == None or gen_thresh_status == None):
 #         sys.exit("Error: 'decision_criteria' is 'age_&_one_gdi' but 'mrate' and/or 'generation_threshold are not specifed.\nspecift 'mrate' and 'generation_threshold' or change criteria")
+
+# check the number of gdi replicates sampled when profiling the stages of the analysis
+def check_profile(
+        profile
+        ):          # -> function returns the number of replicates as an int, or None if profiling is not requested
+
+    if profile == None:
+        return None
+
+    if not check_numeric(profile, "0<x<=1000", "i"):
+        raise ParameterFormattingError(f"'profile' must be the number of gdi replicates to profile (1-1000), not '{profile}'.")
+
+    return int(profile)
+
+# check the compression of the mcmc files of the iterations
+def check_compress_mcmc(
+        compress_mcmc
+        ):
+
+    if compress_mcmc != None:
+        if compress_mcmc not in ['gz', 'zst']:
+            raise ParameterFormattingError(f"'compress_mcmc' must be 'gz' or 'zst', not '{compress_mcmc}'.")
+        check_compression_available(compress_mcmc)
@@ -2,24 +2,25 @@
 UNCTIONS REQUIRED FOR INTERACTING WITH THE PROGRAM FROM THE COMMAND LINE
 '''
 
-import os
 from pathlib import Path
-from pathlib import PurePath
 import sys
-import multiprocessing
+from typing import Dict, Optional
 
 from .customtypehints import Cfile, CfileParam
-from .module_helper import stripall, check_bpp_executable
+from .module_helper import stripall, check_bpp_executable, check_numeric
+from .module_profile import PROFILED_REPLICATES
+from .module_scheduler import available_cores
+from .module_exceptions import ArgumentError, FilePathError, MissingControlFileError, MissingManifestError, ParameterOverrideError
 
 
-# move to the directory where the pipeline is located.
+# get the absolute path of the control file
 def resolve_cf_file(
         filepath: Cfile
-        ):
+        ) ->      Path:
 
     '''
-    Moving to the working directory is crucial, as filepaths in the control file are interpreted relative to
-    the working directory. Output from the pipeline will also be located in the working directory.
+    The location of the control file is crucial, as filepaths in the control file are interpreted relative to
+    the directory of the control file. Output from the pipeline will also be located relative to this directory.
     '''
 
     # check if the path provided exists
@@ -27,20 +28,16 @@ def resolve_cf_file(
         cf_filepath = Path(filepath)
         cf_filepath = cf_filepath.resolve(strict=True)
     except:
-        sys.exit(f"FilePathError: file path '{filepath}' of control file could not be resolved.")
+        raise FilePathError(f"file path '{filepath}' of control file could not be resolved.")
 
-    # check the directory where the cf is supposed to be located, and move in if possible
-    try: 
-        cf_directory = PurePath(cf_filepath).parent
-        os.chdir(cf_directory)
-    except:
-        sys.exit(f"FilePathError: could not access requested folder of control file located at: '{filepath}'.")
+    # check the directory where the cf is supposed to be located
+    if not cf_filepath.parent.is_dir():
+        raise FilePathError(f"could not access requested folder of control file located at: '{filepath}'.")
     
-    try:
-        cf_filename = PurePath(cf_filepath).name
-        return cf_filename
-    except:
-        sys.exit(f"MissingControlFileError: no control file present at file present at: '{filepath}'")
+    if not cf_filepath.is_file():
+        raise MissingControlFileError(f"no control file present at file present at: '{filepath}'")
+
+    return cf_filepath
 
 
 # used to separate command line arguments into categories
@@ -62,7 +59,7 @@ def categorise_arguments(
         ):
     
     # separate commands into categories
-    argument_categories = list(group(argument_list, ['--cfile','--cfpor']))[1:]
+    argument_categories = list(group(argument_list, ['--cfile','--cfpor','--batch','--cores','--cache','--validate','--profile']))[1:]
     # get the string of the parameters in a non-empty category
     argument_categories = {cat[0]:" ".join(cat[1:]) for cat in argument_categories if len(cat) > 1 } 
 
@@ -77,10 +74,45 @@ def interpret_parameter_override(
     try:
         cf_ovveride_dict = {stripall(arg.split("=")[0]):stripall(arg.split("=")[1]) for arg in args_to_override}
     except:
-        sys.exit(f"ParameterOverrideError: --cfpor argument '{argument}' used incorrect syntax")
+        raise ParameterOverrideError(f"--cfpor argument '{argument}' used incorrect syntax")
 
     return cf_ovveride_dict
 
+def batch_cmdline_init(
+        argument_list
+        ) -> Optional[Dict]:
+
+    '''
+    Interpret the arguments of a batch run ('--batch manifest [--cores n] [--cache folder] [--validate]').
+    Returns None if hhsd was not started in batch mode.
+    '''
+
+    arguments_dict = categorise_arguments(argument_list[1:])
+    if "--batch" not in argument_list:
+        return None
+
+    if "--batch" not in arguments_dict:
+        raise MissingManifestError("please specify the batch manifest as '--batch name_of_manifest'")
+    if "--cfile" in arguments_dict:
+        raise ArgumentError("'--cfile' cannot be combined with '--batch'. List the control files in the manifest.")
+
+    try:
+        manifest = Path(arguments_dict['--batch']).resolve(strict=True)
+    except:
+        raise FilePathError(f"file path '{arguments_dict['--batch']}' of batch manifest could not be resolved.")
+
+    n_cores = available_cores()
+    if "--cores" in arguments_dict:
+        if not check_numeric(arguments_dict['--cores'], "0<x<=100000", "i"):
+            raise ArgumentError(f"'--cores' must be a positive integer, not '{arguments_dict['--cores']}'.")
+        n_cores = int(arguments_dict['--cores'])
+
+    cache_directory = manifest.parent / "hhsd_cache"
+    if "--cache" in arguments_dict:
+        cache_directory = Path(arguments_dict['--cache']).resolve()
+
+    return {'manifest':manifest, 'n_cores':n_cores, 'cache_directory':cache_directory}
+
 ## FINAL WRAPPER FUNCTION
 def cmdline_init(
         argument_list
@@ -91,14 +123,14 @@ def cmdline_init(
 
     # load splash text if no arguments are provided
     if len(arguments_dict) == 0 and "--cfile" not in argument_list:
-        bpp_present = check_bpp_executable()  # check that the bundled bpp executable is present
-        sys.exit(f"hhsd version 1.1.0\n{bpp_present}\n{multiprocessing.cpu_count()} cores available\nspecify control file for analysis with --cfile")
+        bpp_present = check_bpp_executable()  # check that the bpp executable is present
+        sys.exit(f"hhsd version 1.1.0\n{bpp_present}\n{available_cores()} cores available\nspecify control file for analysis with --cfile, or a manifest of control files with --batch\nadd --validate to check the control files and estimate the resources needed, without running the analysis\nadd --profile to write cProfile statistics of the stages of the analysis to the iteration folders")
 
     # check that the control file is specified
     if "--cfile" not in arguments_dict:
-        sys.exit("MissingControlFileError: please specify control file as '--cfile name_of_control_file'")
+        raise MissingControlFileError("please specify control file as '--cfile name_of_control_file'")
     cf_path = arguments_dict['--cfile']
-    cf_path:Cfile = resolve_cf_file(cf_path) # move to the directory where the cf is located
+    cf_path:Path = resolve_cf_file(cf_path) # paths in the cf are relative to the directory where the cf is located
 
     print("\n< Checking control file arguments... >\n")
 
@@ -111,4 +143,8 @@ def cmdline_init(
     else:
         cf_override_dict = None
 
+    # '--profile [replicates]' is the same as setting the 'profile' parameter
+    if "--profile" in argument_list:
+        cf_override_dict = dict(cf_override_dict or {}, profile=arguments_dict.get('--profile', str(PROFILED_REPLICATES)))
+
     return cf_path, cf_override_dict
\ No newline at end of file
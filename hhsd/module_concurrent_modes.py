@@ -0,0 +1,129 @@
+'''
+RUNNING THE MERGE AND SPLIT ALGORITHMS CONCURRENTLY ON THE SAME DATA ('mode = both')
+
+The two searches run in separate threads of the same process. They share the parsed alignment, the bpp parameters
+(including the automatically inferred priors), and the bpp result cache, so a delimitation evaluated by both searches
+is only analysed by bpp once. Unless a cache is already set up (e.g. by a batch run), the cache is a temporary folder
+of the output directory, which is only used by this analysis, and deleted when it ends. The files of each search are written to its own folder ('merge' and 'split')
+in the output directory, and the screen output of each search is logged to 'hhsd_<mode>.log' in that folder.
+'''
+
+import contextvars
+import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Optional
+
+from .customtypehints import AlgoMode, CfileParam, BppCfileParam
+from .module_ete3 import Tree
+from .module_HA import HA_iteration, check_contintue, set_starting_state
+from .module_tree import get_attribute_filtered_tree, get_current_leaf_species, get_iteration, get_species_tree_display
+from .module_cache import get_cache_directory, scoped_cache_directory
+from .module_helper import thread_output
+from .module_profile import RunProfile, get_profile, profiling
+
+
+def run_search(
+        tree:       Tree,
+        bpp_ctl:    BppCfileParam,
+        cf:         CfileParam,
+        mode:       AlgoMode,
+        output_dir: Path,
+        stop:       threading.Event,
+        profile:    Optional[RunProfile] = None,
+        ) ->        Tree:
+
+    '''
+    Run the iterations of a single merge or split search, writing its files to the folder 'mode' of the output directory.
+    The stages of the search are recorded into the 'profile' of the analysis.
+    '''
+
+    # parameters of the search, with the gdi thresholds of the given mode
+    search_cf = dict(cf, mode=mode, gdi_threshold=cf['gdi_threshold'][mode])
+
+    search_dir = os.path.join(output_dir, mode)
+    os.mkdir(search_dir)
+    with open(os.path.join(search_dir, f"hhsd_{mode}.log"), 'w') as log, thread_output(log), profiling(profile):
+        try:
+            tree = set_starting_state(tree, mode)
+            while not stop.is_set():
+                tree = HA_iteration(tree, bpp_ctl, search_cf, output_dir=search_dir)
+                if not check_contintue(tree, search_cf):
+                    break
+        except BaseException:
+            # stop the other search, as the analysis cannot be completed
+            stop.set()
+            raise
+
+    return tree
+
+
+def print_combined_report(
+        trees:      Dict[AlgoMode, Tree],
+        output_dir: Path,
+        ) ->        None: # prints to screen, and writes file
+
+    '''
+    Print the final delimitations of the merge and split searches side by side, and write them to 'combined_report.txt'.
+    '''
+
+    lines = []
+    for mode, tree in trees.items():
+        species = get_current_leaf_species(tree)
+        lines.append(f"> {mode} analysis: {len(species)} species after {get_iteration(tree)} iterations")
+        lines.append(str(species)[1:-1])
+        lines.append(get_attribute_filtered_tree(tree, "species"))
+        lines.append("")
+
+    if set(get_current_leaf_species(trees['merge'])) == set(get_current_leaf_species(trees['split'])):
+        lines.append("The merge and split analyses reached the same delimitation.")
+    else:
+        lines.append("The merge and split analyses reached different delimitations.")
+
+    with open(os.path.join(output_dir, "combined_report.txt"), 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+    print("\n< Combined results of merge and split analyses >\n")
+    for mode, tree in trees.items():
+        print(f"> {mode} analysis: {len(get_current_leaf_species(tree))} species after {get_iteration(tree)} iterations")
+        print(str(get_current_leaf_species(tree))[1:-1])
+        print(get_species_tree_display(tree))
+        print()
+    print(lines[-1])
+
+
+## FINAL WRAPPER FUNCTION
+def run_both_modes(
+        tree:       Tree,
+        bpp_ctl:    BppCfileParam,
+        cf:         CfileParam,
+        output_dir: Path,
+        ) ->        Dict[AlgoMode, Tree]:
+
+    '''
+    Run the merge and the split algorithm concurrently, starting from the same guide tree, and return the final tree of each.
+    '''
+
+    # share bpp results between the two searches (in the cache set up by a batch run, or in a temporary cache)
+    temporary_cache = get_cache_directory() == None
+    cache_directory = os.path.join(output_dir, "shared_cache") if temporary_cache else get_cache_directory()
+
+    print("\n< Running merge and split analyses concurrently >\n")
+    print("Progress of each analysis is logged to 'merge/hhsd_merge.log' and 'split/hhsd_split.log'")
+
+    stop = threading.Event()
+    trees = {}
+
+    with scoped_cache_directory(cache_directory, remove=temporary_cache), ThreadPoolExecutor(max_workers=2) as executor:
+        # each search runs in a copy of the current context, which holds the cache directory
+        futures = {executor.submit(contextvars.copy_context().run, run_search, copy.deepcopy(tree), bpp_ctl, cf, mode, output_dir, stop, get_profile()):mode for mode in ['merge', 'split']}
+        for future in as_completed(futures):
+            trees[futures[future]] = future.result()
+            print(f"> {futures[future]} analysis finished after {get_iteration(trees[futures[future]])} iterations")
+
+    trees = {mode:trees[mode] for mode in ['merge', 'split']}
+    print_combined_report(trees, output_dir)
+
+    return trees
@@ -241,9 +241,14 @@ def read_newick(newick, root_node=None, format=0, quoted_names=False):
     if isinstance(newick, str):
 
         nw = newick
-        matcher = compile_matchers(formatcode=format)
         nw = nw.strip()
 
+        # most trees can be read by the fast parser, which falls back to the general parser otherwise
+        if not quoted_names and _read_simple_newick(nw, root_node, format) is not None:
+            return root_node
+
+        matcher = compile_matchers(formatcode=format)
+
         if not nw.startswith('(') and nw.endswith(';'):
             return _read_newick_from_string(nw, root_node, matcher, format, quoted_names)
         elif not nw.startswith('(') or not nw.endswith(';'):
@@ -254,6 +259,120 @@ def read_newick(newick, root_node=None, format=0, quoted_names=False):
     else:
         raise NewickError("'newick' argument must be either a filename or a newick string.")
 
+_SIMPLE_NEWICK_SPLIT_RE = re.compile(r"([(),;])")
+_SIMPLE_FLOAT_RE = re.compile("^" + _FLOAT_RE + "$")
+
+def _convert_simple_field(text, container, converter, optional):
+    """ Interpret a name or branch length field for the fast newick parser.
+    Returns (container, value), (None, None) if the field is empty, or
+    raises ValueError if the general parser is needed. """
+    if text is None or text == '':
+        if container is not None and not optional:
+            raise ValueError(text)
+        return None, None
+    if container is None:
+        raise ValueError(text)
+    if converter == float:
+        if not _SIMPLE_FLOAT_RE.match(text):
+            raise ValueError(text)
+        return container, float(text)
+    return container, converter(text)
+
+def _read_simple_newick(nw, root_node, formatcode):
+    """ Fast parser for plain newick strings (no quoted names, comments or
+    NHX data), as used by hhsd. The string is tokenized with a single split,
+    and the nodes are only created once the whole string has been read, so
+    that None can be returned (leaving 'root_node' untouched) whenever the
+    string needs the general parser, which also produces the error messages.
+    """
+    if formatcode not in NW_FORMAT or '[' in nw or '"' in nw or "'" in nw:
+        return None
+    if not nw.startswith('(') or not nw.endswith(';') or nw.count('(') != nw.count(')'):
+        return None
+
+    nw = re.sub("[\n\r\t]+", "", nw)
+    leaf_format = NW_FORMAT[formatcode][0:2]
+    internal_format = NW_FORMAT[formatcode][2:4]
+
+    # parent of each node (in preorder), and the text of its label
+    parents = [-1]
+    labels = [None]
+    current = None      # the node whose children are being read
+    closed = None       # the last closed node, which may be followed by its label
+    expect_leaf = False
+    for token in _SIMPLE_NEWICK_SPLIT_RE.split(nw):
+        if token == '(':
+            if current is None:
+                current = 0
+            else:
+                parents.append(current); labels.append(None)
+                current = len(parents) - 1
+            expect_leaf = True; closed = None
+        elif token == ',' or token == ')' or token == ';':
+            # leaves always have a label, which is read before the following ',' or ')'
+            if expect_leaf or (token != ';' and current is None):
+                return None
+            closed = None
+            if token == ',':
+                expect_leaf = True
+            elif token == ')':
+                closed = current; current = parents[current] if parents[current] != -1 else None
+        else:
+            label = token.strip()
+            if label == '':
+                continue
+            if expect_leaf:
+                parents.append(current); labels.append(('leaf', label))
+                expect_leaf = False
+            elif closed is not None:
+                labels[closed] = ('internal', label)
+                closed = None
+            else:
+                return None
+
+    # interpret the labels of the nodes according to the format
+    features = []
+    try:
+        for label in labels:
+            if label is None:
+                features.append([])
+                continue
+            node_format = leaf_format if label[0] == 'leaf' else internal_format
+            fields = label[1].split(":")
+            if len(fields) > 2:
+                return None
+            first = fields[0].strip()
+            second = fields[1].strip() if len(fields) == 2 else None
+            if label[0] == 'leaf' and first == '':
+                return None
+            node_features = []
+            # the name (or support) of internal nodes is optional in flexible formats, as is the branch length
+            optional = [node_format[0][2] and label[0] == 'internal', node_format[1][2]]
+            for text, (container, converter, flexible), is_optional in zip([first, second], node_format, optional):
+                container, value = _convert_simple_field(text, container, converter, is_optional)
+                if container is not None:
+                    node_features.append((container, value))
+            features.append(node_features)
+    except ValueError:
+        return None
+
+    for container, value in features[0]:
+        root_node.add_feature(container, value)
+
+    # the new nodes are created directly, rather than through the constructor, as this dominates the time taken
+    node_class = root_node.__class__
+    store = root_node._store
+    nodes = [root_node]
+    for parent, node_features in zip(parents[1:], features[1:]):
+        values = {"dist":DEFAULT_DIST, "support":DEFAULT_SUPPORT, "name":DEFAULT_NAME}
+        values.update(node_features)
+        node = node_class.__new__(node_class)
+        node.__setstate__(([], nodes[parent], values["dist"], values["support"], set(["dist", "support", "name"]), values["name"], store, store.add_node()))
+        nodes[parent]._children.append(node)
+        nodes.append(node)
+
+    return root_node
+
 def _read_newick_from_string(nw, root_node, matcher, formatcode, quoted_names):
     """ Reads a newick string in the New Hampshire format. """
 
@@ -515,6 +634,84 @@ class TreeError(Exception):
     def __str__(self):
         return repr(self.value)
 
+class FeatureStore(object):
+    """
+    Columnar storage of the features of the nodes of a tree, other than
+    their name, branch length and support. Nodes hold their position in
+    the store, and each feature is a column mapping the positions of
+    the nodes that have it to their values. Features that are only set
+    on some of the nodes (e.g. 'iteration' on the root) take no space on
+    the others, and copying a tree copies one dict per feature.
+    """
+
+    __slots__ = ("columns", "n_nodes")
+
+    def __init__(self):
+        self.columns = {}
+        self.n_nodes = 0
+
+    def add_node(self):
+        self.n_nodes += 1
+        return self.n_nodes - 1
+
+    def get(self, position, feature, default=None):
+        column = self.columns.get(feature)
+        if column is None:
+            return default
+        return column.get(position, default)
+
+    def set(self, position, feature, value):
+        column = self.columns.get(feature)
+        if column is None:
+            column = self.columns[feature] = {}
+        column[position] = value
+
+    def delete(self, position, feature):
+        try:
+            del self.columns[feature][position]
+        except KeyError:
+            raise AttributeError(feature)
+
+    def copy_positions(self, positions, memo):
+        """
+        Copy of the store with the features of the nodes at 'positions'
+        only (e.g. of the nodes of a subtree). The positions are kept.
+        """
+        new_store = FeatureStore()
+        for feature, column in self.columns.items():
+            values = {position:copy.deepcopy(column[position], memo) for position in positions if position in column}
+            if len(values) > 0:
+                new_store.columns[feature] = values
+        new_store.n_nodes = self.n_nodes
+        return new_store
+
+    def __deepcopy__(self, memo):
+        new_store = self.copy_positions(range(self.n_nodes), memo)
+        memo[id(self)] = new_store
+        return new_store
+
+
+class _StoredFeature(object):
+    """
+    Reads a feature of the node from the feature store. Frequently used
+    features are declared on the class, so reading them does not go
+    through the slower fallback of '__getattr__'.
+    """
+
+    __slots__ = ("feature",)
+
+    def __init__(self, feature):
+        self.feature = feature
+
+    def __get__(self, node, owner=None):
+        if node is None:
+            return self
+        column = node._store.columns.get(self.feature)
+        if column is not None and node._store_position in column:
+            return column[node._store_position]
+        raise AttributeError(self.feature)
+
+
 class TreeNode(object):
     """
     TreeNode (Tree) class is used to store a tree structure. A tree
@@ -601,15 +798,24 @@ class TreeNode(object):
     #: A list of children nodes
     children = property(fget=_get_children, fset=_set_children)
 
+    # attributes held by the node itself. All other features are held by
+    # the feature store, which is shared by the nodes created from the
+    # same tree (by 'add_child', or when reading a newick string)
+    __slots__ = ("_children", "_up", "_dist", "_support", "features",
+                 "name", "_store", "_store_position")
+    _NODE_ATTRIBUTES = frozenset(__slots__ + ("dist", "support", "up", "children"))
+
     def __init__(self, newick=None, format=0, dist=None, support=None,
-                 name=None, quoted_node_names=False):
-        self._children = []
-        self._up = None
-        self._dist = DEFAULT_DIST
-        self._support = DEFAULT_SUPPORT
-        self.features = set([])
+                 name=None, quoted_node_names=False, feature_store=None):
+        store = feature_store if feature_store is not None else FeatureStore()
+        object.__setattr__(self, "_store", store)
+        object.__setattr__(self, "_store_position", store.add_node())
+        object.__setattr__(self, "_children", [])
+        object.__setattr__(self, "_up", None)
+        object.__setattr__(self, "_dist", DEFAULT_DIST)
+        object.__setattr__(self, "_support", DEFAULT_SUPPORT)
         # Add basic features
-        self.features.update(["dist", "support", "name"])
+        object.__setattr__(self, "features", set(["dist", "support", "name"]))
         if dist is not None:
             self.dist = dist
         if support is not None:
@@ -624,6 +830,67 @@ class TreeNode(object):
                         quoted_names=quoted_node_names)
 
 
+    # features that are indexed by 'NodeIndex' when an index is attached to the tree
+    _INDEXED_FEATURES = frozenset(["name", "node_type", "species", "proposal", "leaf", "modified"])
+
+    def __setattr__(self, name, value):
+        # keep the index of the tree up to date when an indexed feature of the node changes
+        if name in TreeNode._INDEXED_FEATURES:
+            node_index = self._store.get(self._store_position, "_node_index")
+            if node_index is not None:
+                node_index.update(self, name, value)
+        if name in TreeNode._NODE_ATTRIBUTES:
+            object.__setattr__(self, name, value)
+        else:
+            self._store.set(self._store_position, name, value)
+
+    def __getattr__(self, name):
+        # only called for names that are not attributes of the node itself
+        if name not in TreeNode._NODE_ATTRIBUTES:
+            column = self._store.columns.get(name)
+            if column is not None and self._store_position in column:
+                return column[self._store_position]
+        raise AttributeError(name)
+
+    def __delattr__(self, name):
+        if name in TreeNode._NODE_ATTRIBUTES:
+            object.__delattr__(self, name)
+        else:
+            self._store.delete(self._store_position, name)
+
+    def __deepcopy__(self, memo):
+        # the subtree below the node is copied (as in ete3), without
+        # recursion, and the copy of the node is its root. Copies of all
+        # nodes exist before their features are copied, as features can
+        # refer to the nodes (e.g. the index of the tree)
+        nodes = list(self._iter_descendants_preorder())
+        for node in nodes:
+            memo[id(node)] = node.__class__.__new__(node.__class__)
+
+        # subtrees grafted with 'add_child' keep the store of their own
+        # tree, so the features of each node are copied from its store
+        positions = {}
+        for node in nodes:
+            positions.setdefault(id(node._store), (node._store, []))[1].append(node._store_position)
+        stores = {key:store.copy_positions(store_positions, memo) for key, (store, store_positions) in positions.items()}
+
+        for node in nodes:
+            memo[id(node)].__setstate__((
+                [memo[id(child)] for child in node._children],
+                memo[id(node._up)] if node is not self else None,
+                node._dist, node._support, set(node.features), node.name,
+                stores[id(node._store)], node._store_position))
+
+        return memo[id(self)]
+
+    # pickling goes through the attributes of the node, the store is pickled once per tree
+    def __getstate__(self):
+        return tuple(object.__getattribute__(self, attribute) for attribute in TreeNode.__slots__)
+
+    def __setstate__(self, state):
+        for attribute, value in zip(TreeNode.__slots__, state):
+            object.__setattr__(self, attribute, value)
+
     def __nonzero__(self):
         return True
 
@@ -717,7 +984,7 @@ class TreeNode(object):
 
         """
         if child is None:
-            child = self.__class__()
+            child = self.__class__(feature_store=self._store)
 
         if name is not None:
             child.name = name
@@ -1351,6 +1618,13 @@ class TreeNode(object):
           tree.search_nodes(dist=0.0, name="human")
 
         """
+        # search for a single indexed feature from the root using the index of the tree (returned in the same levelorder)
+        node_index = getattr(self, "_node_index", None)
+        if node_index is not None and self.up is None and len(conditions) == 1:
+            feature, value = next(iter(conditions.items()))
+            if feature in node_index.features:
+                return node_index.search(feature, value)
+
         matching_nodes = []
         for n in self.iter_search_nodes(**conditions):
             matching_nodes.append(n)
@@ -1690,6 +1964,10 @@ def _translate_nodes(root, *nodes):
     else:
         return valid_nodes
 
+# features of the populations set by hhsd, and the state of the analysis held by the root
+for _feature in ("node_type", "species", "proposal", "leaf", "modified", "tau", "theta", "iteration", "flat", "_node_index"):
+    setattr(TreeNode, _feature, _StoredFeature(_feature))
+
 # Alias
 #: .. currentmodule:: ete3
 Tree = TreeNode
\ No newline at end of file
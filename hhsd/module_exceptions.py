@@ -0,0 +1,55 @@
+'''
+EXCEPTIONS RAISED BY THE PIPELINE
+
+All errors of the pipeline derive from 'HhsdError', so programs embedding hhsd can handle them, while the command line
+interface prints the message and quits. The message is printed with the name of the error type as a prefix,
+e.g. "MissingParameterError: 'burnin' not specified."
+'''
+
+
+class HhsdError(Exception):
+    '''
+    Base class of all errors raised by hhsd
+    '''
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"{type(self).__name__}: {self.message}"
+
+
+## ERRORS IN THE COMMAND LINE ARGUMENTS AND CONTROL FILE
+class ArgumentError(HhsdError): pass
+class ControlFileError(HhsdError): pass
+class MissingControlFileError(HhsdError): pass
+class ParameterOverrideError(HhsdError): pass
+class ManifestFormattingError(HhsdError): pass
+class MissingManifestError(HhsdError): pass
+
+## ERRORS IN THE PARAMETERS
+class MissingParameterError(HhsdError): pass
+class ParameterFormattingError(HhsdError): pass
+class ParameterIncompatibilityError(HhsdError): pass
+class ResourceError(HhsdError): pass
+class PriorError(HhsdError): pass
+class AutoPriorError(HhsdError): pass
+class McmcParameterError(HhsdError): pass
+class LocusRateError(HhsdError): pass
+class GdiParameterError(HhsdError): pass
+class GuideTreeError(HhsdError): pass
+class MigrationParameterError(HhsdError): pass
+
+## ERRORS IN THE INPUT AND OUTPUT FILES
+class FilePathError(HhsdError): pass
+class MissingFileError(HhsdError): pass
+class ExistingFilesError(HhsdError): pass
+class InputDataError(HhsdError): pass
+class MissingDependencyError(HhsdError): pass
+
+## ERRORS OF BPP
+class BppError(HhsdError): pass
+class BppExecutableError(HhsdError): pass
+class BppOutputError(HhsdError): pass
+class UnsupportedPlatformError(HhsdError): pass
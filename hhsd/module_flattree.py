@@ -0,0 +1,333 @@
+'''
+ARRAY-BACKED REPRESENTATION OF THE GUIDE TREE, AND OF THE INDIVIDUALS MAPPED TO ITS POPULATIONS
+
+The topology of the guide tree does not change during the analysis, only the attributes of its populations
+(species status, proposals, etc.) do. The topology is therefore stored once as index arrays, with the populations
+numbered in preorder, and the individuals of the Imapfile as an array holding the index of their population.
+
+Filtered views of the tree (e.g. the currently accepted species) are boolean masks over the populations, so they
+can be computed without copying the tree. ete3 trees are only built when a view is printed, or handed to code
+that works on tree objects.
+
+The population nodes of the ete3 tree are also indexed by name and by the attributes of the delimitation,
+so that searching for nodes (e.g. 'tree.search_nodes(species=True)') does not traverse the tree. The index counts
+the changes of these attributes, so views derived from the state of the delimitation (masks, newick strings, lists of
+species) are only recomputed after the delimitation has changed.
+'''
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Set, Tuple
+
+import numpy as np
+
+from .customtypehints import AlgoMode, NodeName, NewickTree, ImapPopInd
+from .module_ete3 import Tree, TreeNode
+
+
+@dataclass(frozen=True)
+class Proposal:
+    '''
+    Merge or split proposal derived from the current species delimitation. 
+    'leaf_species' is the mask of the accepted species without descendant species, and 'pairs' holds the
+    populations whose species status is assessed in the iteration (in levelorder, as returned by 'search_nodes').
+    '''
+
+    mode:           AlgoMode
+    leaf_species:   np.ndarray
+    pairs:          List[Tuple[NodeName, NodeName]]
+
+
+class FlatTree:
+    '''
+    Topology of the guide tree, and the mapping of individuals to populations, as arrays indexed by population.
+    '''
+
+    def __init__(
+            self,
+            tree:           Tree,
+            imap_popind:    ImapPopInd,
+            ):
+
+        nodes = list(tree.traverse("preorder"))
+        node_index = {node:i for i, node in enumerate(nodes)}
+
+        # populations, numbered in preorder (so ancestors always have a lower index than their descendants)
+        self.names:     List[NodeName] = [node.name for node in nodes]
+        self.index:     Dict[NodeName, int] = {name:i for i, name in enumerate(self.names)}
+        self.parent:    np.ndarray = np.array([node_index[node.up] if node.up != None else -1 for node in nodes], dtype=np.int32)
+        self.children:  List[List[int]] = [[node_index[child] for child in node.children] for node in nodes]
+        self.is_leaf:   np.ndarray = np.array([len(node.children) == 0 for node in nodes], dtype=bool)
+
+        # individuals, ordered by the levelorder position of their population (and by the order in the Imapfile within populations)
+        levelorder = {node.name:i for i, node in enumerate(tree.traverse("levelorder"))}
+        self.levelorder: np.ndarray = np.array([levelorder[name] for name in self.names], dtype=np.int32)
+        pop_order = sorted(imap_popind, key=lambda pop_name: levelorder[pop_name])
+        self.ind_names: List[str] = [ind_name for pop_name in pop_order for ind_name in imap_popind[pop_name]]
+        self.ind_pop:   np.ndarray = np.array([self.index[pop_name] for pop_name in pop_order for _ in imap_popind[pop_name]], dtype=np.int32)
+
+        # population maps of previously seen delimitations (see 'target_populations'), shared by the copies of the tree
+        self.target_cache: Dict[bytes, np.ndarray] = {}
+        self.target_lock = threading.Lock()
+
+    # the topology is never modified, so copies of the tree share the same arrays
+    def __deepcopy__(self, memo):
+        return self
+
+    # locks cannot be pickled, so the cache is rebuilt after unpickling
+    def __getstate__(self):
+        return {key:value for key, value in self.__dict__.items() if key not in ['target_cache', 'target_lock']}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.target_cache = {}
+        self.target_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def kept_parent(
+            self,
+            mask:   np.ndarray,
+            ) ->    np.ndarray:
+
+        '''
+        For each population, get the closest ancestor retained by the mask (-1 if there is none).
+        '''
+
+        kept = np.full(len(self), -1, dtype=np.int32)
+        for i in range(1, len(self)):
+            parent = self.parent[i]
+            kept[i] = parent if mask[parent] else kept[parent]
+
+        return kept
+
+    def kept_children(
+            self,
+            mask:   np.ndarray,
+            ) ->    List[List[int]]:
+
+        '''
+        Get the children of each population in the tree pruned to the populations retained by the mask.
+        The root of the tree is always retained, consistent with 'TreeNode.prune'.
+        '''
+
+        mask = mask.copy(); mask[0] = True
+        kept_parent = self.kept_parent(mask)
+        children = [[] for _ in range(len(self))]
+        for i in np.flatnonzero(mask)[1:]:
+            children[kept_parent[i]].append(int(i))
+
+        return children
+
+    def leaf_names(
+            self,
+            mask:   np.ndarray,
+            ) ->    List[NodeName]:
+
+        '''
+        Get the names of the leaves of the pruned tree, in preorder.
+        '''
+
+        children = self.kept_children(mask)
+        mask = mask.copy(); mask[0] = True
+
+        return [self.names[i] for i in np.flatnonzero(mask) if len(children[i]) == 0]
+
+    def newick(
+            self,
+            mask:   np.ndarray,
+            ) ->    NewickTree:
+
+        '''
+        Write the pruned tree in newick format, with only the leaves named (equivalent to ete3 format 9).
+        '''
+
+        children = self.kept_children(mask)
+
+        # iterative writer, so that deep trees do not hit the recursion limit. The stack holds nodes, and the brackets and commas between them
+        parts = []
+        stack = [0]
+        while len(stack) > 0:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+            elif len(children[item]) == 0:
+                parts.append(self.names[item])
+            else:
+                parts.append("(")
+                stack.append(")")
+                for count, child in enumerate(reversed(children[item])):
+                    if count > 0:
+                        stack.append(",")
+                    stack.append(child)
+
+        return "".join(parts) + ";"
+
+    def to_ete3(
+            self,
+            tree:   Tree,
+            mask:   np.ndarray,
+            ) ->    Tree:
+
+        '''
+        Build the pruned tree as a new ete3 tree, with the attributes of the populations in 'tree'.
+        '''
+
+        nodes = list(tree.traverse("preorder"))
+        children = self.kept_children(mask)
+
+        new_nodes = {0:Tree()}
+        # nodes are created in preorder, so the parent of each node already exists
+        stack = [0]
+        while len(stack) > 0:
+            i = stack.pop()
+            new_nodes[i].add_features(**{feature:getattr(nodes[i], feature) for feature in nodes[i].features})
+            for child in children[i]:
+                new_nodes[child] = new_nodes[i].add_child()
+            stack.extend(reversed(children[i]))
+
+        return new_nodes[0]
+
+    def propose(
+            self,
+            species:    np.ndarray,
+            mode:       AlgoMode,
+            ) ->        Proposal:
+
+        '''
+        Get the merge or split proposal for the delimitation where the populations in the mask 'species' are accepted as species.
+        - in merge mode, sister populations that are both leaf species are proposed to be merged.
+        - in split mode, the two child populations of each leaf species are proposed to be split.
+        '''
+
+        # single postorder pass (descendants have a larger index than their ancestors), marking the populations with species below them
+        species_below = np.zeros(len(self), dtype=bool)
+        for i in range(len(self) - 1, 0, -1):
+            if species[i] or species_below[i]:
+                species_below[self.parent[i]] = True
+        leaf_species = species & ~species_below
+
+        pairs = set()
+        for i in np.flatnonzero(leaf_species):
+            if   mode == 'merge' and i != 0:
+                candidates = self.children[self.parent[i]][0:2]
+                if len(candidates) == 2 and leaf_species[candidates].all():
+                    pairs.add(tuple(candidates))
+            elif mode == 'split':
+                candidates = self.children[i][0:2]
+                if len(candidates) == 2:
+                    pairs.add(tuple(candidates))
+
+        pairs = sorted(pairs, key=lambda pair: self.levelorder[pair[0]])
+        leaf_species.setflags(write=False)
+
+        return Proposal(mode, leaf_species, [(self.names[pair[0]], self.names[pair[1]]) for pair in pairs])
+
+    def target_populations(
+            self,
+            stop:   np.ndarray,
+            ) ->    np.ndarray:
+
+        '''
+        For each population, get the population itself if 'stop' is true for it, and its closest ancestor where 'stop' is true otherwise.
+        '''
+
+        # the map only depends on the mask, so it is computed once for each delimitation
+        key = stop.tobytes()
+        with self.target_lock:
+            target = self.target_cache.get(key)
+        if target is not None:
+            return target
+
+        target = np.arange(len(self), dtype=np.int32)
+        for i in range(1, len(self)):
+            if not stop[i]:
+                target[i] = target[self.parent[i]]
+        target.setflags(write=False)
+
+        # copies of the tree are used from concurrent searches (e.g. in 'mode = both')
+        with self.target_lock:
+            if len(self.target_cache) >= 64:
+                self.target_cache.clear()
+            self.target_cache[key] = target
+
+        return target
+
+
+# marks attributes that are not set on a node
+_MISSING = object()
+
+class NodeIndex:
+    '''
+    Index of the nodes of a tree by name and by the attributes of the delimitation. 
+    Nodes attached to the index report changes of these attributes, so the index is updated incrementally.
+    Every change increments 'version', and discards the views computed from the previous state of the tree.
+    '''
+
+    features = TreeNode._INDEXED_FEATURES
+
+    def __init__(
+            self,
+            tree:   Tree,
+            ):
+
+        nodes = list(tree.traverse("levelorder"))
+
+        # position of the nodes in levelorder, which is the order in which 'search_nodes' returns them
+        self.order:         Dict[TreeNode, int] = {node:i for i, node in enumerate(nodes)}
+        self.by_feature:    Dict[str, Dict[Any, Set[TreeNode]]] = {feature:{} for feature in self.features}
+
+        # state of the indexed attributes, and the views computed from it
+        self.version:       int = 0
+        self.views:         Dict[Hashable, Any] = {}
+
+        for node in nodes:
+            for feature in self.features:
+                value = getattr(node, feature, _MISSING)
+                if value is not _MISSING:
+                    self.by_feature[feature].setdefault(value, set()).add(node)
+            node._node_index = self
+
+    def update(
+            self,
+            node:       TreeNode,
+            feature:    str,
+            value:      Any,
+            ) ->        None:
+
+        values = self.by_feature[feature]
+        current = getattr(node, feature, _MISSING)
+        if current is not _MISSING:
+            # setting an attribute to its current value does not change the state of the tree
+            if current is value:
+                return
+            values[current].discard(node)
+        values.setdefault(value, set()).add(node)
+
+        self.version += 1
+        if len(self.views) > 0:
+            self.views.clear()
+
+    def search(
+            self,
+            feature:    str,
+            value:      Any,
+            ) ->        List[TreeNode]:
+
+        return sorted(self.by_feature[feature].get(value, ()), key=self.order.__getitem__)
+
+    def view(
+            self,
+            key:        Hashable,
+            compute:    Callable[[], Any],
+            ) ->        Any:
+
+        '''
+        Get the view 'key' of the current state of the tree, computing it only if it was not requested since the last change.
+        '''
+
+        if key not in self.views:
+            self.views[key] = compute()
+
+        return self.views[key]
@@ -3,25 +3,30 @@ EVALUATION OF AND IMPLEMENTATION OF
 PROPOSED CHANGES TO THE SPECIES DELIMITAITON
 '''
 
+import os
+
 import pandas as pd
 import numpy as np
 from typing import Dict, Literal
 
 from .customtypehints import AlgoMode, CfileParam, NodeName, MigrationRates
 from .module_ete3 import Tree, TreeNode
-from .module_tree import get_node_pairs_to_modify, get_attribute_filtered_tree, get_current_leaf_species, get_iteration, get_attribute_filtered_imap
+from .module_tree import get_node_pairs_to_modify, get_attribute_filtered_tree, get_current_leaf_species, get_iteration, get_attribute_filtered_imap, get_species_tree_display
 from .module_helper import flatten, check_numeric
 from .module_migration import check_migration_reciprocal
 from .module_gdi_numeric import get_pg1a_numerical
 from .module_gdi_simulate import get_pg1a_from_sim
 from .module_msa_imap import imapfile_write
 from .module_bpp_readres import MSCNumericParamEstimates, NumericParam
+from .module_cache import pg1a_key, load_pg1a, store_pg1a
+from .module_profile import stage
 
 
 def get_gdi_values(
         tree:           Tree, 
         numeric_param:  MSCNumericParamEstimates,
         mode:           AlgoMode,
+        work_dir:       str = ".",
         ) ->            Dict[NodeName, NumericParam]:
 
     '''
@@ -30,6 +35,7 @@ def get_gdi_values(
     tree is the tree datastructure holding the species delimitation
     numeric_param holds the results of the MCMC on the MSC model
     mode is the mode of the algorithm, either 'merge' or 'split'
+    work_dir is the folder of the iteration, where gene tree simulations are run
     '''
 
     # get the mode pairs for which the gdi needs to be calculated
@@ -41,17 +47,34 @@ def get_gdi_values(
     # create small migration df, only used to check reciprocity
     migdf_for_reciproc_check = numeric_param.sample_migparam(0)
 
+    # P(G1A) values only depend on the proposal and the MCMC traces, so previously calculated values can be reused from the cache
+    topology = get_attribute_filtered_tree(tree, mode)
+    traces = [component for row in numeric_param.param_traces.itertuples() for component in (row.type, row.node, np.asarray(row.val))]
+
     # iterate through the node pairs
     for pair in node_pairs_to_mod:
         # if nodes are not involved in any migration events, or only involved in reciprocal migration events, calculate the gdi numerically
         if check_migration_reciprocal(pair[0], pair[1], mig_pattern=migdf_for_reciproc_check) == True:
-            for node in pair:
-                gdi_values[node.name] = get_pg1a_numerical(node, numeric_param)
-
+            method = 'numerical'
         # otherwise, use simulation to calculate the gdi
         else:
-            for node in pair:
-                gdi_values[node.name] = get_pg1a_from_sim(node, tree, mode, numeric_param)
+            method = 'simulation'
+
+        for node in pair:
+            cache_key = pg1a_key(method, node.name, mode, topology, *traces)
+            cached_values = load_pg1a(cache_key)
+            if cached_values is not None:
+                print(f"reusing gdi for '{node.name}' from cache")
+                gdi_values[node.name] = NumericParam(cached_values)
+                continue
+
+            with stage(method, node=node.name):
+                if method == 'numerical':
+                    gdi_values[node.name] = get_pg1a_numerical(node, numeric_param)
+                else:
+                    gdi_values[node.name] = get_pg1a_from_sim(node, tree, mode, numeric_param, work_dir)
+
+            store_pg1a(cache_key, gdi_values[node.name].values)
 
     return gdi_values
 
@@ -101,7 +124,8 @@ def print_decision_feedback(
         node_pairs_to_modify,
         tree:                   Tree,
         gdi_values:             Dict[NodeName, NumericParam],
-        cf_dict:                CfileParam
+        cf_dict:                CfileParam,
+        output_dir:             str = ".",
         ) ->                    None: # prints to screen, and writes files
 
     '''
@@ -141,7 +165,7 @@ def print_decision_feedback(
 
     df = pd.DataFrame.from_dict(feedback)
     df.rename(columns={'lower bound 1':"2.5% HPD", 'upper bound 1':"97.5% HPD",'lower bound 2':"2.5% HPD", 'upper bound 2':"97.5% HPD"}, inplace=True)
-    df.to_csv("decision.csv", index=False)
+    df.to_csv(os.path.join(output_dir, "decision.csv"), index=False)
 
     # print each node pair, the gdi, and whether the proposal as accepted
     print(f"\n> Proposal results:\n")
@@ -151,8 +175,8 @@ def print_decision_feedback(
     print(f"\nNumber of species after iteration {get_iteration(tree)}:  {len(get_current_leaf_species(tree))}")
     print(str(get_current_leaf_species(tree))[1:-1])
 
-    # print current topology as ASCII
-    print(get_attribute_filtered_tree(tree, "species", newick=False))
+    # print current topology (as ASCII art if the output is interactive)
+    print(get_species_tree_display(tree))
 
 
 
@@ -161,6 +185,7 @@ def tree_modify_delimitation(
         tree:       Tree,
         gdi_values: Dict[NodeName, NumericParam],
         cf_dict:    CfileParam,
+        output_dir: str = ".",
         ) ->        Tree:     
 
     '''
@@ -175,15 +200,15 @@ def tree_modify_delimitation(
     for pair in node_pairs_to_modify:
         node_pair_decision(pair[0], pair[1], gdi_values, cf_dict)
     
-    print_decision_feedback(node_pairs_to_modify, tree, gdi_values, cf_dict)
+    print_decision_feedback(node_pairs_to_modify, tree, gdi_values, cf_dict, output_dir)
 
     # output the current imap of accepted species
     result_imap = get_attribute_filtered_imap(tree, attribute='species')
-    imapfile_write(result_imap, 'RESULT_IMAP.txt')
+    imapfile_write(result_imap, os.path.join(output_dir, 'RESULT_IMAP.txt'))
 
     # output the currently accepted newick tree
     result_tree = get_attribute_filtered_tree(tree, attribute='species')
-    with open('RESULT_TREE.txt', 'w') as f:
+    with open(os.path.join(output_dir, 'RESULT_TREE.txt'), 'w') as f:
         f.write(result_tree)
 
     return tree
\ No newline at end of file
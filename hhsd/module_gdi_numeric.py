@@ -5,6 +5,7 @@ FUNCTIONS FOR CALCULATING THE GDI NUMERICALLY
 from .customtypehints import NodeName
 from .module_ete3 import TreeNode
 from .module_bpp_readres import MSCNumericParamEstimates, NumericParam
+from .module_profile import profiled_replicates
 
 import numpy as np
 from scipy.linalg import expm
@@ -103,7 +104,7 @@ def get_pg1a_numerical(
     
     # perform the replicate simulations
     results = []
-    for i in range(1000):
+    for i in profiled_replicates(1000):
         
         print(f"inferring gdi for '{node.name}' using analytical formula ({i+1}/1000)...                    ", end = '\r')
 
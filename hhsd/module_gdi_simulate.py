@@ -16,18 +16,47 @@ Such a model defines the joint distribution of gene tree topolgies and coalescen
 and simulation can be used to sample this distribution. 
 '''
 
+import asyncio
 import re
 import copy
-import subprocess
 import os
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
 
-from .customtypehints import BppCfile, BppCfileParam, GeneTrees, AlgoMode, MigrationRates, NodeName
+import numpy as np
+
+from .customtypehints import BppCfile, BppCfileParam, GeneTrees, AlgoMode, NodeName
 from .module_ete3 import Tree, TreeNode
-from .module_helper import readlines, dict_merge, get_bundled_bpp_path
+from .module_helper import readlines, dict_merge
 from .module_bpp import bppcfile_write
-from .module_tree import get_attribute_filtered_tree, add_attribute_tau_theta, ensure_taus_valid
+from .module_bpp_supervisor import BppSupervisor
+from .module_scheduler import get_core_scheduler
+from .module_profile import profiled_replicates, stage
+from .module_tree import get_attribute_filtered_tree, ensure_tau_traces_valid
 from .module_bpp_readres import MSCNumericParamEstimates, NumericParam
+from .module_exceptions import BppError
+
+
+# marks nodes without a theta attribute (a theta of None is still written, as before)
+_NO_THETA = object()
+
+def extended_newick_parameters(
+        node:   TreeNode,
+        ) ->    str:
 
+    '''
+    Format the tau and theta values of a node in the syntax of bpp (' :tau #theta'). Leaves have no tau.
+    '''
+
+    text = ""
+    tau = getattr(node, "tau", None)
+    if tau != None:
+        text += f" :{tau}"
+    theta = getattr(node, "theta", _NO_THETA)
+    if theta is not _NO_THETA:
+        text += f" #{theta}"
+
+    return text
 
 def tree_to_extended_newick(
         tree:   Tree,
@@ -36,43 +65,47 @@ def tree_to_extended_newick(
     '''
     'tree' is an ete3 Tree object which contains the topology, and the tau and theta values as node attributes.
     The output is a newick tree that also contains information about the tau and theta values at each node.
-    This newick tree is used as input to bpp --simulate
+    This newick tree is used as input to bpp --simulate, e.g. ' ( (A #0.01, B #0.02) AB :0.005 #0.03, C #0.01) ABC :0.01 #0.02;'
     '''
 
     root = tree.get_tree_root()
 
-    # create the extended newick version of the tree topology which contains the tau and theta values
-    tree_str = tree.write(features = ['tau', 'theta'],format=1)
-
-    # filter out extra material not related to required parameters
-    tree_str = re.sub(r':1\[&&NHX', '', tree_str)
-    tree_str = re.sub(f':theta=', ' #', tree_str)
-    tree_str = re.sub(f':tau=None', '', tree_str)
-    tree_str = re.sub(f':tau=', ' :', tree_str)
-    tree_str = re.sub(r'\]', '', tree_str)
-    tree_str = re.sub(r'\)', ') ', tree_str)
-    tree_str = re.sub(r'\(', ' (', tree_str)
+    # create the extended newick version of the tree topology in a single traversal
+    parts = []
+    for postorder, node in root.iter_prepostorder():
+        if postorder:
+            parts.append(") ")
+            if node is not root:
+                parts.append(f"{node.name}{extended_newick_parameters(node)}")
+        else:
+            if node is not root and node is not node.up.children[0]:
+                parts.append(",")
+            if node.is_leaf():
+                parts.append(f"{node.name}{extended_newick_parameters(node)}")
+            else:
+                parts.append(" (")
     
-    # add in data corresponding to root node, which is not added in by ete3 for some reason
-    tree_str = re.sub(';', f'{root.name} :{root.tau} #{root.theta};', tree_str)
+    # add in data corresponding to root node
+    parts.append(f"{root.name} :{root.tau} #{root.theta};")
 
-    return tree_str
+    return "".join(parts)
 
 def get_migration_events(
-        migration_df: MigrationRates,                  
-        ) -> str:
+        events:     List[Tuple[NodeName, NodeName]],
+        rates:      Iterable[float],
+        ) ->        str:
 
     """
-    Get the migration events and rates from the migration dataframe to append to the control file.
+    Get the migration events (as source and destination pairs) and their rates as rows to append to the control file.
 
     The migration events are appended to the hhsd control file in the following format:
     'migration = n
-    source destination W
+     source destination W
     """    
 
-    mig_events = f'migration = {len(migration_df["source"])}\n {migration_df.to_string(header = False, index = False)}'
+    rows = "".join(f" {source} {destination} {float(rate)!r}\n" for (source, destination), rate in zip(events, rates))
 
-    return mig_events
+    return f"migration = {len(events)}\n{rows}"
 
 
 # default parameters for a 'bpp --simulate' control file used for simulating gene trees
@@ -87,29 +120,51 @@ default_BPP_simctl_dict:BppCfileParam = {
 }
 
 
-# create the bpp --simulate cfile for simulating gene trees
-def create_simulate_cfile(
+@dataclass
+class SimulationTemplate:
+    '''
+    The parts of the 'bpp --simulate' control file of a node that are the same in all replicate simulations. 
+    'newick' is the extended newick tree of the simulation, with a format field ('{0}', '{1}', ...) in place of each tau
+    and theta value, and 'fields' holds the type of parameter ('tau' or 'theta') and the node corresponding to each field.
+    '''
+
+    ctl_dict:   BppCfileParam
+    newick:     str
+    fields:     List[Tuple[str, NodeName]]
+
+    def extended_newick(
+            self,
+            values: List[float],
+            ) ->    str:
+
+        '''
+        Fill in the tau and theta values of a replicate (in the order of 'fields').
+        '''
+
+        return self.newick.format(*values)
+
+
+# create the template of the bpp --simulate cfile for simulating gene trees
+def simulation_template(
         node:           TreeNode,
         tree:           Tree, 
         mode:           AlgoMode, 
-        migration_df:   MigrationRates,
-        ) ->            None: # writes control file to disk
+        tau_names:      Iterable[NodeName],
+        theta_names:    Iterable[NodeName],
+        ) ->            SimulationTemplate:
 
     '''
     - 'tree' is an ete3 Tree object.
     - 'mode' specifies whether the algo is running in merge or split mode.
-    - 'migration_df' is the DataFrame object containing the source, destination, and rate (M) for all migration events.
-    - 'bound' is the bound of the gdi value to be calculated, either 'lower', 'mean', or 'upper'.
+    - 'tau_names' and 'theta_names' are the nodes with tau and theta values in the mcmc chain.
 
-    the function writes a 'bpp --simulate' control file to disk specifying the parmeters of the simulation. 
+    The topology of the simulation only depends on the proposal, so it is computed once for all the replicates of a node.
     All populations in the simulation generate two sequences, as this facilitates the estiamtion of the gdi from gene trees 
     (performed in 'get_gdi_from_sim').
     '''
 
-    # get tree object needed to create simulation 
+    # get tree object needed to create simulation
     sim_tree = get_attribute_filtered_tree(tree, mode, newick=False)
-    # ensure descendants are younger than ancestors, and modify tree if needed
-    sim_tree = ensure_taus_valid(sim_tree)
     leaf_names = set([leaf.name for leaf in sim_tree])
     node_name = node.name
     sister_name = node.get_sisters()[0].name
@@ -128,53 +183,73 @@ def create_simulate_cfile(
         else:
             sim_dict['popsizes'] += '0 '
 
-    sim_dict['newick'] = tree_to_extended_newick(sim_tree)
+    # the tau and theta values are replaced by format fields (nodes without values are written with 'None', as before)
+    tau_names = set(tau_names); theta_names = set(theta_names)
+    fields = []
+    for sim_node in sim_tree.traverse("preorder"):
+        for parameter, names in [("tau", tau_names), ("theta", theta_names)]:
+            if sim_node.name in names:
+                sim_node.add_feature(parameter, f"{{{len(fields)}}}")
+                fields.append((parameter, sim_node.name))
+            else:
+                sim_node.add_feature(parameter, None)
 
-    # write the control dict
     ctl_dict = dict_merge(copy.deepcopy(default_BPP_simctl_dict), sim_dict)
-    bppcfile_write(ctl_dict,"sim_ctl.ctl", simulate=True)
 
-    # append lines corresponding to migration events and rates (simulation is only required if migraiton is present in the model)  
-    mig_events = get_migration_events(migration_df)
-    with open("sim_ctl.ctl", "a") as myfile: 
-        myfile.write(mig_events)
+    return SimulationTemplate(ctl_dict, tree_to_extended_newick(sim_tree), fields)
+
+# create the bpp --simulate cfile for simulating gene trees
+def create_simulate_cfile(
+        template:       SimulationTemplate,
+        newick:         str,
+        migration:      Optional[str],
+        sim_dir:        str = ".",
+        ) ->            None: # writes control file to disk
+
+    '''
+    - 'template' holds the parameters of the simulation shared by all replicates.
+    - 'newick' is the extended newick tree with the tau and theta values of the replicate.
+    - 'migration' holds the rows of the migration events and rates of the replicate (see 'get_migration_events').
+
+    the function writes a 'bpp --simulate' control file to disk specifying the parmeters of the simulation. 
+    '''
+
+    # write the control dict, with the lines corresponding to migration events and rates (simulation is only required if migraiton is present in the model)
+    ctl_dict = dict(template.ctl_dict, newick=newick)
+    bppcfile_write(ctl_dict, os.path.join(sim_dir, "sim_ctl.ctl"), simulate=True, migration=migration)
 
 
 
 def run_BPP_simulate(
-        control_file:   BppCfile,  
+        control_file:   BppCfile,
+        event_log:      Optional[str] = None,
+        cwd:            Optional[str] = None,
+        loop:           Optional[asyncio.AbstractEventLoop] = None,
         ) ->            None: # handles the bpp subprocess
     
     '''
-    Use 'bpp --simulate' to sample gene trees from a given MSC+M model
+    Use 'bpp --simulate' to sample gene trees from a given MSC+M model. The replicate simulations of a node pass the
+    same event 'loop', so a new event loop is not started for every replicate.
     '''
 
-    # runs BPP in a dedicated subprocess
-    process = subprocess.Popen(
-        f"{get_bundled_bpp_path()} --simulate {control_file}", 
-        shell = True, 
-        bufsize = 1,
-        stdout = subprocess.PIPE, 
-        stderr = subprocess.STDOUT,
-        encoding = 'utf-8', 
-        errors = 'replace' 
-        )
-
-    # this is necessary so that the program does not hang while the simulations are completing
-    while True:
-        realtime_output = process.stdout.readline()
+    # runs BPP in a dedicated subprocess, and waits for the simulations to complete
+    supervisor = BppSupervisor(event_log=event_log, scheduler=get_core_scheduler())
+    if loop != None:
+        result = loop.run_until_complete(supervisor.run(control_file, mode='simulate', cwd=cwd))
+    else:
+        result = asyncio.run(supervisor.run(control_file, mode='simulate', cwd=cwd))
 
-        # exit if process is stopped
-        if realtime_output == '' and process.poll() is not None:
-            break
+    if not result.ok:
+        raise BppError(f"'bpp --simulate' failed with message:\n{result.message}")
 
 
 # final wrapper function to simulation gene trees according to the given MSC+M model
 def genetree_simulation(
-        node:           TreeNode,
-        tree:           Tree, 
-        mode:           AlgoMode, 
-        migration_df:   MigrationRates,
+        template:       SimulationTemplate,
+        newick:         str,
+        migration:      Optional[str],
+        work_dir:       str = ".",
+        loop:           Optional[asyncio.AbstractEventLoop] = None,
         ) ->            GeneTrees: 
 
     '''
@@ -182,26 +257,25 @@ def genetree_simulation(
     '''
 
     # create temporary directory to store bpp --simulate output
-    os.mkdir('genetree_simulate')
-    os.chdir('genetree_simulate')
+    sim_dir = os.path.join(work_dir, 'genetree_simulate')
+    os.mkdir(sim_dir)
 
     # write the cfile to disk
-    create_simulate_cfile(node, tree, mode, migration_df)
+    create_simulate_cfile(template, newick, migration, sim_dir)
     
-    # run bpp --simulate
-    run_BPP_simulate('sim_ctl.ctl')
+    # run bpp --simulate, logging events alongside those of the iteration
+    run_BPP_simulate('sim_ctl.ctl', event_log=os.path.join(work_dir, 'bpp_events.jsonl'), cwd=sim_dir, loop=loop)
     
     # read the gene trees from the output file
     try:
-        all_genetrees = readlines('MyTree.tre')
+        all_genetrees = readlines(os.path.join(sim_dir, 'MyTree.tre'))
     except:
         raise ValueError("Error in simulating gene trees. Please check the /genetree_simulate folder for more information.")
 
-    os.remove('MyTree.tre')
-    os.remove('MyImap.txt')
-    os.remove('sim_ctl.ctl')
-    os.chdir('..')
-    os.rmdir('genetree_simulate')
+    os.remove(os.path.join(sim_dir, 'MyTree.tre'))
+    os.remove(os.path.join(sim_dir, 'MyImap.txt'))
+    os.remove(os.path.join(sim_dir, 'sim_ctl.ctl'))
+    os.rmdir(sim_dir)
 
     return all_genetrees
 
@@ -251,6 +325,7 @@ def get_pg1a_from_sim(
         tree:           Tree,
         mode:           AlgoMode,
         numeric_param:  MSCNumericParamEstimates,
+        work_dir:       str = ".",
         ) ->            NumericParam:
     
     '''
@@ -261,29 +336,41 @@ def get_pg1a_from_sim(
 
     ancestor_node:NodeName = str(node.up.name)
 
-    results = []
-    # run the 1000 replicate gdi estimations
-    for i in range(1000):
-        print(f"inferring gdi for '{node.name}' using gene tree simulation ({i+1}/1000)...                        ", end="\r")
+    # ensure descendants are younger than ancestors in all samples of the chain, as simulation fails otherwise
+    tau_traces = numeric_param.tau_traces()
+    parameter_traces = {"tau":ensure_tau_traces_valid(tree, mode, tau_traces), "theta":numeric_param.theta_traces()}
+    migration_traces = numeric_param.migparam_traces()
+    if migration_traces != None:
+        migration_events = list(zip(migration_traces[0]['source'], migration_traces[0]['destination']))
+
+    # the topology of the simulation is the same in all replicates, only the numeric parameters change
+    template = simulation_template(node, tree, mode, parameter_traces["tau"].keys(), parameter_traces["theta"].keys())
+    field_traces = np.array([parameter_traces[parameter][node_name] for parameter, node_name in template.fields], dtype=float).reshape(len(template.fields), -1)
 
-        # sample the mcmc values
-        tau_dict        = numeric_param.sample_tau(i)
-        theta_dict      = numeric_param.sample_theta(i)
-        migration_df    = numeric_param.sample_migparam(i)
+    results = []
+    # run the 1000 replicate gdi estimations, starting bpp from the same event loop
+    loop = asyncio.new_event_loop()
+    try:
+        for i in profiled_replicates(1000):
+            print(f"inferring gdi for '{node.name}' using gene tree simulation ({i+1}/1000)...                        ", end="\r")
 
-        # create a new tree object with tau and theta values corresponding to the newly sampled values
-        tree_copy = copy.deepcopy(tree)
-        tree_copy = add_attribute_tau_theta(tree_copy, tau_dict, theta_dict) 
+            # the replicates are timed together (see 'module_profile')
+            with stage("replicate", aggregate=True):
+                # fill in the sampled mcmc values
+                newick = template.extended_newick(field_traces[:, i].tolist())
+                migration = get_migration_events(migration_events, migration_traces[1][:, i]) if migration_traces != None else None
 
-        # simulate the gene trees
-        genetrees = genetree_simulation(node, tree_copy, mode, migration_df)
+                # simulate the gene trees
+                genetrees = genetree_simulation(template, newick, migration, work_dir, loop)
 
-        # get the time at which the populations split
-        tau_AB = tau_dict[ancestor_node]
+                # get the time at which the populations split
+                tau_AB = tau_traces[ancestor_node][i]
 
-        # get P(G1A)
-        results.append(pg1a_from_genetrees(node, tau_AB, genetrees))
+                # get P(G1A)
+                results.append(pg1a_from_genetrees(node, tau_AB, genetrees))
+    finally:
+        loop.close()
 
     print("                                                                                                       ", end='\r')
 
-    return NumericParam(results)
\ No newline at end of file
+    return NumericParam(results)
@@ -4,13 +4,26 @@ HELPER FUNCTIONS USED BY OTHER MODULES
 
 import re
 import copy
-import sys
+import gzip
+import io
 import os
 import platform
+import shutil
+import sys
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from difflib import SequenceMatcher
+from typing import BinaryIO, Optional
 import subprocess
 
+try:
+    import zstandard
+except ImportError: # optional, only needed for '.zst' files
+    zstandard = None
+
+from .module_exceptions import BppExecutableError, ExistingFilesError, FilePathError, MissingDependencyError, MissingFileError, UnsupportedPlatformError
+
 ## CORE HELPER FUNCTIONS
 
 # return a flattened list from a list of lists
@@ -70,39 +83,118 @@ def dict_merge(
 
     return dict_out
 
+# interpret a file path given in the control file. relative paths are interpreted relative to 'base_dir' (the directory of the control file)
+def resolve_path(
+        path,
+        base_dir =  None,
+        strict =    False,
+        ) ->        Path:
+
+    if base_dir != None:
+        return (Path(base_dir) / path).resolve(strict=strict)
+    
+    return Path(path).resolve(strict=strict)
+
 # check if a supplied filename actually points to an existing file in the current directory
 def check_file_exists(
         path,
-        type_of_file = "file"
+        type_of_file = "file",
+        base_dir = None,
         ):
 
     # try to interpret the parameter as a path
     try:
-        filepath = Path(path)
-        filepath = filepath.resolve(strict=False) # will attempt to resolve the path, even if the file does not exist
+        filepath = resolve_path(path, base_dir) # will attempt to resolve the path, even if the file does not exist
     except:
-        sys.exit(f"FilePathError: file path of {type_of_file} ('{path}') could not be resolved.")
+        raise FilePathError(f"file path of {type_of_file} ('{path}') could not be resolved.")
     
     # check if location is a file
     if not filepath.is_file():
-        sys.exit(f"FileNotFoundError: {type_of_file} location parameter '{path}' implies that \n'{filepath}' \nexists, but no such location was found in the file system.\nSpecify file paths relative to the directory of the control file, or use absolute paths.")    
+        raise MissingFileError(f"{type_of_file} location parameter '{path}' implies that \n'{filepath}' \nexists, but no such location was found in the file system.\nSpecify file paths relative to the directory of the control file, or use absolute paths.")    
 
 # check if a specified folder does not exist, or is empty
 def check_folder(
-        path
+        path,
+        base_dir = None,
         ):
 
     # try to interpret the parameter as a path
     try:
-        filepath = Path(path)
-        filepath = filepath.resolve(strict=False) # will attempt to resolve the path, even if the file does not exist
+        filepath = resolve_path(path, base_dir) # will attempt to resolve the path, even if the file does not exist
     except:
-        sys.exit(f"FilePathError: file path of suggested 'output_directory' ('{path}') could not be resolved.")
+        raise FilePathError(f"file path of suggested 'output_directory' ('{path}') could not be resolved.")
     
     # check if location is a file
     if filepath.exists():
         if len(os.listdir(filepath)) != 0:
-            sys.exit(f"ExistingFilesError: output directory '{path}' is non-empty.\ndelete files from '{filepath}'\nor provide the name of a new 'output_directory'")
+            raise ExistingFilesError(f"output directory '{path}' is non-empty.\ndelete files from '{filepath}'\nor provide the name of a new 'output_directory'")
+
+class ThreadOutputRouter():
+    '''
+    Replacement for sys.stdout, which sends the output of each thread to the stream assigned to that thread
+    (or the original stdout if no stream was assigned). Other attributes (e.g. 'encoding' or 'fileno') are those of 
+    the stream of the thread.
+    '''
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+        self.users = 0 # number of active 'thread_output' contexts
+
+    def stream(self):
+        return getattr(self.local, 'stream', None) or self.default
+
+    def write(self, text):
+        return self.stream().write(text)
+
+    def flush(self):
+        self.stream().flush()
+
+    def isatty(self):
+        return self.stream().isatty()
+
+    def __getattr__(self, name):
+        # only called for attributes not defined above
+        if name in ['default', 'local', 'users']:
+            raise AttributeError(name)
+        return getattr(self.stream(), name)
+
+_output_router_lock = threading.Lock()
+
+@contextmanager
+def thread_output(
+        stream
+        ):
+
+    '''
+    Send everything printed by the current thread to 'stream' for the duration of the context. Other threads are not affected,
+    so concurrent analyses can each write their output to a separate log. The original sys.stdout is restored when the 
+    last context exits.
+    '''
+
+    with _output_router_lock:
+        if not isinstance(sys.stdout, ThreadOutputRouter):
+            sys.stdout = ThreadOutputRouter(sys.stdout)
+        router = sys.stdout
+        router.users += 1
+
+    previous_stream = getattr(router.local, 'stream', None)
+    router.local.stream = stream
+    try:
+        yield
+    finally:
+        router.local.stream = previous_stream
+        with _output_router_lock:
+            router.users -= 1
+            if router.users == 0 and sys.stdout is router:
+                sys.stdout = router.default
+
+# check if the screen output of the current thread goes to a terminal (rather than e.g. a log file)
+def is_interactive_output() -> bool:
+    try:
+        return sys.stdout.isatty()
+    except (AttributeError, ValueError):
+        return False
 
 def format_time(seconds):
     '''
@@ -134,9 +226,9 @@ def check_numeric(
     try: 
         # check the input conforms to the standard
         if not re.fullmatch("[-<>=x0-9.]+", statement):
-            sys.exit("WARNING WARNING INCORRECT STATEMENT USED IN LITERAL EVAL")
+            raise ValueError("WARNING WARNING INCORRECT STATEMENT USED IN LITERAL EVAL")
     except:
-        sys.exit("WARNING WARNING INCORRECT STATEMENT USED IN LITERAL EVAL")
+        raise ValueError("WARNING WARNING INCORRECT STATEMENT USED IN LITERAL EVAL")
 
     # actual checking of number
     try:
@@ -169,16 +261,87 @@ def closest_param_match(
 # handle the creation of the working directory if it is not already present
 def output_directory(
         output_directory: Path
-        ):
+        ) -> Path:
 
     if not output_directory.exists():
         output_directory.mkdir(parents = True)
-    os.chdir(output_directory)
+    
+    return output_directory
+
+
+## COMPRESSED FILES
+
+# compressed files are recognised by their suffix
+COMPRESSION_SUFFIXES = {'gz':'.gz', 'zst':'.zst'}
+
+def compression_of(
+        filename
+        ) -> Optional[str]:
+
+    '''
+    Compression of a file ('gz' or 'zst') from its suffix, or None if the file is not compressed.
+    '''
+
+    suffix = Path(filename).suffix.lower()
+    return next((compression for compression, compression_suffix in COMPRESSION_SUFFIXES.items() if suffix == compression_suffix), None)
+
+def check_compression_available(
+        compression: Optional[str]
+        ) -> None:
+
+    if compression == 'zst' and zstandard == None:
+        raise MissingDependencyError("reading and writing '.zst' files requires the 'zstandard' package ('pip install zstandard').")
+
+def open_decompressed(
+        filename
+        ) -> BinaryIO:
+
+    '''
+    Open a compressed file for reading, decompressing it as it is read.
+    '''
+
+    compression = compression_of(filename)
+    check_compression_available(compression)
+    if compression == 'gz':
+        return gzip.open(filename, 'rb')
+
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True))
+
+def decompress_file(
+        filename,
+        destination
+        ) -> None:
+
+    with open_decompressed(filename) as source, open(destination, 'wb') as target:
+        shutil.copyfileobj(source, target, 1 << 20)
+
+def compress_file(
+        filename,
+        compression: str
+        ) -> str:
+
+    '''
+    Replace a file by its compressed version, with the suffix of the compression appended to its name.
+    Returns the name of the compressed file.
+    '''
+
+    check_compression_available(compression)
+    compressed_name = f"{filename}{COMPRESSION_SUFFIXES[compression]}"
+    with open(filename, 'rb') as source:
+        if compression == 'gz':
+            with gzip.open(compressed_name, 'wb', compresslevel=6) as target:
+                shutil.copyfileobj(source, target, 1 << 20)
+        else:
+            with open(compressed_name, 'wb') as target:
+                zstandard.ZstdCompressor().copy_stream(source, target)
+    os.remove(filename)
+
+    return compressed_name
 
 
 def get_bundled_bpp_path():
     '''
-    get the correct OS-specific path to the bundled bpp executable, depending on the platform of the user
+    get the correct OS-specific path to the bpp executable, depending on the platform of the user
     '''
     
     # Determine the user's operating system
@@ -202,36 +365,46 @@ def get_bundled_bpp_path():
         if arch == 'arm64':
             exec_path = os.path.join(bpp_folder, 'macos_arm', 'bpp')
         else:
-            sys.exit(f"HHSD does not support MacOS computers with Intel processors. Please use a Linux or Windows machine, or a Mac with Apple Silicon.")
+            raise UnsupportedPlatformError(f"HHSD does not support MacOS computers with Intel processors. Please use a Linux or Windows machine, or a Mac with Apple Silicon.")
     
     else:
-        sys.exit(f"HHSD does not support the current operating system: {system}")
+        raise UnsupportedPlatformError(f"HHSD does not support the current operating system: {system}")
 
     return exec_path
 
+def get_bpp_path():
+    '''
+    get the path to the bpp executable used by hhsd. This is the bundled executable, unless another executable is
+    specified by the 'HHSD_BPP' environment variable (e.g. a different version of bpp, or the stand-in used by the benchmarks)
+    '''
+
+    return os.environ.get("HHSD_BPP") or get_bundled_bpp_path()
+
 def check_bpp_executable():
     '''
-    check that the bundled bpp executable is present and has executable permissions
+    check that the bpp executable is present and has executable permissions
     '''
 
-    bpp_path = get_bundled_bpp_path()
+    bpp_path = get_bpp_path()
 
     # check if the bpp executable exists
     if not os.path.isfile(bpp_path):
-        sys.exit(f"BppExecutableError: the bundled bpp executable was not found at expected location: '{bpp_path}'")
+        raise BppExecutableError(f"the bpp executable was not found at expected location: '{bpp_path}'")
 
     # check if the bpp executable has execute permissions
     if not os.access(bpp_path, os.X_OK):
-        sys.exit(f"BppExecutableError: the bundled bpp executable at '{bpp_path}' does not have execute permissions. Please adjust the file permissions to allow execution.")
+        raise BppExecutableError(f"the bpp executable at '{bpp_path}' does not have execute permissions. Please adjust the file permissions to allow execution.")
 
     # try to run the bpp command to check that it works
     try:
         result = subprocess.run([bpp_path, '--help'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         if result.returncode != 0:
-            sys.exit(f"BppExecutableError: the bundled bpp executable at '{bpp_path}' could not be executed. Please ensure that the file is not corrupted and has the correct permissions.")
+            raise BppExecutableError(f"the bpp executable at '{bpp_path}' could not be executed. Please ensure that the file is not corrupted and has the correct permissions.")
         if result.returncode == 0:
             return f"BPP executable at '{bpp_path}' is present and functional."
+    except BppExecutableError:
+        raise
     except Exception as e:
-        sys.exit(f"BppExecutableError: an error occurred while trying to execute the bundled bpp executable at '{bpp_path}': {e}")
+        raise BppExecutableError(f"an error occurred while trying to execute the bpp executable at '{bpp_path}': {e}")
 
     
@@ -2,16 +2,17 @@
 FUNCTIONS FOR PROCESSING MIGRATION EVENTS
 '''
 
-import sys
 import io
 from typing import Tuple, List
 
+import numpy as np
 import pandas as pd
 
-from .customtypehints import MigrationPattern, NodeName, BppCfile
+from .customtypehints import MigrationPattern, NodeName
 from .module_ete3 import Tree, TreeNode
 from .module_helper import stripall
-from .module_tree import get_node_pairs_to_modify, get_attribute_filtered_tree
+from .module_tree import get_node_pairs_to_modify, get_flat_tree, get_population_map
+from .module_exceptions import MigrationParameterError
 
 
 def read_specified_mig_pattern(
@@ -54,18 +55,17 @@ def read_specified_mig_pattern(
         df = df.rename({0: 'source', 1: 'destination'}, axis=1)
 
     except:
-        sys.exit("MigrationParameterError: Migration pattern incorrectly formatted.\nRefer to the manual for details on how to specify migration events.")
+        raise MigrationParameterError("Migration pattern incorrectly formatted.\nRefer to the manual for details on how to specify migration events.")
 
     return df
 
-def remap_migrate(
+def remap_migration_events(
         tree:           Tree, 
-        source_name:    NodeName, 
-        dest_name:      NodeName
-        ) ->            Tuple[NodeName, NodeName]:
+        mig:            MigrationPattern, 
+        ) ->            List[Tuple[NodeName, NodeName]]:
 
     '''
-    Remaps the migration event between two populations to the populations currently accepted as species. 
+    Remaps the migration events between populations to the populations currently accepted (or proposed) as species. 
     Remapping must occur when the species delimitation changes.
 
     consider the following scenario, with migration from A to B, and C to B:
@@ -86,29 +86,30 @@ def remap_migrate(
         \  /
         ABC
 
-    At each iteration, this function needs to be applied to each migrating pair of populations in the guide tree
+    At each iteration, all migrating pairs of populations in the guide tree are remapped through the population map of the delimitation.
     '''
-    
-    source_node = tree.search_nodes(name = source_name)[0]
-    dest_node = tree.search_nodes(name = dest_name)[0]
 
-    while (source_node.species == False and source_node.proposal == None):
-        source_node = source_node.up
+    flat = get_flat_tree(tree)
+    population_map = get_population_map(tree, "proposal")
+    names = np.array(flat.names, dtype=object)
 
-    while (dest_node.species == False and dest_node.proposal == None):
-        dest_node = dest_node.up
+    sources = names[population_map[mig['source'].map(flat.index).to_numpy(dtype=np.int32)]]
+    destinations = names[population_map[mig['destination'].map(flat.index).to_numpy(dtype=np.int32)]]
 
-    return source_node.name, dest_node.name
+    # if a migration event occurs between nodes with the same ancestor that is currently accepted as species, then that migration event is now intra-species, so it is not processed 
+    intra_species = sources == destinations
 
+    # events that are duplicated due to remapping are only added once
+    return list(dict.fromkeys(zip(sources[~intra_species], destinations[~intra_species])))
 
-def append_migrate_rows(
+
+def get_migrate_rows(
         tree:           Tree, 
         mig:            MigrationPattern, 
-        ctl_file_name:  BppCfile,
-        ) ->            None: # writes to the bpp control file
+        ) ->            str:
     
     '''
-    Based on the migration patterns stored in hhsd, Append rows to the BPP control file to infer migration parameters, 
+    Based on the migration patterns stored in hhsd, get the rows of the BPP control file to infer migration parameters, 
     depending on how the migration pattern was specified. BPP migration syntax is as follows:
 
     migration = n
@@ -119,16 +120,7 @@ def append_migrate_rows(
     '''
 
     # when the migration pattern is specified for certain nodes, get the resulting pattern
-    tree = get_attribute_filtered_tree(tree, "population", newick=False)
-    
-    migration_list = []
-    for index, row in mig.iterrows():
-        remap = (remap_migrate(tree, row['source'], row['destination']))
-        # if a migration event occurs between nodes with the same ancestor that is currently accepted as species, then that migration event is now intra-species, so it is not processed 
-        if remap[0] != remap[1]:
-            # if the migration event has already been added (this can be due to remapping)
-            if remap not in migration_list:
-                migration_list.append(remap)
+    migration_list = remap_migration_events(tree, mig)
 
     # top row corresponds to number of migration events
     txt = f'migration = {len(migration_list)}\n'
@@ -137,9 +129,7 @@ def append_migrate_rows(
     for pair in migration_list:
         txt += f'\t{pair[0]} {pair[1]}\n'
 
-    # write resulting lines to the end of the control file
-    with open(ctl_file_name, "a") as myfile:
-        myfile.write(txt)
+    return txt
 
 
 
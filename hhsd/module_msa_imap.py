@@ -3,22 +3,23 @@ SPECIALIZED FUNCTIONS FOR INTERPRETING, AND ANALYSING THE
 CONTENTS OF SEQUENCE ALIGNMENTS AND IMAP FILES.
 '''
 
-import io
 import re
-import sys
 from collections import Counter
+from dataclasses import dataclass, field
 from itertools import combinations
 from itertools import product
-from typing import Literal, Union, Dict
+from typing import Iterator, List, Literal, Set, Union, Dict
 
 import numpy as np
-from Bio import AlignIO
-from Bio.Align import MultipleSeqAlignment
 
 from .customtypehints import ImapIndPop, ImapPopInd, Filename, NodeName, CfileParam, NewickTree
 from .module_helper import readlines, remove_empty_rows
+from .module_phylip import Locus, iter_phylip
 from .data_dicts import distance_dict, avail_chars
 from .module_tree import get_first_split_populations
+from .module_cache import BoundedMemory, file_identity, get_cached_alignment
+from .module_profile import stage
+from .module_exceptions import AutoPriorError
 
 ## IO HELPER FUNCTIONS
 
@@ -65,8 +66,8 @@ def imapfile_write(
     Write an imap dict to a text Imap file.
     '''
 
-    rows = [f"{individual}\t{input_indpop_dict[individual]}" for individual in input_indpop_dict]
-    output_file = '\n'.join(rows)
+    # the rows are joined in a single string, and written with one call
+    output_file = '\n'.join(map('\t'.join, input_indpop_dict.items()))
     
     with open(imap_filename, 'w') as f:
         f.write(output_file)
@@ -74,34 +75,108 @@ def imapfile_write(
 
 def alignfile_to_MSA(
         align_file:         Filename
-        ) ->                list[MultipleSeqAlignment]:
+        ) ->                List[Locus]:
 
     '''
-    Return a properly filtered BioPython MSA object when pointed to a valid alignment file
+    Return the loci of a valid alignment file, with the residues of each locus in a uint8 array (see 'module_phylip').
+    Each alignment file is only parsed once, as the result is reused through the alignment cache.
     '''
 
-    align_raw = readlines(align_file)
-    
-    # remove all empty rows, and superflous whitespaces from the numerical parameter rows, as this confuses biopython
-    align_noempty = remove_empty_rows(align_raw)
-    align_fixednum = []
-    for line in align_noempty:
-        # only applies to numeric lines, ignores others
-        if re.search("[0-9]+[\s]+[0-9]+", line):
-            line_fix = re.sub(" +", " ", line)
-            line_fix = line_fix.strip()
-            align_fixednum.append(line_fix)
-        else:
-            align_fixednum.append(line)
-    
-    # translate list to stringIO object that can be parsed by biopython
-    align_str = "\n".join(align_fixednum)
-    buf = io.StringIO(align_str)
+    return get_cached_alignment(align_file, parse_alignfile)
 
-    # read in the data from the buffered filtered version
-    alignment_list = list(AlignIO.parse(buf,"phylip-relaxed")) #wrapped in list as AlignIO.parse returns generator
-    
-    return alignment_list
+def parse_alignfile(
+        align_file:         Filename
+        ) ->                List[Locus]:
+
+    with stage("parse alignment"):
+        return list(iter_alignfile(align_file)) # wrapped in list as the loci are read by a generator
+
+def iter_alignfile(
+        align_file:         Filename
+        ) ->                Iterator[Locus]:
+
+    '''
+    Read the loci of an alignment file one at a time.
+    '''
+
+    yield from iter_phylip(align_file)
+
+
+## SUMMARY OF THE CONTENTS OF AN ALIGNMENT
+
+@dataclass
+class AlignmentSummary:
+    '''
+    Sizes of the loci of an alignment, and the individuals sampled at each locus. 
+    All checks of the alignment are made on the summary, so the alignment is only read once.
+    '''
+
+    n_sites:            List[int] = field(default_factory=list)                 # alignment length of each locus
+    individuals:        List[Counter] = field(default_factory=list)             # number of sequences of each individual at each locus
+    invalid_names:      List[str] = field(default_factory=list)                 # sequence names not in the format seq_id^individual_id
+
+    @property
+    def n_loci(self) -> int:
+        return len(self.n_sites)
+
+    @property
+    def n_sequences(self) -> List[int]:
+        return [sum(counts.values()) for counts in self.individuals]
+
+    def all_individuals(self) -> Set[str]:
+        return set().union(*self.individuals)
+
+    def seq_per_pop(
+            self,
+            indpop_imap:    ImapIndPop,
+            ) ->            Dict[NodeName, int]:
+
+        '''
+        Maximum number of sequences at a single locus that are associated with each population (see 'count_seq_per_pop').
+        '''
+
+        maxcounts = dict.fromkeys({value: key for key, value in indpop_imap.items()}, 0)
+        for counts in self.individuals:
+            pop_counts = Counter()
+            for ind, count in counts.items():
+                pop_counts[indpop_imap[ind]] += count
+            for pop in pop_counts:
+                maxcounts[pop] = max(maxcounts[pop], pop_counts[pop])
+
+        return maxcounts
+
+# summaries of the last few alignment files seen, until the file is modified
+_summary_memory = BoundedMemory(8)
+
+def summarise_alignment(
+        align_file:         Filename,
+        keep_alignment:     bool = True,
+        ) ->                AlignmentSummary:
+
+    '''
+    Summarise the loci of an alignment file. With 'keep_alignment', the parsed alignment is kept in the alignment cache 
+    for the analysis, otherwise the loci are streamed from the file, so that datasets can be checked without holding them in memory.
+    '''
+
+    identity = file_identity(align_file)
+    summary = _summary_memory.get(identity)
+    if summary != None:
+        return summary
+
+    summary = AlignmentSummary()
+    loci = alignfile_to_MSA(align_file) if keep_alignment else iter_alignfile(align_file)
+    for locus in loci:
+        summary.n_sites.append(locus.get_alignment_length())
+        counts = Counter()
+        for seq in locus:
+            if not bool(re.fullmatch(r"^\S+\^\S+$|^\^\S+$", seq.id)):
+                summary.invalid_names.append(seq.id)
+            counts[seq.id.split("^")[-1]] += 1
+        summary.individuals.append(counts)
+
+    _summary_memory.put(identity, summary)
+
+    return summary
 
 
 
@@ -109,7 +184,7 @@ def alignfile_to_MSA(
 
 def count_seq_per_pop(
         indpop_imap:        ImapIndPop, 
-        input_MSA_list:     list[MultipleSeqAlignment]
+        input_MSA_list:     List[Locus]
         ) ->                Dict[NodeName, int]:
 
     '''
@@ -202,27 +277,13 @@ the automatic generation of tau and theta prior values.
 
 # return the alignment only containing individuals from a given population
 def get_population_locus_alignment(locus, indpop_dict, population):
-    # add the sequences belonging to the current population to a temp aligment
-    temp_aligment = MultipleSeqAlignment([])
-    for sequence in locus:
-        id = sequence.id
-        id = id.split("^")[1]
-        if indpop_dict[id] == population:
-            temp_aligment.append(sequence)
-
-    return temp_aligment
+    # select the sequences belonging to the current population
+    return locus.select([i for i, id in enumerate(locus.ids) if indpop_dict[id.split("^")[1]] == population])
 
 # return the alignment only containing individuals from a given populations
 def get_multi_population_locus_alignment(locus, indpop_dict, population_list):
-    # add the sequences belonging to the current population to a temp aligment
-    temp_aligment = MultipleSeqAlignment([])
-    for sequence in locus:
-        id = sequence.id
-        id = id.split("^")[1]
-        if indpop_dict[id] in population_list:
-            temp_aligment.append(sequence)
-
-    return temp_aligment
+    # select the sequences belonging to the current populations
+    return locus.select([i for i, id in enumerate(locus.ids) if indpop_dict[id.split("^")[1]] in population_list])
 
 # calculate the pairwise distance between two sequences at shared known characters
 def pairwise_dist   (
@@ -263,7 +324,7 @@ def pairwise_dist   (
 # return a list of all paiwise distances in an alignment
 
 def get_Distance_list(
-        input_MSA: MultipleSeqAlignment
+        input_MSA: Locus
         ) -> list[float]:
 
     '''
@@ -285,8 +346,8 @@ def get_Distance_list(
     return dist_list
 
 def get_two_pop_distance_list(
-        input_MSA_l: MultipleSeqAlignment,
-        input_MSA_r: MultipleSeqAlignment,
+        input_MSA_l: Locus,
+        input_MSA_r: Locus,
         ) -> list[float]:
 
 
@@ -329,7 +390,7 @@ def distance_within_pop(alignment, indpop_dict, population):
         return np.average(per_locus_dist, weights = per_locus_len)
     except:
         # this happens if only a single phased sequence is provided, then inter pop distance cannot be assessed
-        sys.exit("AutoPriorError: Automatic inference of theta prior failed.\nProvide theta prior manually.")
+        raise AutoPriorError("Automatic inference of theta prior failed.\nProvide theta prior manually.")
 
 # measure the average within population pairwise distance in a MSA
 def distance_between_pop(alignment, indpop_dict, pop_l, pop_r):
@@ -359,7 +420,7 @@ def distance_between_pop(alignment, indpop_dict, pop_l, pop_r):
         return np.average(per_locus_dist, weights = per_locus_len)
     except:
         # this happens if only a single phased sequence is provided, then inter pop distance cannot be assessed
-        sys.exit("AutoPriorError: Automatic inference of tau prior failed.\nProvide tau prior manually.")     
+        raise AutoPriorError("Automatic inference of tau prior failed.\nProvide tau prior manually.")     
 
 
 # automatically generates the tau and theta prior lines of the BPP control file
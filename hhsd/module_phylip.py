@@ -0,0 +1,316 @@
+'''
+MEMORY-MAPPED READER OF PHYLIP ALIGNMENTS
+
+The alignment file is memory-mapped, and scanned for the header rows of the loci and the sequence rows that follow
+them. The residues of each locus are copied straight from the mapped file into a uint8 array (one row per sequence),
+so no Python strings or biopython objects are created for the sequences, and reading an alignment takes about as much
+memory as the size of the file.
+
+The accepted format is the same as that of the biopython 'phylip-relaxed' reader used previously: loci are separated
+by a header of two integers (number of sequences, and number of sites), each sequence row starts with the name of the
+sequence followed by whitespace, spaces within sequences are ignored, and sequences may be continued in further blocks
+of rows (interleaved format). Empty rows are ignored. Compressed alignments are decompressed as a stream, and
+scanned one row at a time.
+'''
+
+import mmap
+import re
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .customtypehints import Filename
+from .module_helper import compression_of, open_decompressed
+
+
+## LOCI OF AN ALIGNMENT
+
+class SequenceRecord():
+    '''
+    A single sequence of a locus. The residues are a view of the row of the locus, and are only decoded to a string on request.
+    '''
+
+    __slots__ = ('id', 'codes')
+
+    def __init__(
+            self,
+            id:     str,
+            codes:  np.ndarray,
+            ):
+
+        self.id = id
+        self.codes = codes
+
+    @property
+    def seq(self) -> str:
+        return self.codes.tobytes().decode('latin-1')
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+class Locus():
+    '''
+    The sequences of a single locus: their names, and their residues as the rows of a uint8 array of ascii codes.
+    Iterating over a locus gives a 'SequenceRecord' for each sequence.
+    '''
+
+    __slots__ = ('ids', 'codes')
+
+    def __init__(
+            self,
+            ids:    List[str],
+            codes:  np.ndarray,
+            ):
+
+        self.ids = ids
+        self.codes = codes
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(
+            self,
+            index:  int,
+            ) ->    SequenceRecord:
+
+        return SequenceRecord(self.ids[index], self.codes[index])
+
+    def __iter__(self) -> Iterator[SequenceRecord]:
+        for index in range(len(self.ids)):
+            yield self[index]
+
+    def get_alignment_length(self) -> int:
+        return self.codes.shape[1]
+
+    def select(
+            self,
+            indices:    List[int],
+            ) ->        'Locus':
+
+        '''
+        Locus with only the sequences at the given positions.
+        '''
+
+        return Locus([self.ids[index] for index in indices], self.codes[indices])
+
+
+## SCANNING THE ROWS OF THE FILE
+
+# a non-empty row: the buffer holding it, its start and end offsets in the buffer, and the offsets of its first tokens
+Buffer = Union[mmap.mmap, bytes]
+Row = Tuple[Buffer, int, int, List[Tuple[int, int]]]
+# the residues of a sequence in one block of rows: the buffer holding them, and their start and end offsets
+Segment = Tuple[Buffer, int, int]
+
+_TOKEN = re.compile(rb"\S+")
+_WHITESPACE = b" \t\r\n\x0b\x0c"
+_SPACE = ord(" ")
+
+def row_tokens(
+        buffer: Buffer,
+        start:  int,
+        end:    int,
+        limit:  int = 3,
+        ) ->    List[Tuple[int, int]]:
+
+    '''
+    Start and end offsets of the first 'limit' whitespace separated tokens of the row buffer[start:end].
+    '''
+
+    tokens = []
+    for match in _TOKEN.finditer(buffer, start, end):
+        tokens.append(match.span())
+        if len(tokens) == limit:
+            break
+
+    return tokens
+
+def is_header(
+        buffer: Buffer,
+        tokens: List[Tuple[int, int]],
+        ) ->    bool:
+
+    '''
+    Rows of exactly two integers start a new locus.
+    '''
+
+    if len(tokens) != 2:
+        return False
+    try:
+        int(buffer[tokens[0][0]:tokens[0][1]]); int(buffer[tokens[1][0]:tokens[1][1]])
+        return True
+    except ValueError:
+        return False
+
+def strip_end(
+        buffer: Buffer,
+        start:  int,
+        end:    int,
+        ) ->    int:
+
+    '''
+    End offset of buffer[start:end] without trailing whitespace.
+    '''
+
+    while end > start and buffer[end-1] in _WHITESPACE:
+        end -= 1
+
+    return end
+
+def iter_rows(
+        buffer: Buffer,
+        ) ->    Iterator[Row]:
+
+    '''
+    The non-empty rows of a buffer (e.g. of a memory-mapped file).
+    '''
+
+    start = 0
+    while start <= len(buffer):
+        end = buffer.find(b"\n", start)
+        end = len(buffer) if end == -1 else end
+        tokens = row_tokens(buffer, start, end)
+        if len(tokens) > 0:
+            yield buffer, start, end, tokens
+        start = end + 1
+
+def iter_stream_rows(
+        stream: BinaryIO,
+        ) ->    Iterator[Row]:
+
+    '''
+    The non-empty rows of a stream (e.g. of a decompressed file), each read into its own buffer.
+    '''
+
+    for line in stream:
+        tokens = row_tokens(line, 0, len(line))
+        if len(tokens) > 0:
+            yield line, 0, len(line), tokens
+
+def scan_locus_rows(
+        rows:   Iterator[Row],
+        header: Row,
+        ) ->    Tuple[List[str], List[List[Segment]], Optional[Row]]:
+
+    '''
+    Read the rows of the locus starting at 'header'. Returns the names of the sequences, the segments holding the
+    residues of each sequence (one segment per block of rows), and the header of the next locus (or None).
+    '''
+
+    buffer, _, _, tokens = header
+    if not is_header(buffer, tokens):
+        raise ValueError("First line should have two integers")
+    n_sequences = int(buffer[tokens[0][0]:tokens[0][1]])
+
+    # the first block holds the names of the sequences
+    names: List[str] = []
+    segments: List[List[Segment]] = []
+    for _ in range(n_sequences):
+        row = next(rows, None)
+        if row == None:
+            raise ValueError("End of file within the first block of a locus")
+        buffer, start, end, tokens = row
+        if len(tokens) < 2:
+            raise ValueError("Sequence row without residues")
+        names.append(buffer[tokens[0][0]:tokens[0][1]].decode())
+        segments.append([(buffer, tokens[1][0], strip_end(buffer, tokens[1][0], end))])
+
+    # further blocks continue the sequences, until the next header row
+    for row in rows:
+        if is_header(row[0], row[3]):
+            return names, segments, row
+        for i in range(n_sequences):
+            if i > 0:
+                row = next(rows, None)
+                if row == None:
+                    raise ValueError("End of file mid-block")
+            buffer, start, end, tokens = row
+            segments[i].append((buffer, tokens[0][0], strip_end(buffer, tokens[0][0], end)))
+
+    return names, segments, None
+
+def count_spaces(
+        buffer: Buffer,
+        start:  int,
+        end:    int,
+        ) ->    int:
+
+    if buffer.find(b" ", start, end) == -1:
+        return 0
+    if isinstance(buffer, bytes):
+        return buffer.count(b" ", start, end)
+
+    # mapped files have no 'count', and slicing them would copy the row
+    residues = np.frombuffer(buffer, dtype=np.uint8, count=end-start, offset=start)
+    try:
+        return int(np.count_nonzero(residues == _SPACE))
+    finally:
+        del residues
+
+def copy_residues(
+        names:      List[str],
+        segments:   List[List[Segment]],
+        ) ->        Locus:
+
+    '''
+    Copy the residues of each sequence into the rows of a uint8 array, leaving out spaces.
+    '''
+
+    for sequence_segments in segments:
+        for buffer, start, end in sequence_segments:
+            if buffer.find(b".", start, end) != -1:
+                raise ValueError("PHYLIP format no longer allows dots in sequence")
+
+    # views of a mapped file are released on errors too, as the file cannot be closed while they exist
+    residues = None
+    try:
+        lengths = [sum(end - start - count_spaces(buffer, start, end) for buffer, start, end in sequence_segments) for sequence_segments in segments]
+        if len(set(lengths)) > 1:
+            raise ValueError("Sequences must all be the same length")
+
+        codes = np.empty((len(names), lengths[0] if len(lengths) > 0 else 0), dtype=np.uint8)
+        for i, sequence_segments in enumerate(segments):
+            position = 0
+            for buffer, start, end in sequence_segments:
+                residues = np.frombuffer(buffer, dtype=np.uint8, count=end-start, offset=start)
+                if buffer.find(b" ", start, end) != -1:
+                    residues = residues[residues != _SPACE]
+                codes[i, position:position+len(residues)] = residues
+                position += len(residues)
+    finally:
+        residues = None
+
+    return Locus(names, codes)
+
+def iter_phylip_rows(
+        rows:   Iterator[Row],
+        ) ->    Iterator[Locus]:
+
+    header = next(rows, None)
+    while header != None:
+        names, segments, header = scan_locus_rows(rows, header)
+        yield copy_residues(names, segments)
+
+
+## FINAL WRAPPER FUNCTION
+
+def iter_phylip(
+        align_file: Filename,
+        ) ->        Iterator[Locus]:
+
+    '''
+    Read the loci of a phylip alignment file one at a time. Compressed files ('.gz', or '.zst' if the 'zstandard'
+    package is installed) are decompressed as they are read, so only the rows of one locus are held in memory.
+    '''
+
+    if compression_of(align_file) != None:
+        with open_decompressed(align_file) as stream:
+            yield from iter_phylip_rows(iter_stream_rows(stream))
+        return
+
+    with open(align_file, 'rb') as f:
+        # empty files cannot be mapped, and hold no loci
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield from iter_phylip_rows(iter_rows(buffer))
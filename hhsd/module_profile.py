@@ -0,0 +1,323 @@
+'''
+TIMING AND RESOURCE USE OF THE STAGES OF AN ANALYSIS
+
+The stages of the pipeline (reading the control file, inferring the priors, and the phases of each iteration) are
+wrapped in 'stage'. For every stage, the wall time, the CPU time of the thread running it, the CPU time of the child
+processes (bpp) that exited during the stage, and the peak memory of hhsd and of its largest child process are recorded.
+Stages that are repeated many times (e.g. the replicates of the gene tree simulations) are aggregated into a single entry.
+
+Each analysis records its stages into its own 'RunProfile', which is written to 'run_profile.json' in the output
+directory, and summarised as a table at the end of the analysis. Stages are only recorded in threads where a profile
+is active, so the functions of the pipeline can also be used on their own.
+
+Child process time and peak memory are properties of the whole process, so in 'mode = both' the stages of one search
+also include the bpp processes of the other search that exited during the stage.
+
+If the 'profile' parameter is set, a few stages are also run under cProfile ('profiled'), and their call statistics
+are written as '.prof' files to the folder of each iteration (and to the output directory for stages run before the
+first iteration). Only the first replicates of the 1000-replicate gdi loops are profiled ('profiled_replicates').
+'''
+
+import cProfile
+import json
+import pstats
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError: # windows
+    resource = None
+
+# replicates of each gdi estimate that are profiled when '--profile' is given without a number
+PROFILED_REPLICATES = 10
+
+
+## MEASUREMENTS
+
+def child_cpu_time() -> float:
+    '''
+    CPU time (user + system) of all child processes that have exited and been waited for.
+    '''
+
+    if resource == None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return usage.ru_utime + usage.ru_stime
+
+def peak_rss_mb(
+        who:    str = "self",
+        ) ->    Optional[float]:
+
+    '''
+    Peak resident memory of hhsd ('self'), or of the largest child process that has exited ('children'), in MB.
+    Child processes start as a copy of hhsd, so the peak of the children is at least the memory used by hhsd when they started.
+    '''
+
+    if resource == None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+
+    # ru_maxrss is in bytes on macOS, and in kilobytes on linux
+    return usage.ru_maxrss/1e6 if sys.platform == "darwin" else usage.ru_maxrss/1e3
+
+
+## COLLECTING THE STAGES OF AN ANALYSIS
+
+class RunProfile():
+    '''
+    The stages of a single analysis, in the order in which they finished.
+    '''
+
+    def __init__(self):
+        self.started = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.start_child_cpu = child_cpu_time()
+        self.stages: List[Dict[str, Any]] = []
+        self.aggregated: Dict[Tuple, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.profiled_replicates: Optional[int] = None # replicates of each gdi loop run under cProfile, if profiling is requested
+
+    def record(
+            self,
+            path:       str,
+            labels:     Dict[str, Any],
+            aggregate:  bool,
+            start:      float,
+            wall:       float,
+            cpu:        float,
+            child_cpu:  float,
+            ) ->        None:
+
+        with self.lock:
+            # repeated stages with the same labels accumulate into one entry
+            key = (path, tuple(sorted(labels.items())))
+            if aggregate and key in self.aggregated:
+                entry = self.aggregated[key]
+                entry['count'] += 1
+                entry['wall'] += wall; entry['cpu'] += cpu; entry['child_cpu'] += child_cpu
+                entry['max_wall'] = max(entry['max_wall'], wall)
+            else:
+                entry = {'stage':path, 'labels':labels, 'start':start, 'count':1, 'wall':wall, 'cpu':cpu, 'child_cpu':child_cpu}
+                if aggregate:
+                    entry['max_wall'] = wall
+                    self.aggregated[key] = entry
+                self.stages.append(entry)
+
+            entry['peak_rss_mb'] = peak_rss_mb("self")
+            entry['peak_child_rss_mb'] = peak_rss_mb("children")
+
+    def summary(self) -> List[Dict[str, Any]]:
+        '''
+        Totals of each stage over all its occurrences (e.g. over all iterations).
+        '''
+
+        totals: Dict[str, Dict[str, Any]] = {}
+        with self.lock:
+            for entry in self.stages:
+                total = totals.setdefault(entry['stage'], {'stage':entry['stage'], 'count':0, 'wall':0.0, 'cpu':0.0, 'child_cpu':0.0, 'peak_rss_mb':None})
+                total['count'] += entry['count']
+                total['wall'] += entry['wall']; total['cpu'] += entry['cpu']; total['child_cpu'] += entry['child_cpu']
+                if entry['peak_rss_mb'] != None:
+                    total['peak_rss_mb'] = max(total['peak_rss_mb'] or 0, entry['peak_rss_mb'])
+
+        # stages are listed in the order in which they first started, with inner stages listed after the outer stage
+        first_start = {}
+        for entry in sorted(self.stages, key=lambda entry: entry['start']):
+            first_start.setdefault(entry['stage'], entry['start'])
+
+        def order(path):
+            parts = path.split("/")
+            return [first_start.get("/".join(parts[:i+1]), 0.0) for i in range(len(parts))]
+
+        return sorted(totals.values(), key=lambda total: order(total['stage']))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'started':          time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            'wall':             time.perf_counter() - self.start_wall,
+            'cpu':              time.process_time() - self.start_cpu,
+            'child_cpu':        child_cpu_time() - self.start_child_cpu,
+            'peak_rss_mb':      peak_rss_mb("self"),
+            'peak_child_rss_mb':peak_rss_mb("children"),
+            'summary':          self.summary(),
+            'stages':           self.stages,
+            }
+
+    def write(
+            self,
+            output_dir: Path,
+            ) ->        None: # writes 'run_profile.json' to the output directory
+
+        with open(os.path.join(output_dir, "run_profile.json"), 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def print_summary(self) -> None:
+        profile = self.to_dict()
+        print("\n< Time and resources used by each stage >\n")
+        print(f"{'stage':<40}{'count':>7}{'wall [s]':>11}{'cpu [s]':>10}{'bpp cpu [s]':>13}{'peak mem [MB]':>15}")
+        for total in profile['summary']:
+            peak = f"{total['peak_rss_mb']:.0f}" if total['peak_rss_mb'] != None else "-"
+            print(f"{total['stage']:<40}{total['count']:>7}{total['wall']:>11.2f}{total['cpu']:>10.2f}{total['child_cpu']:>13.2f}{peak:>15}")
+        print(f"{'total':<40}{'':>7}{profile['wall']:>11.2f}{profile['cpu']:>10.2f}{profile['child_cpu']:>13.2f}{(profile['peak_rss_mb'] or 0):>15.0f}")
+        if profile['peak_child_rss_mb'] != None:
+            print(f"\npeak memory of a bpp process: {profile['peak_child_rss_mb']:.0f} MB")
+        if self.profiled_replicates != None:
+            print(f"cProfile statistics of the profiled stages written to the '.prof' files of the iteration folders (view with 'python -m pstats')")
+
+
+## RECORDING STAGES
+
+# profile of the analysis running in each thread, and the stages currently open in that thread
+_local = threading.local()
+
+def get_profile() -> Optional[RunProfile]:
+    return getattr(_local, 'profile', None)
+
+@contextmanager
+def profiling(
+        profile:    Optional[RunProfile],
+        ):
+
+    '''
+    Record the stages run by the current thread into 'profile' for the duration of the context.
+    '''
+
+    previous = (get_profile(), getattr(_local, 'open_stages', []))
+    _local.profile = profile
+    _local.open_stages = []
+    try:
+        yield profile
+    finally:
+        _local.profile, _local.open_stages = previous
+
+@contextmanager
+def stage(
+        name:       str,
+        aggregate:  bool = False,
+        **labels,
+        ):
+
+    '''
+    Time the code run in the context as the stage 'name'. Stages run within other stages are recorded as 'outer/inner',
+    and inherit the labels of the outer stages (e.g. the iteration number).
+    '''
+
+    profile = get_profile()
+    if profile == None:
+        yield
+        return
+
+    open_stages = _local.open_stages
+    labels = dict(open_stages[-1][1], **labels) if len(open_stages) > 0 else labels
+    open_stages.append((name, labels))
+    path = "/".join(stage_name for stage_name, _ in open_stages)
+
+    start_wall = time.perf_counter(); start_cpu = time.thread_time(); start_child_cpu = child_cpu_time()
+    try:
+        yield
+    finally:
+        open_stages.pop()
+        profile.record(
+            path, labels, aggregate,
+            start=start_wall - profile.start_wall,
+            wall=time.perf_counter() - start_wall,
+            cpu=time.thread_time() - start_cpu,
+            child_cpu=child_cpu_time() - start_child_cpu,
+            )
+
+
+## PROFILING STAGES WITH CPROFILE
+
+def try_enable(
+        profiler:   cProfile.Profile,
+        ) ->        bool:
+
+    '''
+    Start the profiler. Only one profiler can run at a time in recent versions of python, so stages of the other search
+    in 'mode = both' are not profiled while a stage of this search is.
+    '''
+
+    try:
+        profiler.enable()
+        return True
+    except ValueError:
+        return False
+
+@contextmanager
+def profiled(
+        name:       str,
+        directory:  str,
+        ):
+
+    '''
+    Run the code in the context under cProfile, and write its statistics to '{name}.prof' in 'directory', if profiling was
+    requested for the analysis. Stages profiled within other profiled stages are written to their own file, and are also
+    included in the file of the outer stage.
+    '''
+
+    profile = get_profile()
+    if profile == None or profile.profiled_replicates == None:
+        yield
+        return
+
+    # the profiler of the outer stage is paused, as only one profiler can be active in a thread
+    if not hasattr(_local, 'profilers'):
+        _local.profilers = []
+    profilers = _local.profilers
+    if len(profilers) > 0:
+        profilers[-1]['profiler'].disable()
+
+    entry = {'profiler':cProfile.Profile(), 'inner':[]}
+    entry['enabled'] = try_enable(entry['profiler'])
+    profilers.append(entry)
+    try:
+        yield
+    finally:
+        entry['profiler'].disable()
+        profilers.pop()
+        if entry['enabled']:
+            stats = pstats.Stats(entry['profiler'])
+            for inner in entry['inner']:
+                stats.add(inner)
+            stats.dump_stats(os.path.join(directory, f"{name}.prof"))
+            if len(profilers) > 0:
+                profilers[-1]['inner'].append(stats)
+
+        if len(profilers) > 0 and profilers[-1]['enabled']:
+            profilers[-1]['enabled'] = try_enable(profilers[-1]['profiler'])
+
+def profiled_replicates(
+        n:  int,
+        ):
+
+    '''
+    The indices of 'n' replicates, like 'range(n)'. Only the first replicates (as set by the 'profile' parameter) are
+    recorded by the profiler of the current stage, so the overhead of profiling does not grow with the number of replicates.
+    '''
+
+    profile = get_profile()
+    profilers = getattr(_local, 'profilers', [])
+    if profile == None or profile.profiled_replicates == None or len(profilers) == 0 or not profilers[-1]['enabled']:
+        yield from range(n)
+        return
+
+    entry = profilers[-1]
+    paused = False
+    try:
+        for i in range(n):
+            if i == profile.profiled_replicates:
+                entry['profiler'].disable()
+                paused = True
+            yield i
+    finally:
+        # the profiler is resumed for the rest of the stage
+        if paused and len(profilers) > 0 and profilers[-1] is entry:
+            entry['enabled'] = try_enable(entry['profiler'])
@@ -0,0 +1,141 @@
+'''
+BINARY RESULTS OF THE ITERATIONS
+
+Each iteration saves the numeric results it is based on, so they can be analysed (or the decisions re-made with other
+thresholds) without parsing the text outputs of bpp again:
+- 'hhsd_job.traces.npz': the thinned traces of the parameters estimated by bpp (see 'write_param_traces')
+- 'gdi.npz': the 1000 replicate gdi values of each node for which a modification was proposed
+
+All iterations of an analysis (of both searches in 'mode = both') are listed in 'run_index.jsonl' in the output
+directory, with the location of their files, the proposed node pairs with their mean gdi, the decisions, and the
+accepted species. Each iteration appends one JSON line to the index, so earlier entries are never rewritten.
+'''
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .customtypehints import CfileParam, NodeName
+from .module_ete3 import Tree
+from .module_bpp_readres import MSCNumericParamDf, MSCNumericParamEstimates, NumericParam, read_param_traces, write_param_traces
+from .module_helper import compress_file
+from .module_tree import get_current_leaf_species, get_iteration, get_node_pairs_to_modify
+
+TRACES_FILE = "hhsd_job.traces.npz"
+GDI_FILE = "gdi.npz"
+INDEX_FILE = "run_index.jsonl"
+
+# the merge and split searches of 'mode = both' add their iterations to the same index
+_index_lock = threading.Lock()
+
+
+## GDI REPLICATES
+
+def write_gdi_values(
+        gdi_values: Dict[NodeName, NumericParam],
+        filename:   str,
+        ) ->        None: # writes the replicates to a binary numpy (.npz) file
+
+    '''
+    Save the replicate gdi values of each node, as the rows of the 'values' array.
+    '''
+
+    np.savez(
+        filename,
+        node=np.array(list(gdi_values), dtype=str),
+        values=np.array([np.asarray(gdi.values, dtype=float) for gdi in gdi_values.values()]),
+        )
+
+def read_gdi_values(
+        filename:   str,
+        ) ->        Dict[NodeName, NumericParam]:
+
+    with np.load(filename) as gdi:
+        return {str(node):NumericParam(values) for node, values in zip(gdi['node'], gdi['values'])}
+
+
+## INDEX OF THE ITERATIONS OF AN ANALYSIS
+
+def read_run_index(
+        output_dir: str,
+        ) ->        List[Dict[str, Any]]:
+
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    if not os.path.isfile(index_path):
+        return []
+
+    # a line left incomplete by an interrupted run is ignored
+    iterations = []
+    with open(index_path) as f:
+        for line in f:
+            try:
+                iterations.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+
+    return iterations
+
+def add_to_run_index(
+        output_dir: str,
+        entry:      Dict[str, Any],
+        ) ->        None: # appends the entry to the index
+
+    with _index_lock, open(os.path.join(output_dir, INDEX_FILE), 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+
+def load_iteration(
+        output_dir: str,
+        entry:      Dict[str, Any],
+        ) ->        Tuple[MSCNumericParamDf, Dict[NodeName, NumericParam]]:
+
+    '''
+    Load the parameter traces and the gdi replicates of an iteration listed in the index of an analysis.
+    '''
+
+    return read_param_traces(os.path.join(output_dir, entry['traces'])), read_gdi_values(os.path.join(output_dir, entry['gdi']))
+
+
+## FINAL WRAPPER FUNCTION
+
+def save_iteration_results(
+        tree:               Tree,
+        estimated_param:    MSCNumericParamEstimates,
+        gdi_values:         Dict[NodeName, NumericParam],
+        cf_dict:            CfileParam,
+        iter_dir:           str,
+        ) ->                None: # writes the binary files of the iteration, and adds it to the index
+
+    '''
+    Runs at the end of each iteration, once the decision is made. Saves the traces and gdi replicates of the
+    iteration, compresses the mcmc file if requested, and adds the iteration to the index of the analysis.
+    '''
+
+    write_param_traces(estimated_param.param_traces, os.path.join(iter_dir, TRACES_FILE))
+    write_gdi_values(gdi_values, os.path.join(iter_dir, GDI_FILE))
+
+    # the mcmc file can be compressed, as the traces used for the gdi are saved
+    mcmc_file = os.path.join(iter_dir, "hhsd_job.mcmc.txt")
+    if cf_dict['compress_mcmc'] != None:
+        mcmc_file = compress_file(mcmc_file, cf_dict['compress_mcmc'])
+
+    # paths in the index are relative to the output directory
+    output_dir = cf_dict['output_directory']
+    relative = lambda filename: Path(os.path.relpath(filename, output_dir)).as_posix()
+    proposals = [
+        {'nodes':[str(node.name) for node in pair], 'mean_gdi':[float(gdi_values[str(node.name)].mean()) for node in pair], 'accepted':bool(pair[0].modified)}
+        for pair in get_node_pairs_to_modify(tree, cf_dict['mode'])
+        ]
+    add_to_run_index(output_dir, {
+        'mode':         cf_dict['mode'],
+        'iteration':    get_iteration(tree),
+        'directory':    relative(iter_dir),
+        'traces':       relative(os.path.join(iter_dir, TRACES_FILE)),
+        'gdi':          relative(os.path.join(iter_dir, GDI_FILE)),
+        'mcmc':         relative(mcmc_file),
+        'proposals':    proposals,
+        'species':      get_current_leaf_species(tree),
+        })
@@ -0,0 +1,355 @@
+'''
+SHARING THE CORES OF THE MACHINE BETWEEN CONCURRENT BPP PROCESSES
+
+Every bpp launch reserves a set of cores from a 'CoreScheduler' before it starts, and releases them when it exits,
+so that concurrent bpp processes never oversubscribe the cores.
+
+By default the scheduler is shared by all bpp launches in the current process. If a lock file is specified,
+reservations are recorded in that file, and the cores are shared with all other processes using the same lock file
+(e.g. the analyses of a batch). The reserved cores are then passed to bpp by rewriting the 'threads' parameter of the
+control file with explicit pinning ('threads = n start interval'), so that bpp processes never share cores. Without a
+lock file, the 'threads' parameter is left as written by the user, as other hhsd processes on the machine would
+otherwise be pinned to the same cores.
+'''
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError: # windows
+    fcntl = None
+    import msvcrt
+
+
+class CoreSlot():
+    '''
+    A set of cores (numbered from 1, as in bpp) reserved for a single bpp process.
+    '''
+
+    def __init__(self, cores: List[int], threads: str):
+        self.id = uuid.uuid4().hex
+        self.cores = cores
+        self.threads = threads # value of the 'threads' parameter pinning bpp to the reserved cores
+
+    def __repr__(self) -> str:
+        return f"CoreSlot(threads = {self.threads})"
+
+
+def requested_cores(
+        threads:    str,
+        n_cores:    int,
+        ) ->        Tuple[int, Optional[List[int]]]:
+
+    '''
+    Interpret the bpp 'threads' parameter. Returns the number of threads, and the explicit list of cores if the
+    user pinned the threads with a starting core (and interval), or None if the cores can be freely chosen.
+    '''
+
+    th = [int(x) for x in str(threads).split()]
+
+    if len(th) == 1:
+        return min(th[0], n_cores), None
+
+    start = th[1]; interval = th[2] if len(th) == 3 else 1
+    pinned = [start + i*interval for i in range(th[0])]
+
+    # pinning outside of the cores available to the scheduler cannot be honored
+    if max(pinned) > n_cores:
+        return min(th[0], n_cores), None
+
+    return th[0], pinned
+
+def available_cores(
+        ) ->    int:
+
+    '''
+    Number of cores the process may run on (e.g. within the cpu set of a cgroup or a Slurm job).
+    '''
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError: # not available on windows and macos
+        return int(os.cpu_count())
+
+def pid_alive(
+        pid:    int
+        ) ->    bool:
+
+    '''
+    Check if the process holding a reservation still exists (stale reservations are released)
+    '''
+
+    if os.name != 'posix': # os.kill cannot be used to probe processes on windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+@contextmanager
+def locked_file(
+        path:   str
+        ):
+
+    '''
+    Open the scheduler lock file with an exclusive lock held for the duration of the context.
+    '''
+
+    with open(path, 'a+') as f:
+        if fcntl != None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            f.seek(0)
+            yield f
+        finally:
+            f.flush()
+            if fcntl != None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CoreScheduler():
+    '''
+    Hand out cores to bpp processes, such that the total reserved never exceeds 'n_cores'.
+
+    - 'n_cores' is the number of cores that may be used (defaults to all cores available to the process).
+    - 'lock_file' is an optional path used to share reservations between processes.
+    - 'pin' is whether bpp is pinned to the reserved cores (by default only if reservations are shared through a lock file).
+    '''
+
+    def __init__(
+            self,
+            n_cores:        Optional[int] = None,
+            lock_file:      Optional[str] = None,
+            poll_interval:  float = 0.2,
+            pin:            Optional[bool] = None,
+            ):
+
+        self.n_cores = int(n_cores) if n_cores != None else available_cores()
+        self.lock_file = str(lock_file) if lock_file != None else None
+        self.pin = pin if pin != None else self.lock_file != None
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._reservations: Dict[str, Dict] = {}
+
+    ## BOOKKEEPING OF RESERVATIONS
+
+    def _read_reservations(
+            self,
+            f,
+            ) ->    Dict[str, Dict]:
+
+        text = f.read()
+        reservations = json.loads(text) if text.strip() else {}
+
+        return {key:value for key, value in reservations.items() if pid_alive(value['pid'])}
+
+    def _write_reservations(
+            self,
+            f,
+            reservations:   Dict[str, Dict],
+            ) ->            None:
+
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(reservations))
+
+    def _choose_cores(
+            self,
+            reservations:   Dict[str, Dict],
+            n_threads:      int,
+            pinned:         Optional[List[int]],
+            ) ->            Optional[List[int]]:
+
+        '''
+        Return the cores for the new reservation if they are currently available, otherwise None.
+        Unpinned requests are given the first contiguous block of free cores.
+        '''
+
+        in_use = set(core for reservation in reservations.values() for core in reservation['cores'])
+
+        if pinned != None:
+            return pinned if in_use.isdisjoint(pinned) else None
+
+        for start in range(1, self.n_cores - n_threads + 2):
+            block = list(range(start, start + n_threads))
+            if in_use.isdisjoint(block):
+                return block
+
+        return None
+
+    def try_acquire(
+            self,
+            threads:    str,
+            ) ->        Optional[CoreSlot]:
+
+        '''
+        Reserve cores for a bpp process requesting 'threads' if possible, without waiting.
+        '''
+
+        n_threads, pinned = requested_cores(threads, self.n_cores)
+
+        with self._lock:
+            if self.lock_file != None:
+                with locked_file(self.lock_file) as f:
+                    reservations = self._read_reservations(f)
+                    cores = self._choose_cores(reservations, n_threads, pinned)
+                    if cores == None:
+                        return None
+                    slot = self._make_slot(threads, cores, pinned)
+                    reservations[slot.id] = {'pid': os.getpid(), 'cores': cores}
+                    self._write_reservations(f, reservations)
+            else:
+                cores = self._choose_cores(self._reservations, n_threads, pinned)
+                if cores == None:
+                    return None
+                slot = self._make_slot(threads, cores, pinned)
+                self._reservations[slot.id] = {'pid': os.getpid(), 'cores': cores}
+
+        return slot
+
+    def _make_slot(
+            self,
+            threads:    str,
+            cores:      List[int],
+            pinned:     Optional[List[int]],
+            ) ->        CoreSlot:
+
+        # explicit pinning requested by the user is kept as is
+        if pinned != None:
+            return CoreSlot(cores, str(threads))
+
+        # unpinned schedulers keep the parameter of the user, unless it requests more threads than the reserved cores
+        if not self.pin:
+            if int(str(threads).split()[0]) > len(cores):
+                return CoreSlot(cores, str(len(cores)))
+            return CoreSlot(cores, str(threads))
+
+        return CoreSlot(cores, f"{len(cores)} {cores[0]} 1")
+
+    def release(
+            self,
+            slot:   CoreSlot,
+            ) ->    None:
+
+        with self._lock:
+            if self.lock_file != None:
+                with locked_file(self.lock_file) as f:
+                    reservations = self._read_reservations(f)
+                    reservations.pop(slot.id, None)
+                    self._write_reservations(f, reservations)
+            else:
+                self._reservations.pop(slot.id, None)
+
+    ## WAITING FOR CORES TO BECOME FREE
+
+    def acquire(
+            self,
+            threads:    str,
+            ) ->        CoreSlot:
+
+        '''
+        Reserve cores, waiting until enough cores are free.
+        '''
+
+        while True:
+            slot = self.try_acquire(threads)
+            if slot != None:
+                return slot
+            time.sleep(self.poll_interval)
+
+    async def acquire_async(
+            self,
+            threads:    str,
+            ) ->        CoreSlot:
+
+        '''
+        Reserve cores, waiting without blocking the event loop until enough cores are free.
+        '''
+
+        while True:
+            slot = self.try_acquire(threads)
+            if slot != None:
+                return slot
+            await asyncio.sleep(self.poll_interval)
+
+    @contextmanager
+    def reserve(
+            self,
+            threads:    str,
+            ):
+
+        slot = self.acquire(threads)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+
+## SCHEDULER SHARED BY ALL BPP LAUNCHES IN THE PROCESS
+
+_core_scheduler: Optional[CoreScheduler] = None
+
+def get_core_scheduler(
+        ) ->    CoreScheduler:
+
+    global _core_scheduler
+    if _core_scheduler == None:
+        _core_scheduler = CoreScheduler()
+
+    return _core_scheduler
+
+def configure_core_scheduler(
+        n_cores:    Optional[int] = None,
+        lock_file:  Optional[str] = None,
+        ) ->        CoreScheduler:
+
+    '''
+    Replace the shared scheduler, e.g. to limit the cores used by the process, or to share cores with other processes.
+    '''
+
+    global _core_scheduler
+    _core_scheduler = CoreScheduler(n_cores=n_cores, lock_file=lock_file)
+
+    return _core_scheduler
+
+
+## REWRITING THE THREADS PARAMETER OF A CONTROL FILE
+
+def read_threads_param(
+        control_file:   str,
+        ) ->            Optional[str]:
+
+    with open(control_file, 'r') as f:
+        for line in f:
+            if line.split('=')[0].strip() == 'threads':
+                return line.split('=', 1)[1].strip()
+
+    return None
+
+def write_threads_param(
+        control_file:   str,
+        threads:        str,
+        ) ->            None:
+
+    with open(control_file, 'r') as f:
+        lines = f.readlines()
+
+    lines = [f"threads={threads}\n" if line.split('=')[0].strip() == 'threads' else line for line in lines]
+
+    with open(control_file, 'w') as f:
+        f.writelines(lines)
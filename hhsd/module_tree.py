@@ -2,12 +2,15 @@
 FUNCTIONS RELATED TO READING, MODIFYING, AND WRITING TREE DATA STRUCTURES
 '''
 
-import copy
 import re
-from typing import Literal, Union, Tuple, List, Dict
+from typing import Any, Callable, Hashable, Literal, Union, Tuple, List, Dict
+
+import numpy as np
 
 from .customtypehints import NodeName, NewickTree, ImapPopInd, ImapIndPop, AlgoMode
 from .module_ete3 import Tree, TreeNode
+from .module_flattree import FlatTree, NodeIndex
+from .module_helper import is_interactive_output
 
 
 def tree_to_newick  (
@@ -42,31 +45,6 @@ def name_internal_nodes(
     
     return tree
 
-def add_individuals_to_tree(
-        pop_tree:       Tree,
-        imap_popind:    ImapPopInd,
-        ) ->            Tree:
-    
-    '''
-    Based on the imap, add individuals from each population as child nodes (with attribute "individual_node") to the leaf population nodes. 
-    '''
-    
-    # iterate through each population
-    for pop_name in imap_popind:
-        # begin by finding the guide tree node with the name matching the population
-        pop_node = list(filter(lambda n: n.name == pop_name and n.node_type == "population", pop_tree.traverse()))[0]
-        
-        # iterate through each individual in the population, and add as a child
-        for ind_name in imap_popind[pop_name]: 
-            pop_node.add_child(name = ind_name)
-        
-        # add child attribute to resulting nodes
-        for child_node in pop_node.iter_descendants(): 
-            child_node.add_features(node_type = "individual",)
-
-    return pop_tree
-
-
 def init_tree(
         tree_newick:    NewickTree,
         imap_popind:    ImapPopInd,
@@ -74,7 +52,10 @@ def init_tree(
 
     '''
     Initialize the Tree object, based on the 'guide_tree' parameter, 
-    and add individuals from the 'Imapfile' onto the tree as child nodes of their parent populations.
+    and map the individuals from the 'Imapfile' to their populations.
+
+    The nodes of the ete3 tree are the populations of the guide tree, and hold the attributes of the delimitation. 
+    The individuals, and the index arrays of the topology, are kept in the 'FlatTree' attached to the root node.
     '''
 
     # ingest newick and turn into ete3 tree
@@ -89,11 +70,81 @@ def init_tree(
     # add iteration attribute to root node, which is initally set to 0
     root = tree_out.get_tree_root(); root.add_features(iteration = 0)
 
-    # add nodes corresponding to individuals to the tree
-    tree_out = add_individuals_to_tree(tree_out, imap_popind)
+    # add the array representation of the topology and the individuals (not a feature, so it is not written to newick)
+    root.flat = FlatTree(tree_out, imap_popind)
+
+    # index the nodes by name and by the attributes of the delimitation
+    NodeIndex(tree_out)
 
     return tree_out
 
+def get_flat_tree(
+        tree:   Tree
+        ) ->    FlatTree:
+
+    return tree.get_tree_root().flat
+
+def get_tree_view(
+        tree:       Tree,
+        key:        Hashable,
+        compute:    Callable[[], Any],
+        ) ->        Any:
+
+    '''
+    Get a view derived from the current state of the delimitation (see 'NodeIndex'), which is only recomputed after
+    the attributes of the populations have changed. Views of subtrees, or of trees without an index, are not cached.
+    '''
+
+    node_index = getattr(tree, "_node_index", None)
+    if tree.up != None or node_index == None:
+        return compute()
+
+    return node_index.view(key, compute)
+
+def get_attribute_mask(
+        tree:           Tree,
+        attribute:      Literal['species','merge','split','proposal','population'],
+        ) ->            np.ndarray:
+
+    '''
+    Get the boolean mask of the populations (in preorder) retained by the filter of 'get_attribute_filtered_tree'.
+    With 'proposal', the mask holds the populations that are accepted as species, or are part of a merge or split proposal.
+    The mask is shared by all callers until the tree is modified, so it is read-only.
+    '''
+
+    def compute_mask():
+        nodes = tree.traverse("preorder")
+
+        if   attribute == "species" or attribute == "merge":
+            mask = np.array([getattr(node, "species", False) == True for node in nodes], dtype=bool)
+        elif attribute == "split":
+            mask = np.array([getattr(node, "species", False) == True or getattr(node, "proposal", None) == "split" for node in nodes], dtype=bool)
+        elif attribute == "proposal":
+            mask = np.array([getattr(node, "species", False) == True or getattr(node, "proposal", None) != None for node in nodes], dtype=bool)
+        elif attribute == "population":
+            mask = np.ones(len(get_flat_tree(tree)), dtype=bool)
+
+        mask.setflags(write=False)
+        return mask
+
+    return get_tree_view(tree, ("mask", attribute), compute_mask)
+
+def get_population_map(
+        tree:           Tree,
+        attribute:      Literal['species','merge','split','proposal'],
+        ) ->            np.ndarray:
+
+    '''
+    For each population of the guide tree (in preorder), get the index of the population it belongs to under the current
+    delimitation, which is the first population (itself, or an ancestor) that is accepted as species, or proposed as a species.
+    The map is shared by the imap of the proposal and the remapping of migration events, and computed once per delimitation.
+    '''
+
+    if attribute == "species" or attribute == "merge":
+        attribute = "species"
+
+    return get_flat_tree(tree).target_populations(get_attribute_mask(tree, attribute))
+
 ## FUNCTIONS FOR OUTPUTTING DIFFERENT TYPES OF DATA BASED ON THE CURRENT STATE OF THE TREE
 
 def get_attribute_filtered_tree(
@@ -109,35 +160,13 @@ def get_attribute_filtered_tree(
     3) Filtering for populations only. This is useful whenever the guide tree needs to be accessed
     '''
 
-    copy_tree = copy.deepcopy(tree)
-
-    # filter to currently accepted species. This is also utilized as the proposal for merge mode
-    if attribute == "species" or attribute == "merge":
-        nodes = copy_tree.search_nodes(species = True)
-                         
-        # base case
-        if len(nodes) != 1:
-            copy_tree.prune(nodes)
-        # special exception case when only the root node is a species, 
-        # as ete3 pruning would return the whole tree, which is not the intended behaviour
-        else: 
-            root = copy_tree.get_tree_root()
-            descendants = list(root.iter_descendants("levelorder"))[0:2]
-            copy_tree.remove_child(descendants[0])
-            copy_tree.remove_child(descendants[1])
-    
-    # filter to currently accepted species + species resulting from a split proposal 
-    elif attribute == "split":
-        copy_tree.prune(list(filter(lambda n: n.proposal == "split" or n.species == True, copy_tree.search_nodes(node_type = "population"))))
-
-    # filter to populations only
-    elif attribute == "population":
-        copy_tree.prune(copy_tree.search_nodes(node_type = "population"))
+    flat = get_flat_tree(tree)
+    mask = get_attribute_mask(tree, attribute)
 
     if   newick == True:
-        return tree_to_newick(copy_tree)
+        return get_tree_view(tree, ("newick", attribute), lambda: flat.newick(mask))
     elif newick == False:
-        return copy_tree
+        return flat.to_ete3(tree, mask)
 
 def add_inner_node_names_to_newick(
         tree_newick:    NewickTree,
@@ -163,25 +192,14 @@ def get_attribute_filtered_imap(
     2) The currently accepted species the individual is mapped to
     '''
     
-    indpop_dict:ImapIndPop = {}
-    
-    # isolate individual nodes 
-    for node in tree.search_nodes(node_type="individual"):
-       
-        parent_candidate = node.up
-        
-        # if looking for accepted species (which are also the merge candidates)
-        if attribute == "species" or attribute == "merge":
-            while parent_candidate.species == False:
-                parent_candidate = parent_candidate.up
-        
-        # if looking for the nodes required to implement the split proposal
-        elif attribute == "split":
-            while parent_candidate.proposal != "split" and parent_candidate.species == False:
-                parent_candidate = parent_candidate.up
-        
-        # add the parent for the specific individual node to the indpop dict
-        indpop_dict[f"{node.name}"] = f"{parent_candidate.name}"
+    flat = get_flat_tree(tree)
+
+    # for each population, find the first population (itself or an ancestor) that is accepted or proposed as species
+    target = get_population_map(tree, attribute)
+
+    # map all individuals at once, through the index of the guide tree population they belong to
+    ind_target = np.array(flat.names, dtype=object)[target[flat.ind_pop]]
+    indpop_dict:ImapIndPop = dict(zip(flat.ind_names, ind_target.tolist()))
 
     return indpop_dict
 
@@ -193,10 +211,23 @@ def get_current_leaf_species(
     Get the list of currently accepted species nodes that are also leaves.
     '''
 
-    copy_tree = get_attribute_filtered_tree(tree, "species", newick=False)
-    leaf_names = [leaf.name for leaf in copy_tree]
+    leaf_species = get_tree_view(tree, ("leaf_species",), lambda: tuple(get_flat_tree(tree).leaf_names(get_attribute_mask(tree, "species"))))
 
-    return leaf_names
+    return list(leaf_species)
+
+def get_species_tree_display(
+        tree:           Tree,
+        ) ->            str:
+
+    '''
+    Get the tree of the currently accepted species as it is printed in the screen output. The ASCII art of the tree
+    is only rendered when the output is interactive, logs (e.g. of batch runs) get the newick representation instead.
+    '''
+
+    if not is_interactive_output():
+        return get_attribute_filtered_tree(tree, "species")
+
+    return get_tree_view(tree, ("ascii", "species"), lambda: str(get_attribute_filtered_tree(tree, "species", newick=False)))
 
 def get_iteration(
         tree:   Tree
@@ -262,66 +293,50 @@ def get_node_pairs_to_modify(
     return node_pairs_to_modify
 
 
-## FUNCTIONS FOR ADDING NUMERICAL NODE ATTRIBUTES (E.G. TAU OR M) INFERRED USING BPP TO THE TREE OBJECT
-def add_attribute_tau_theta(
-        tree:           Tree,
-        tau_values:     Dict[NodeName, float],
-        theta_values:   Dict[NodeName, float],
-        ) ->            Tree:
+## FUNCTIONS FOR CORRECTING THE TAU VALUES INFERRED USING BPP
+def raise_parent_taus(
+        parent_taus:    np.ndarray,
+        child_taus:     np.ndarray,
+        ) ->            None: # in-place modification of 'parent_taus'
 
     '''
-    Add tau and theta parameters inferred using A00 as node attributes.
+    Increment the parent taus in steps of 0.000001 until they are larger than the taus of the child. 
+    Stepping (rather than setting the value directly) gives the same floating point values as incrementing one violation at a time.
     '''
-    
-    # add tau and theta attributes to all population nodes
-    for node in tree.search_nodes(node_type="population"):
-        # tau values are only available for non-leaf (ancestral) nodes.
-        if node.name in list(tau_values.keys()):
-            node.add_features(tau = float(tau_values[node.name]))
-        else:
-            node.add_features(tau = None)
-
-        # theta values should be available for all nodes.
-        if node.name in list(theta_values.keys()):
-            node.add_features(theta = float(theta_values[node.name]))
-        else:
-            node.add_features(theta = None)
 
-    return tree
+    too_young = parent_taus <= child_taus
+    while too_young.any():
+        parent_taus[too_young] += 0.000001
+        too_young = parent_taus <= child_taus
+
+def ensure_tau_traces_valid(
+        tree:           Tree,
+        attribute:      Literal['merge','split','species'],
+        tau_traces:     Dict[NodeName, np.ndarray],
+        ) ->            Dict[NodeName, np.ndarray]:
 
-def ensure_taus_valid(
-        tree:   Tree
-        ) ->    Tree:
     '''
-    go through all of the tau parameters, checking that the age of the ancestor is always larger than the descendant.
+    Go through all of the tau parameters, checking that the age of the ancestor is always larger than the descendant.
     the mcmc algorithm of bpp sometimes violates this constraint, but simulation fails if this condition is not maintained.
+    The correction is applied to every sample of the mcmc chain at once, for the tree filtered according to 'attribute'
+    (the topology of the proposal). Children are visited before their parents, so a single pass is sufficient.
     '''
 
-    root = tree.get_tree_root()
+    if len(tau_traces) == 0:
+        return {}
 
-    ancestors_older_all = [False]
-
-    while not all(ancestors_older_all):
-        ancestors_older = []
-        for node in tree.traverse("postorder"):
-            # skip the root node, as it has no ancestor
-            if node != root:
-                node_age = node.tau
-                    # leaf nodes to not have taus, as they have age 0
-                if str(type(node_age)) == "<class 'NoneType'>":
-                    node_age = 0.0
-                parent = node.up
-                parent_age = float(parent.tau)
-                
-                if node_age < parent_age:
-                    ancestors_older.append(True)
-                else:
-                    #print(f"found node {node.name} with age {node_age}, which is not less than {parent.name}'s age of {parent_age}")
-                    ancestors_older.append(False)
-                    parent.tau = parent_age + 0.000001
-                    #print(f"therefore the age of {parent.name} was incremented to {parent_age + 0.000001}")
-        ancestors_older_all = ancestors_older
+    flat = get_flat_tree(tree)
+    mask = get_attribute_mask(tree, attribute).copy(); mask[0] = True
+    kept_parent = flat.kept_parent(mask)
 
-    return tree
+    # one row of samples for each population. Leaves, and populations without tau values, have age 0
+    n_samples = len(next(iter(tau_traces.values())))
+    taus = np.zeros((len(flat), n_samples), dtype=float)
+    for node_name, values in tau_traces.items():
+        taus[flat.index[node_name]] = values
+
+    # descendants have a larger index than their ancestors in preorder, so the reverse order visits children before parents
+    for i in np.flatnonzero(mask)[:0:-1]:
+        raise_parent_taus(taus[kept_parent[i]], taus[i])
 
-        
\ No newline at end of file
+    return {node_name:taus[flat.index[node_name]] for node_name in tau_traces}
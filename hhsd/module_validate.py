@@ -0,0 +1,203 @@
+'''
+CHECKING AN ANALYSIS WITHOUT RUNNING IT ('--validate')
+
+All parameters of the control file are checked, and all the errors found are reported together, instead of stopping
+at the first one. The alignment is read in a single pass, without keeping it in memory. If the analysis is valid,
+the size of the dataset and the resources needed by bpp are estimated, so large datasets can be screened before
+they are queued.
+'''
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .customtypehints import AlgoMode, CfileParam, NodeName
+from .module_exceptions import HhsdError
+
+# bpp stores the conditional likelihoods of the 4 nucleotides (as doubles) at each site of each node of the gene trees,
+# for the current and the proposed state of the chain
+BYTES_PER_NODE_SITE = 4*8*2
+
+# approximate time of one generation of the mcmc, per site of each sequence, on a single thread. This is an order of
+# magnitude, as the speed of bpp depends on the computer and the divergence of the sequences
+SECONDS_PER_SEQUENCE_SITE = 1e-8
+
+# number of gene tree simulations needed to estimate the gdi of a population when migration is specified
+SIMULATIONS_PER_POPULATION = 1000
+
+
+@dataclass
+class ResourceEstimate:
+    '''
+    Size of the dataset (of the loci analysed by bpp), and the predicted resource use of each bpp run.
+    '''
+
+    n_loci:             int
+    n_sites:            int
+    n_sequences:        int
+    seq_per_pop:        Dict[NodeName, int]     # maximum number of sequences of each population at a single locus
+    bpp_memory:         int                     # bytes
+    mcmc_generations:   int
+    threads:            int
+    bpp_seconds:        float                   # wall time of each bpp run
+    proposals:          Dict[AlgoMode, int]     # populations assessed in the first iteration of each search
+    max_iterations:     int
+    simulations:        bool                    # gdi estimated by gene tree simulation (when migration is specified)
+
+@dataclass
+class ValidationReport:
+    '''
+    Errors in the parameters of an analysis, and the resource estimate if there are none.
+    '''
+
+    cf_file:            Optional[Path]
+    errors:             List[HhsdError] = field(default_factory=list)
+    estimate:           Optional[ResourceEstimate] = None
+
+    @property
+    def valid(self) -> bool:
+        return len(self.errors) == 0
+
+
+def estimate_resources(
+        cf:     CfileParam,
+        ) ->    ResourceEstimate:
+
+    '''
+    Estimate the resources needed by the analysis, from the summary of the alignment made during the checks.
+    bpp only analyses the first 'nloci' loci of the alignment.
+    '''
+
+    from .module_msa_imap import imapfile_read, summarise_alignment
+    from .module_tree import init_tree, get_flat_tree
+
+    summary = summarise_alignment(cf['seqfile'], keep_alignment=False)
+    n_loci = int(cf['nloci']) if cf['nloci'] != None else summary.n_loci
+    n_sites = summary.n_sites[:n_loci]
+    n_sequences = summary.n_sequences[:n_loci]
+
+    # each gene tree with n sequences has 2n-1 nodes
+    bpp_memory = sum((2*n - 1)*sites*BYTES_PER_NODE_SITE for n, sites in zip(n_sequences, n_sites))
+
+    # each generation of the mcmc updates all gene trees, so the cost scales with the number of sequences times sites
+    generations = int(cf['burnin']) + int(cf['nsample'])*int(cf['sampfreq'] if cf['sampfreq'] != None else 1)
+    threads = int(cf['threads'].split()[0])
+    sequence_sites = sum(n*sites for n, sites in zip(n_sequences, n_sites))
+    bpp_seconds = generations*sequence_sites*SECONDS_PER_SEQUENCE_SITE/threads
+
+    # every iteration merges or splits at least one population, so the number of iterations is bounded by the number of ancestral populations
+    tree = init_tree(cf['guide_tree'], imapfile_read(cf['Imapfile'], "popind"))
+    flat = get_flat_tree(tree)
+    modes = ['merge', 'split'] if cf['mode'] == 'both' else [cf['mode']]
+    starting_species = {'merge':np.ones(len(flat), dtype=bool), 'split':np.arange(len(flat)) == 0}
+    proposals = {mode:2*len(flat.propose(starting_species[mode], mode).pairs) for mode in modes}
+
+    return ResourceEstimate(
+        n_loci=n_loci,
+        n_sites=sum(n_sites),
+        n_sequences=sum(n_sequences),
+        seq_per_pop=summary.seq_per_pop(imapfile_read(cf['Imapfile'], "indpop")),
+        bpp_memory=bpp_memory,
+        mcmc_generations=generations,
+        threads=threads,
+        bpp_seconds=bpp_seconds,
+        proposals=proposals,
+        max_iterations=int(len(flat) - flat.is_leaf.sum()),
+        simulations=cf['migration'] is not None,
+        )
+
+
+def validate_cf(
+        cf_file:        Optional[Path],
+        cf_override:    Optional[CfileParam],
+        base_dir:       Path,
+        ) ->            ValidationReport:
+
+    '''
+    Check the control file (and the optional parameter overrides), collecting all errors instead of raising the first one.
+    '''
+
+    from .module_cf_ingest import verify_cf_parameter_names, cf_parameter_check
+
+    report = ValidationReport(cf_file)
+
+    # the parameters cannot be checked if the control file itself cannot be read
+    try:
+        cf = verify_cf_parameter_names(cf_file, cf_override)
+    except HhsdError as e:
+        report.errors.append(e)
+        return report
+
+    cf = cf_parameter_check(cf, base_dir, errors=report.errors)
+
+    if report.valid:
+        report.estimate = estimate_resources(cf)
+
+    return report
+
+
+def format_duration(
+        seconds:    float,
+        ) ->        str:
+
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    elif seconds < 3600:
+        return f"{seconds/60:.1f} min"
+    else:
+        return f"{seconds/3600:.1f} h"
+
+def print_validation_report(
+        report:     ValidationReport,
+        ) ->        None: # prints to screen
+
+    if not report.valid:
+        print(f"\n< {len(report.errors)} error{'s' if len(report.errors) > 1 else ''} found in control file{f' {report.cf_file}' if report.cf_file != None else ''} >")
+        for i, error in enumerate(report.errors):
+            print(f"\n{i+1}) {error}")
+        return
+
+    estimate = report.estimate
+    print(f"\n< Control file{f' {report.cf_file}' if report.cf_file != None else ''} is valid >\n")
+    print(f"loci analysed:               {estimate.n_loci}")
+    print(f"sites:                       {estimate.n_sites}")
+    print(f"sequences:                   {estimate.n_sequences}")
+    print("max sequences per population at a locus:")
+    for pop, count in estimate.seq_per_pop.items():
+        print(f"\t{pop}\t{count}")
+    print(f"\npredicted memory of bpp:     at most {estimate.bpp_memory/1e6:.1f} MB per bpp run")
+    print(f"mcmc generations per run:    {estimate.mcmc_generations}")
+    print(f"predicted time of bpp:       ~{format_duration(estimate.bpp_seconds)} per bpp run ({estimate.threads} thread{'s' if estimate.threads > 1 else ''}, order of magnitude)")
+    for mode, proposals in estimate.proposals.items():
+        print(f"{mode + ' analysis:':<29}one bpp run per iteration, assessing {proposals} populations in the first iteration, at most {estimate.max_iterations} iterations")
+    if estimate.simulations:
+        print(f"migration is specified:      gdi of each population estimated from {SIMULATIONS_PER_POPULATION} bpp gene tree simulations")
+
+
+## FINAL WRAPPER FUNCTIONS
+def validate_analyses(
+        jobs:   List[Dict],
+        ) ->    List[ValidationReport]:
+
+    '''
+    Validate each analysis (given as the path of a control file, and the parameter overrides), and print the reports.
+    '''
+
+    from .module_cmdline import resolve_cf_file
+
+    reports = []
+    for job in jobs:
+        try:
+            cf_file = resolve_cf_file(job['cf_path'])
+        except HhsdError as e:
+            reports.append(ValidationReport(Path(job['cf_path']), [e]))
+        else:
+            reports.append(validate_cf(cf_file, job['cf_override'], cf_file.parent))
+        print_validation_report(reports[-1])
+
+    if len(reports) > 1:
+        print(f"\n< {sum(report.valid for report in reports)} of {len(reports)} control files are valid >")
+
+    return reports
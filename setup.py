@@ -37,7 +37,6 @@ setup(
         'numpy>=1.20',
         'scipy>=1.10.1',
         'pandas>=1.5',
-        'Bio>=1.5',
     ],
     python_requires='>=3.9,<=3.14',
     entry_points={
@@ -0,0 +1,29 @@
+import copy
+
+from hhsd.module_ete3 import Tree
+
+
+def test_deepcopy_of_grafted_subtree_keeps_its_features():
+    tree = Tree("(A,B)AB;", format=1)
+    grafted = Tree("(C,D)CD;", format=1)
+    for node in list(tree.traverse()) + list(grafted.traverse()):
+        node.add_features(tau=f"tau_{node.name}")
+
+    tree.add_child(grafted)
+    copied = copy.deepcopy(tree)
+
+    assert [(node.name, node.tau) for node in copied.traverse()] == [(node.name, f"tau_{node.name}") for node in tree.traverse()]
+
+def test_deepcopy_of_subtree_is_detached():
+    tree = Tree("((A,B)AB,(C,D)CD)R;", format=1)
+    for node in tree.traverse():
+        node.add_features(tau=f"tau_{node.name}")
+
+    copied = copy.deepcopy(tree&"AB")
+
+    assert copied.up == None
+    assert [(node.name, node.tau) for node in copied.traverse()] == [("AB", "tau_AB"), ("A", "tau_A"), ("B", "tau_B")]
+
+    # features of the copy are independent of the original
+    (copied&"A").tau = 0
+    assert (tree&"A").tau == "tau_A"